@@ -0,0 +1,161 @@
+"""
+Admission control for the API proxy, so that no single client can use up all of the
+capacity of the ArangoDB server
+"""
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+class Overloaded(Exception):
+    """
+    Raised when a request can not be admitted right now
+
+    Args:
+        msg [str] : The reason the request was turned away
+        retry_after [float] : The number of seconds the client should wait
+    """
+    def __init__(self, msg, retry_after:float=1):
+        super().__init__(msg)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    """
+    A token bucket that refills at rate tokens per second, up to burst tokens
+
+    Args:
+        rate [float] : The number of tokens added per second
+        burst [float] : The maximum number of tokens the bucket can hold
+    """
+    def __init__(self, rate:float, burst:float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now:float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+
+    def take(self, tokens:float=1) -> float:
+        """
+        Take tokens from the bucket. Returns 0 if they were taken, otherwise the
+        number of seconds until enough tokens will be available.
+        """
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens)/self.rate
+
+    @property
+    def idle(self) -> bool:
+        """
+        True if the bucket would be full by now, so forgetting it changes nothing
+        """
+        return self.tokens + (time.monotonic() - self.updated)*self.rate >= self.burst
+
+class RateLimiter:
+    """
+    A token bucket per client
+
+    Args:
+        rate [float] : The sustained number of requests per second for each client,
+                       0 turns the limit off
+        burst [float] : The number of requests a client can make at once
+        max_clients [int] : The number of clients to remember, idle clients are
+                            forgotten first
+    """
+    def __init__(self, rate:float, burst:float, max_clients:int=10_000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self.rejected = 0
+
+    def check(self, client:str) -> None:
+        """
+        Count a request from client, raising Overloaded if it is over its limit
+        """
+        if self.rate <= 0:
+            return
+
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[client] = bucket
+            self._prune()
+        else:
+            self._buckets.move_to_end(client)
+
+        wait = bucket.take()
+        if wait > 0:
+            self.rejected += 1
+            raise Overloaded(
+                f"Too many requests, the limit is {self.rate:g} per second",
+                retry_after=wait
+            )
+
+    def _prune(self) -> None:
+        if len(self._buckets) <= self.max_clients:
+            return
+        for client in [c for c, b in self._buckets.items() if b.idle]:
+            del self._buckets[client]
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+class ConcurrencyLimiter:
+    """
+    Limit the number of calls running at once, with a bounded queue of waiting calls
+
+    Args:
+        max_concurrent [int] : The number of calls that can run at once, 0 turns the
+                               limit off
+        max_queue [int] : The number of calls that can wait for a free slot
+        queue_timeout [float] : The number of seconds a call waits before giving up
+    """
+    def __init__(self, max_concurrent:int, max_queue:int, queue_timeout:float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max(max_concurrent, 1))
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one of the slots for the duration of the with block, raising Overloaded
+        if the queue is full or no slot frees up in time
+        """
+        if self.max_concurrent <= 0:
+            yield
+            return
+
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(
+                "The database is busy, too many requests are waiting",
+                retry_after=self.queue_timeout
+            )
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(
+                "The database is busy, timed out waiting for a free slot",
+                retry_after=self.queue_timeout
+            )
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
@@ -0,0 +1,341 @@
+"""
+Some light weight helpers for inspecting AQL queries before they are sent to
+ArangoDB. These do not fully parse AQL, they only need to be good enough to err on
+the side of caution.
+"""
+import re
+from typing import Optional
+
+# keywords that make a query modify the database
+WRITE_KEYWORDS = {"INSERT", "UPDATE", "REPLACE", "REMOVE", "UPSERT"}
+
+# functions whose result can change between two identical queries, or that read
+# collections we can not see from the query text
+UNCACHEABLE_FUNCTIONS = {
+    "RAND", "RANDOM_TOKEN", "UUID", "DATE_NOW", "CURRENT_USER", "CURRENT_DATABASE",
+    "COLLECTION_COUNT", "LENGTH_COLLECTION", "DOCUMENT", "CALL", "APPLY", "FAIL",
+    "SLEEP", "ASSERT", "WARN", "V8"
+}
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_FOR_IN = re.compile(
+    r"\bFOR\s+[A-Za-z_][A-Za-z0-9_]*(?:\s*,\s*[A-Za-z_][A-Za-z0-9_]*)*\s+IN\s+",
+    re.IGNORECASE
+)
+_TRAVERSAL = re.compile(
+    r"\bIN\s+(?:\d+(?:\s*\.\.\s*\d+)?\s+)?(?:OUTBOUND|INBOUND|ANY)\b"
+    r"|\b(?:K_SHORTEST_PATHS|K_PATHS|SHORTEST_PATH|ALL_SHORTEST_PATHS)\b",
+    re.IGNORECASE
+)
+_WRITE = re.compile(
+    r"\b(?:" + "|".join(sorted(WRITE_KEYWORDS)) + r")\b", re.IGNORECASE
+)
+_IN_OR_INTO = re.compile(r"\b(?:IN|INTO)\s+", re.IGNORECASE)
+_FUNCTION_CALL = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_TOP_LEVEL_TOKEN = re.compile(r"[()\[\]{}]|\b(?:FOR|LIMIT|RETURN)\b", re.IGNORECASE)
+
+def _scan(query:str) -> list[tuple[str, str]]:
+    """
+    Split an AQL query into ("code", text) and ("string", text) segments, dropping
+    comments. Backtick and forward tick quoted names are returned as code with the
+    quotes removed since they are just escaped identifiers.
+
+    Args:
+        query [str] : The AQL query string
+    """
+    segments = []
+    code = []
+    i = 0
+    n = len(query)
+    while i < n:
+        c = query[i]
+        if c == "/" and query.startswith("//", i):
+            end = query.find("\n", i)
+            i = n if end == -1 else end
+            code.append(" ")
+        elif c == "/" and query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            code.append(" ")
+        elif c in ("'", '"'):
+            j = i + 1
+            while j < n and query[j] != c:
+                j += 2 if query[j] == "\\" else 1
+            if code:
+                segments.append(("code", "".join(code)))
+                code = []
+            segments.append(("string", query[i:j+1]))
+            i = j + 1
+        elif c in ("`", "´"):
+            end = query.find(c, i + 1)
+            end = n if end == -1 else end
+            code.append(query[i+1:end])
+            i = end + 1
+        else:
+            code.append(c)
+            i += 1
+
+    if code:
+        segments.append(("code", "".join(code)))
+    return segments
+
+def strip_literals(query:str) -> str:
+    """
+    The AQL query with comments removed and every string literal replaced by an
+    empty string, so keywords can be searched for safely.
+
+    Args:
+        query [str] : The AQL query string
+    """
+    return "".join(
+        text if kind == "code" else '""'
+        for kind, text in _scan(query)
+    )
+
+def normalize_query(query:str) -> str:
+    """
+    Normalize an AQL query so that queries differing only in whitespace or comments
+    give the same string. String literals are kept as is.
+
+    Args:
+        query [str] : The AQL query string
+    """
+    parts = []
+    for kind, text in _scan(query):
+        if kind == "code":
+            parts.append(re.sub(r"\s+", " ", text))
+        else:
+            parts.append(text)
+    return "".join(parts).strip()
+
+def is_read_only(query:str) -> bool:
+    """
+    True if the query does not write to the database
+
+    Args:
+        query [str] : The AQL query string
+    """
+    words = {w.upper() for w in _IDENTIFIER.findall(strip_literals(query))}
+    return not (words & WRITE_KEYWORDS)
+
+def is_cacheable(query:str) -> bool:
+    """
+    True if the query is read only and will give the same result if it is run twice
+    against unchanged data.
+
+    Args:
+        query [str] : The AQL query string
+    """
+    if not is_read_only(query):
+        return False
+
+    called = {f.upper() for f in _FUNCTION_CALL.findall(strip_literals(query))}
+    return not (called & UNCACHEABLE_FUNCTIONS)
+
+def collections_read(query:str, bind_vars:dict=None) -> Optional[set[str]]:
+    """
+    The names of the collections a query reads from. Any bare name after FOR ... IN
+    is counted, so this may include some variable names as well, which is harmless
+    for cache invalidation. Returns None if the collections can not be worked out,
+    e.g. for graph traversals.
+
+    Args:
+        query [str] : The AQL query string
+        bind_vars [dict] : The bind variables sent with the query
+    """
+    bind_vars = bind_vars or {}
+    code = strip_literals(query)
+    if _TRAVERSAL.search(code):
+        return None
+
+    collections = set()
+    for match in _FOR_IN.finditer(code):
+        rest = code[match.end():].lstrip()
+        if rest.startswith("@@"):
+            name = _IDENTIFIER.match(rest[2:])
+            if name is None or f"@{name.group()}" not in bind_vars:
+                return None
+            collections.add(str(bind_vars[f"@{name.group()}"]))
+            continue
+
+        name = _IDENTIFIER.match(rest)
+        if name is None:
+            continue # a list literal or subquery, which are scanned on their own
+
+        after = rest[name.end():].lstrip()
+        if after.startswith((".", "[", "(")):
+            continue # an attribute of a variable or a function call
+        collections.add(name.group())
+
+    return collections
+
+def collections_written(query:str, bind_vars:dict=None) -> Optional[set[str]]:
+    """
+    The names of the collections a query writes to. Every bare name after an IN or
+    INTO that comes after the first write keyword is counted, so this may include
+    some collections that are only read as well, which is harmless for cache
+    invalidation. Returns None if the collections can not be worked out, e.g. a
+    collection bind parameter that was not sent.
+
+    Args:
+        query [str] : The AQL query string
+        bind_vars [dict] : The bind variables sent with the query
+    """
+    bind_vars = bind_vars or {}
+    code = strip_literals(query)
+    first = _WRITE.search(code)
+    if first is None:
+        return set()
+
+    collections = set()
+    for match in _IN_OR_INTO.finditer(code, first.end()):
+        rest = code[match.end():].lstrip()
+        if rest.startswith("@@"):
+            name = _IDENTIFIER.match(rest[2:])
+            if name is None or f"@{name.group()}" not in bind_vars:
+                return None
+            collections.add(str(bind_vars[f"@{name.group()}"]))
+            continue
+
+        name = _IDENTIFIER.match(rest)
+        if name is not None:
+            collections.add(name.group())
+    return collections
+
+class QueryRejected(Exception):
+    """
+    Raised when a query is estimated to be too expensive to run
+    """
+
+def _mask(query:str) -> str:
+    """
+    The query with every comment, string literal and quoted name blanked out but
+    with everything else left where it was, so positions in the result are also
+    positions in the query
+
+    Args:
+        query [str] : The AQL query string
+    """
+    masked = list(query)
+    i = 0
+    n = len(query)
+    while i < n:
+        c = query[i]
+        if c == "/" and query.startswith("//", i):
+            end = query.find("\n", i)
+            end = n if end == -1 else end
+        elif c == "/" and query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            end = n if end == -1 else end + 2
+        elif c in ("'", '"'):
+            end = i + 1
+            while end < n and query[end] != c:
+                end += 2 if query[end] == "\\" else 1
+            end += 1
+        elif c in ("`", "´"):
+            end = query.find(c, i + 1)
+            end = n if end == -1 else end + 1
+        else:
+            i += 1
+            continue
+
+        end = min(end, n)
+        masked[i:end] = "_"*(end - i) if c in ("`", "´") else " "*(end - i)
+        i = end
+    return "".join(masked)
+
+def add_limit(query:str, limit:int) -> str:
+    """
+    Add a LIMIT before the final RETURN of a query that loops over something at the
+    top level and has no LIMIT of its own there, so an interactive query can not
+    return a whole collection by accident. Anything else is returned unchanged.
+
+    Args:
+        query [str] : The AQL query string
+        limit [int] : The maximum number of results
+    """
+    masked = _mask(query)
+    depth = 0
+    top_level = []
+    for match in _TOP_LEVEL_TOKEN.finditer(masked):
+        token = match.group()
+        if token in "([{":
+            depth += 1
+        elif token in ")]}":
+            depth -= 1
+        elif depth == 0 and masked[:match.start()].rstrip()[-1:] != ".":
+            top_level.append((token.upper(), match.start()))
+
+    keywords = [keyword for keyword, _ in top_level]
+    if "FOR" not in keywords or "LIMIT" in keywords or keywords[-1] != "RETURN":
+        return query
+
+    position = top_level[-1][1]
+    return f"{query[:position]}LIMIT {int(limit)}\n{query[position:]}"
+
+def check_plan(plan:dict, max_cost:float=0, max_items:float=0) -> Optional[str]:
+    """
+    Check the plan ArangoDB gave for a query (the "plan" of /_api/explain) against
+    the limits, returning why the query should not be run or None if it is fine
+
+    Args:
+        plan [dict] : The execution plan of the query
+        max_cost [float] : The highest estimated cost allowed, 0 for no limit
+        max_items [float] : The most results the query can be estimated to return,
+                            0 for no limit
+    """
+    cost = plan.get("estimatedCost") or 0
+    items = plan.get("estimatedNrItems") or 0
+    if max_cost and cost > max_cost:
+        return (
+            f"The query is estimated to cost {cost:.3g}, over the limit of "
+            f"{max_cost:.3g}. This usually means a full scan of a large collection or "
+            "nested loops over collections, try adding FILTERs or a LIMIT."
+        )
+    if max_items and items > max_items:
+        return (
+            f"The query is estimated to return {int(items):,} results, over the limit "
+            f"of {int(max_items):,}. Try adding FILTERs or a LIMIT."
+        )
+    return None
+
+def _limit(value, name:str) -> float:
+    """
+    A limit sent by the client, or 0 if it was not set. Raises ValueError if it is
+    not a number.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number, not {value!r}")
+    return value
+
+def with_limits(payload:dict, max_runtime:float=0, memory_limit:int=0) -> dict:
+    """
+    A copy of the body of a cursor request with ArangoDB's own limits on the run
+    time and memory use of the query added, keeping any stricter ones already set.
+    Raises ValueError if the limits already set are not numbers.
+
+    Args:
+        payload [dict] : The body of the /_api/cursor request
+        max_runtime [float] : The maximum seconds the query can run for, 0 for none
+        memory_limit [int] : The maximum bytes of memory the query can use, 0 for none
+    """
+    payload = dict(payload)
+    options = payload.get("options") or {}
+    if not isinstance(options, dict):
+        raise ValueError(f"options must be an object, not {options!r}")
+    current_runtime = _limit(options.get("maxRuntime"), "options.maxRuntime")
+    current_memory = _limit(payload.get("memoryLimit"), "memoryLimit")
+
+    if max_runtime:
+        options = dict(options)
+        options["maxRuntime"] = (
+            min(current_runtime, max_runtime) if current_runtime > 0 else max_runtime
+        )
+        payload["options"] = options
+    if memory_limit:
+        payload["memoryLimit"] = (
+            min(current_memory, memory_limit) if current_memory > 0 else memory_limit
+        )
+    return payload
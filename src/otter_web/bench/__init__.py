@@ -0,0 +1,3 @@
+"""
+Tools for benchmarking the app without a live ArangoDB server
+"""
@@ -0,0 +1,637 @@
+"""
+An in memory stand in for the parts of the ArangoDB HTTP API that the app, pyArango
+and the otter client use, so the proxy and the pages can be benchmarked on a machine
+with no database and no network.
+
+It does not run AQL. A read only query returns the documents of the collection its
+first FOR loop reads from, cut down by a LIMIT at the end of the query if there is
+one, so result sizes and batching are realistic even though FILTERs are ignored.
+The one exception is a FILTER on _key IN a bind variable, which is how the pages
+fetch transients by key. Explaining a query estimates it as a full scan of that
+collection.
+
+Run it with e.g.
+
+    python -m otter_web.bench.fake_arango --synthetic 10000 --latency 0.005
+
+and point the app at it with ARANGO_URL=http://localhost:8529
+"""
+import os
+import re
+import math
+import glob
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import itertools
+from typing import Iterable, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from ..aql import strip_literals, is_read_only
+
+DEFAULT_DB = "otter"
+DEFAULT_COLLECTIONS = ("transients", "vetting")
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CURSOR_TTL = 30
+
+_FIRST_FOR = re.compile(
+    r"\bFOR\s+[A-Za-z_][A-Za-z0-9_]*\s+IN\s+(@@[A-Za-z0-9_]+|[A-Za-z_][A-Za-z0-9_]*)",
+    re.IGNORECASE
+)
+_LIMIT = re.compile(
+    r"\bLIMIT\s+(\d+|@[A-Za-z0-9_]+)(?:\s*,\s*(\d+|@[A-Za-z0-9_]+))?",
+    re.IGNORECASE
+)
+_KEY_IN = re.compile(
+    r"\bFILTER\s+[A-Za-z_][A-Za-z0-9_]*\._key\s+IN\s+@([A-Za-z0-9_]+)",
+    re.IGNORECASE
+)
+
+def _error(status_code:int, error_num:int, message:str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "error": True,
+            "code": status_code,
+            "errorNum": error_num,
+            "errorMessage": message
+        }
+    )
+
+def make_jwt(username:str, lifetime:float=3600) -> str:
+    """
+    An unsigned JWT for username that expires lifetime seconds from now. Nothing
+    checks the signature so there is no point in making one.
+    """
+    def encode(data:dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    header = encode({"alg": "HS256", "typ": "JWT"})
+    payload = encode({
+        "preferred_username": username,
+        "iss": "arangodb",
+        "iat": int(time.time()),
+        "exp": int(time.time() + lifetime)
+    })
+    return f"{header}.{payload}.fake"
+
+def synthetic_transients(n:int, seed:int=0) -> Iterable[dict]:
+    """
+    Generate n transients in the shape of the OTTER schema, with random positions
+    over the whole sky and a mix of redshifts, classifications and photometry
+
+    Args:
+        n [int] : The number of transients to generate
+        seed [int] : The seed of the random number generator
+    """
+    rng = random.Random(seed)
+    classes = ["TDE", "SN Ia", "SN II", "SLSN-I", "LBOT", "AGN"]
+    obs_types = {"uvoir": "mag(AB)", "radio": "mJy", "xray": "ct"}
+
+    for i in range(n):
+        ra = rng.uniform(0, 360)
+        dec = math.degrees(math.asin(rng.uniform(-1, 1)))
+        ref = f"20{rng.randint(10, 25)}FAKE.{i:07d}"
+        name = f"FAKE {i:07d}"
+
+        doc = {
+            "_key": f"fake{i:07d}",
+            "name": {
+                "default_name": name,
+                "alias": [
+                    {"value": name, "reference": [ref]},
+                    {
+                        "value": f"AT20{rng.randint(10, 25)}{_letters(rng, 3)}",
+                        "reference": [ref]
+                    }
+                ]
+            },
+            "coordinate": [
+                {
+                    "ra": ra,
+                    "dec": dec,
+                    "ra_units": "deg",
+                    "dec_units": "deg",
+                    "reference": [ref],
+                    "coordinate_type": "equatorial",
+                    "default": True
+                }
+            ],
+            "reference_alias": [
+                {"name": ref, "human_readable_name": f"Fake, A. et al. ({ref[:4]})"}
+            ],
+            "date_reference": [
+                {
+                    "value": rng.uniform(55000, 60500),
+                    "date_format": "mjd",
+                    "date_type": "discovery",
+                    "reference": [ref]
+                }
+            ],
+            "schema_version": {"value": "0", "comment": "Synthetic"},
+            "_ra": ra,
+            "_dec": dec
+        }
+
+        if rng.random() < 0.7:
+            doc["distance"] = [
+                {
+                    "value": round(rng.uniform(0.001, 2), 4),
+                    "reference": [ref],
+                    "computed": False,
+                    "distance_type": "redshift"
+                }
+            ]
+
+        if rng.random() < 0.8:
+            doc["classification"] = {
+                "spec_classed": rng.randint(0, 2),
+                "unambiguous": rng.random() < 0.8,
+                "value": [
+                    {
+                        "object_class": rng.choice(classes),
+                        "confidence": rng.choice([0.5, 1]),
+                        "reference": [ref],
+                        "default": True
+                    }
+                ]
+            }
+
+        if rng.random() < 0.5:
+            obs_type = rng.choice(list(obs_types))
+            npoints = rng.randint(1, 50)
+            start = doc["date_reference"][0]["value"]
+            doc["photometry"] = [
+                {
+                    "reference": [ref],
+                    "raw": [rng.uniform(15, 22) for _ in range(npoints)],
+                    "raw_err": [rng.uniform(0.01, 0.3) for _ in range(npoints)],
+                    "raw_units": obs_types[obs_type],
+                    "filter_key": "r",
+                    "obs_type": obs_type,
+                    "date": [start + rng.uniform(0, 300) for _ in range(npoints)],
+                    "date_format": "mjd",
+                    "upperlimit": [rng.random() < 0.1 for _ in range(npoints)]
+                }
+            ]
+
+        yield doc
+
+def _letters(rng:random.Random, n:int) -> str:
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(n))
+
+def fixture_transients(path:str=".otter") -> list[dict]:
+    """
+    Load the transients in the *.json files of a directory, e.g. the .otter test
+    fixtures at the root of the repo, adding the _ra and _dec the database would have
+
+    Args:
+        path [str] : The directory to read
+    """
+    from astropy.coordinates import SkyCoord
+
+    docs = []
+    for filename in sorted(glob.glob(os.path.join(path, "*.json"))):
+        with open(filename) as f:
+            doc = json.load(f)
+
+        coords = [c for c in doc.get("coordinate", []) if "ra" in c and "dec" in c]
+        if coords:
+            c = coords[0]
+            skycoord = SkyCoord(
+                c["ra"],
+                c["dec"],
+                unit=(c.get("ra_units", "deg"), c.get("dec_units", "deg"))
+            )
+            doc["_ra"], doc["_dec"] = skycoord.ra.deg, skycoord.dec.deg
+
+        doc.setdefault("_key", os.path.splitext(os.path.basename(filename))[0])
+        docs.append(doc)
+    return docs
+
+class FakeArango:
+    """
+    The state of the stand in: collections of documents and open cursors
+
+    Args:
+        db [str] : The name of the only database
+        latency [float] : Seconds to wait before answering every request
+        jitter [float] : Up to this many more seconds are added at random
+        collections [Iterable[str]] : The collections that exist to begin with
+    """
+
+    def __init__(
+            self,
+            db:str=DEFAULT_DB,
+            latency:float=0,
+            jitter:float=0,
+            collections:Iterable[str]=DEFAULT_COLLECTIONS
+    ):
+        self.db = db
+        self.latency = latency
+        self.jitter = jitter
+        self.collections = {name: {} for name in collections}
+        self.cursors = {}
+        self._ids = itertools.count(1)
+        self._revs = itertools.count(1)
+        self.requests = 0
+
+    def insert(self, collection:str, doc:dict, overwrite:bool=False) -> dict:
+        """
+        Add a document to a collection, giving it a _key if it does not have one.
+        Raises KeyError if the _key is taken and overwrite is False.
+        """
+        docs = self.collections.setdefault(collection, {})
+        doc = dict(doc)
+        key = str(doc.get("_key") or next(self._ids))
+        if key in docs and not overwrite:
+            raise KeyError(key)
+
+        doc["_key"] = key
+        doc["_id"] = f"{collection}/{key}"
+        doc["_rev"] = f"_{next(self._revs)}"
+        docs[key] = doc
+        return {"_id": doc["_id"], "_key": key, "_rev": doc["_rev"]}
+
+    def seed(self, docs:Iterable[dict], collection:str="transients") -> int:
+        """
+        Add documents to a collection, returning how many were added
+        """
+        n = 0
+        for doc in docs:
+            self.insert(collection, doc, overwrite=True)
+            n += 1
+        return n
+
+    def run_query(self, query:str, bind_vars:dict=None) -> list:
+        """
+        The result of a read only AQL query, see the module docstring for how little
+        of AQL this understands
+        """
+        bind_vars = bind_vars or {}
+        code = strip_literals(query)
+
+        match = _FIRST_FOR.search(code)
+        if match is None:
+            return []
+        name = match.group(1)
+        if name.startswith("@@"):
+            name = bind_vars.get(name[1:], "")
+        if name not in self.collections:
+            raise LookupError(name)
+        docs = list(self.collections[name].values())
+
+        key_in = _KEY_IN.search(code)
+        if key_in is not None:
+            keys = {str(key) for key in bind_vars.get(key_in.group(1)) or []}
+            docs = [doc for doc in docs if doc["_key"] in keys]
+
+        limits = list(_LIMIT.finditer(code))
+        if limits:
+            values = [
+                int(bind_vars.get(v[1:], 0)) if v.startswith("@") else int(v)
+                for v in limits[-1].groups() if v is not None
+            ]
+            offset, count = (0, values[0]) if len(values) == 1 else values
+            docs = docs[offset:offset + count]
+        return docs
+
+    def explain(self, query:str, bind_vars:dict=None) -> dict:
+        """
+        A plan for the query in the shape of the one from /_api/explain, costed as a
+        scan of the collection it reads, which stops early if there is a LIMIT, plus
+        one unit per result
+        """
+        results = self.run_query(query, bind_vars)
+        code = strip_literals(query)
+        match = _FIRST_FOR.search(code)
+        name = match.group(1) if match else None
+        if name is not None and name.startswith("@@"):
+            name = (bind_vars or {}).get(name[1:], "")
+        scanned = len(self.collections.get(name, {}))
+        if _LIMIT.search(code):
+            scanned = len(results)
+        return {
+            "nodes": [],
+            "rules": [],
+            "collections": [] if name is None else [{"name": name, "type": "read"}],
+            "variables": [],
+            "estimatedCost": float(scanned + len(results) + 1),
+            "estimatedNrItems": len(results),
+            "isModificationQuery": False
+        }
+
+    def open_cursor(self, results:list, batch_size:int, ttl:float, count:bool) -> dict:
+        """
+        The first batch of results, keeping the rest in a cursor if there is more
+        """
+        body = {"result": results[:batch_size], "hasMore": len(results) > batch_size}
+        if count:
+            body["count"] = len(results)
+        if body["hasMore"]:
+            cursor_id = str(next(self._ids))
+            self.cursors[cursor_id] = {
+                "rest": results[batch_size:],
+                "batch_size": batch_size,
+                "ttl": ttl,
+                "expires": time.monotonic() + ttl,
+                "count": len(results) if count else None
+            }
+            body["id"] = cursor_id
+        return body
+
+    def next_batch(self, cursor_id:str) -> Optional[dict]:
+        """
+        The next batch of an open cursor, or None if it does not exist or expired
+        """
+        self._expire_cursors()
+        cursor = self.cursors.get(cursor_id)
+        if cursor is None:
+            return None
+
+        batch = cursor["rest"][:cursor["batch_size"]]
+        cursor["rest"] = cursor["rest"][cursor["batch_size"]:]
+        cursor["expires"] = time.monotonic() + cursor["ttl"]
+
+        body = {"result": batch, "hasMore": bool(cursor["rest"]), "id": cursor_id}
+        if cursor["count"] is not None:
+            body["count"] = cursor["count"]
+        if not cursor["rest"]:
+            del self.cursors[cursor_id]
+        return body
+
+    def _expire_cursors(self) -> None:
+        now = time.monotonic()
+        expired = [c for c, cursor in self.cursors.items() if cursor["expires"] < now]
+        for cursor_id in expired:
+            del self.cursors[cursor_id]
+
+    async def delay(self) -> None:
+        """
+        Wait the injected latency
+        """
+        self.requests += 1
+        wait = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+def create_app(fake:FakeArango=None) -> FastAPI:
+    """
+    A FastAPI app that answers like ArangoDB, backed by fake
+
+    Args:
+        fake [FakeArango] : The state to serve, default is an empty one
+    """
+    fake = fake if fake is not None else FakeArango()
+    app = FastAPI(title="Fake ArangoDB")
+    app.state.fake = fake
+
+    @app.middleware("http")
+    async def inject_latency(request:Request, call_next):
+        await fake.delay()
+        return await call_next(request)
+
+    def check_db(db:str) -> Optional[JSONResponse]:
+        if db != fake.db:
+            return _error(404, 1228, "database not found")
+        return None
+
+    @app.get("/_api/version")
+    async def version():
+        return {"server": "arango", "version": "3.11.0-fake", "license": "community"}
+
+    @app.get("/_api/user/{user}/database")
+    @app.get("/_api/database/user")
+    async def databases(user:str=None):
+        return {"error": False, "code": 200, "result": [fake.db]}
+
+    @app.post("/_open/auth")
+    async def auth(request:Request):
+        try:
+            payload = await request.json()
+            username = payload["username"]
+        except Exception:
+            return _error(400, 400, "bad parameter")
+        return {"jwt": make_jwt(username)}
+
+    @app.get("/_db/{db}/_api/collection")
+    async def list_collections(db:str):
+        if (error := check_db(db)) is not None:
+            return error
+        return {
+            "error": False,
+            "code": 200,
+            "result": [
+                {"id": str(i), "name": name, "isSystem": False, "status": 3, "type": 2}
+                for i, name in enumerate(fake.collections, start=1)
+            ]
+        }
+
+    @app.get("/_db/{db}/_api/gharial")
+    async def list_graphs(db:str):
+        if (error := check_db(db)) is not None:
+            return error
+        return {"error": False, "code": 200, "graphs": []}
+
+    @app.get("/_db/{db}/_api/foxx")
+    async def list_services(db:str):
+        if (error := check_db(db)) is not None:
+            return error
+        return []
+
+    @app.put("/_db/{db}/_api/collection/{collection}/truncate")
+    async def truncate(db:str, collection:str):
+        if (error := check_db(db)) is not None:
+            return error
+        if collection not in fake.collections:
+            return _error(404, 1203, "collection or view not found")
+        fake.collections[collection].clear()
+        return {"error": False, "code": 200, "name": collection, "type": 2, "status": 3}
+
+    @app.post("/_db/{db}/_api/cursor")
+    async def create_cursor(db:str, request:Request):
+        if (error := check_db(db)) is not None:
+            return error
+        try:
+            payload = await request.json()
+            query = payload["query"]
+        except Exception:
+            return _error(400, 600, "query is empty or not valid JSON")
+
+        if not is_read_only(query):
+            return _error(501, 9, "the fake ArangoDB only runs read only queries")
+        try:
+            results = fake.run_query(query, payload.get("bindVars"))
+        except LookupError as e:
+            return _error(404, 1203, f"collection or view not found: {e}")
+
+        body = fake.open_cursor(
+            results,
+            batch_size=int(payload.get("batchSize") or DEFAULT_BATCH_SIZE),
+            ttl=float(payload.get("ttl") or DEFAULT_CURSOR_TTL),
+            count=bool(payload.get("count"))
+        )
+        return JSONResponse(
+            status_code=201,
+            content=body | {"error": False, "code": 201, "cached": False}
+        )
+
+    @app.post("/_db/{db}/_api/explain")
+    async def explain(db:str, request:Request):
+        if (error := check_db(db)) is not None:
+            return error
+        try:
+            payload = await request.json()
+            query = payload["query"]
+        except Exception:
+            return _error(400, 600, "query is empty or not valid JSON")
+
+        if not is_read_only(query):
+            return _error(501, 9, "the fake ArangoDB only explains read only queries")
+        try:
+            plan = fake.explain(query, payload.get("bindVars"))
+        except LookupError as e:
+            return _error(404, 1203, f"collection or view not found: {e}")
+        return {
+            "plan": plan,
+            "cacheable": True,
+            "warnings": [],
+            "stats": {"plansCreated": 1},
+            "error": False,
+            "code": 200
+        }
+
+    @app.put("/_db/{db}/_api/cursor/{cursor_id}")
+    @app.post("/_db/{db}/_api/cursor/{cursor_id}")
+    async def next_batch(db:str, cursor_id:str):
+        if (error := check_db(db)) is not None:
+            return error
+        body = fake.next_batch(cursor_id)
+        if body is None:
+            return _error(404, 1600, "cursor not found")
+        return body | {"error": False, "code": 200}
+
+    @app.delete("/_db/{db}/_api/cursor/{cursor_id}")
+    async def delete_cursor(db:str, cursor_id:str):
+        if fake.cursors.pop(cursor_id, None) is None:
+            return _error(404, 1600, "cursor not found")
+        return JSONResponse(
+            status_code=202,
+            content={"error": False, "code": 202, "id": cursor_id}
+        )
+
+    @app.post("/_db/{db}/_api/document/{collection}")
+    async def insert_documents(db:str, collection:str, request:Request):
+        if (error := check_db(db)) is not None:
+            return error
+        if collection not in fake.collections:
+            return _error(404, 1203, "collection or view not found")
+        try:
+            payload = await request.json()
+        except Exception:
+            return _error(400, 600, "invalid JSON")
+        overwrite = request.query_params.get("overwrite", "false") == "true"
+
+        def insert_one(doc):
+            try:
+                return fake.insert(collection, doc, overwrite=overwrite)
+            except KeyError:
+                return {
+                    "error": True,
+                    "errorNum": 1210,
+                    "errorMessage": "unique constraint violated - in index primary"
+                }
+
+        if isinstance(payload, list):
+            return JSONResponse(
+                status_code=202,
+                content=[insert_one(doc) for doc in payload]
+            )
+
+        result = insert_one(payload)
+        if result.get("error"):
+            return _error(409, result["errorNum"], result["errorMessage"])
+        return JSONResponse(status_code=202, content=result)
+
+    @app.get("/_db/{db}/_api/document/{collection}/{key}")
+    async def get_document(db:str, collection:str, key:str):
+        if (error := check_db(db)) is not None:
+            return error
+        doc = fake.collections.get(collection, {}).get(key)
+        if doc is None:
+            return _error(404, 1202, "document not found")
+        return doc
+
+    @app.patch("/_db/{db}/_api/document/{collection}/{key}")
+    async def update_document(db:str, collection:str, key:str, request:Request):
+        if (error := check_db(db)) is not None:
+            return error
+        doc = fake.collections.get(collection, {}).get(key)
+        if doc is None:
+            return _error(404, 1202, "document not found")
+        patch = {
+            k: v for k, v in (await request.json()).items() if not k.startswith("_")
+        }
+        result = fake.insert(collection, doc | patch, overwrite=True)
+        return JSONResponse(status_code=202, content=result)
+
+    @app.delete("/_db/{db}/_api/document/{collection}/{key}")
+    async def delete_document(db:str, collection:str, key:str):
+        if (error := check_db(db)) is not None:
+            return error
+        doc = fake.collections.get(collection, {}).pop(key, None)
+        if doc is None:
+            return _error(404, 1202, "document not found")
+        return JSONResponse(
+            status_code=202,
+            content={"_id": doc["_id"], "_key": key, "_rev": doc["_rev"]}
+        )
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8529)
+    parser.add_argument(
+        "--fixtures",
+        help="seed the transients collection from the *.json files in this directory",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="seed the transients collection with this many synthetic transients"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="seconds to wait before answering each request"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0,
+        help="up to this many more seconds are added to the latency at random"
+    )
+    args = parser.parse_args()
+
+    fake = FakeArango(latency=args.latency, jitter=args.jitter)
+    if args.fixtures:
+        fake.seed(fixture_transients(args.fixtures))
+    if args.synthetic:
+        fake.seed(synthetic_transients(args.synthetic, seed=args.seed))
+    print(f"Serving {len(fake.collections['transients'])} transients")
+
+    import uvicorn
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
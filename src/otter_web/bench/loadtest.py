@@ -0,0 +1,491 @@
+"""
+A load generator for the API proxy. It replays a mix of logins, cursor creates,
+cursor advances and document inserts at a fixed rate and reports the throughput,
+latency percentiles and memory used per request, so a change to the proxy can be
+checked against the commit before it under the same load.
+
+By default API_ROUTER is driven in process, with the in memory ArangoDB stand in
+served on localhost from another process behind it:
+
+    python -m otter_web.bench.loadtest --rps 50 --duration 30 --output before.json
+    python -m otter_web.bench.loadtest --rps 50 --duration 30 --compare before.json
+
+or a running app can be load tested over HTTP with --url http://localhost:8080, in
+which case only the latencies the client sees are reported.
+
+Requests are sent on a fixed schedule whether or not the earlier ones have come back
+(an open loop), and each latency is measured from when the request was due, so a
+slow proxy shows up as latency rather than as a lower request rate.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+import multiprocessing
+import subprocess
+from collections import defaultdict, deque
+from typing import Optional
+
+import httpx
+import numpy as np
+
+from .fake_arango import FakeArango, create_app, synthetic_transients
+
+OPERATIONS = ("auth", "cursor", "next", "insert")
+DEFAULT_MIX = "auth=1,cursor=4,next=4,insert=1"
+
+def parse_mix(mix:str) -> dict[str, float]:
+    """
+    Parse a mix like "auth=1,cursor=4" into the weight of each operation
+    """
+    weights = {}
+    for item in mix.split(","):
+        op, _, weight = item.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation {op}, use one of {OPERATIONS}")
+        weights[op] = float(weight or 1)
+    return weights
+
+def git_commit() -> Optional[str]:
+    """
+    The commit the code being tested is at, if it is in a git repo
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class LoadTest:
+    """
+    Send a mix of API calls at a target rate through client and record how each
+    one went
+
+    Args:
+        clients [list[httpx.AsyncClient]] : One client per user to spread the calls
+                                            over, their base_url is the app being
+                                            tested. Each user logs in with its own
+                                            credentials.
+        mix [dict] : The weight of each operation
+        rps [float] : The number of calls to start per second
+        duration [float] : The number of seconds to keep starting calls for
+        result_size [int] : The number of documents each cursor returns
+        batch_size [int] : The number of documents in each batch of a cursor
+        max_in_flight [int] : Calls due while this many are still running are
+                              dropped and counted instead of sent
+        db [str] : The database to query
+        seed [int] : The seed for choosing the operations
+    """
+
+    def __init__(
+            self,
+            clients:list[httpx.AsyncClient],
+            mix:dict,
+            rps:float,
+            duration:float,
+            result_size:int=100,
+            batch_size:int=25,
+            max_in_flight:int=1000,
+            db:str="otter",
+            seed:int=0
+    ):
+        self.clients = clients
+        self.mix = mix
+        self.rps = rps
+        self.duration = duration
+        self.result_size = result_size
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.db = db
+        self.rng = random.Random(seed)
+
+        self.tokens = {}
+        self.open_cursors = deque()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.dropped = 0
+
+    def _credentials(self, user:int) -> dict:
+        return {"username": f"bench-{user}", "password": f"bench-{user}"}
+
+    def _headers(self, user:int) -> dict:
+        token = self.tokens.get(user)
+        return {"authorization": f"bearer {token}"} if token else {}
+
+    async def login_all(self) -> None:
+        """
+        Log every user in once before the test starts
+        """
+        for user, client in enumerate(self.clients):
+            response = await client.post(
+                "/api/_open/auth",
+                json=self._credentials(user)
+            )
+            if response.status_code == 200:
+                self.tokens[user] = response.json().get("jwt")
+
+    async def _send(self, op:str, user:int) -> tuple[str, httpx.Response]:
+        client = self.clients[user]
+        headers = self._headers(user)
+
+        if op == "next" and not self.open_cursors:
+            # nothing to advance yet, open one instead
+            op = "cursor"
+
+        if op == "auth":
+            response = await client.post(
+                "/api/_open/auth",
+                json=self._credentials(user)
+            )
+        elif op == "cursor":
+            response = await client.post(
+                f"/api/_db/{self.db}/_api/cursor",
+                json={
+                    "query": "FOR t IN transients LIMIT @n RETURN t",
+                    "bindVars": {"n": self.result_size},
+                    "batchSize": self.batch_size
+                },
+                headers=headers
+            )
+        elif op == "next":
+            cursor_id, user = self.open_cursors.popleft()
+            response = await self.clients[user].put(
+                f"/api/_db/{self.db}/_api/cursor/{cursor_id}",
+                headers=self._headers(user)
+            )
+        else:
+            response = await client.post(
+                f"/api/_db/{self.db}/_api/document/vetting",
+                json={
+                    "name": {"default_name": f"bench {self.rng.random()}", "alias": []},
+                    "schema_version": {"comment": "Uploader:bench | Email:bench"}
+                },
+                headers=headers
+            )
+
+        if op in ("cursor", "next") and response.status_code in (200, 201):
+            body = response.json()
+            if body.get("hasMore") and body.get("id"):
+                self.open_cursors.append((body["id"], user))
+        return op, response
+
+    async def _one(self, op:str, user:int, due:float) -> None:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            op, response = await self._send(op, user)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            self.in_flight -= 1
+
+        self.latencies[op].append(time.perf_counter() - due)
+        self.statuses[op][str(status)] += 1
+
+    async def run(self) -> float:
+        """
+        Run the test, returning how many seconds it took until the last call came
+        back
+        """
+        ops = list(self.mix)
+        weights = [self.mix[op] for op in ops]
+        total = int(self.rps*self.duration)
+
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            due = start + i/self.rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if self.in_flight >= self.max_in_flight:
+                self.dropped += 1
+                continue
+
+            op = self.rng.choices(ops, weights)[0]
+            user = self.rng.randrange(len(self.clients))
+            tasks.append(asyncio.ensure_future(self._one(op, user, due)))
+
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+def _percentiles(latencies:list[float]) -> dict:
+    if not latencies:
+        return {}
+    ms = np.array(latencies)*1000
+    return {
+        "count": len(latencies),
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max())
+    }
+
+def build_report(test:LoadTest, elapsed:float, memory:dict, settings:dict) -> dict:
+    """
+    Summarise a finished test as a dict that can be saved as JSON and compared
+    """
+    every = [latency for latencies in test.latencies.values() for latency in latencies]
+    ok = sum(
+        n for statuses in test.statuses.values()
+        for status, n in statuses.items() if status.startswith("2")
+    )
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": settings,
+        "elapsed": elapsed,
+        "requests": len(every),
+        "ok": ok,
+        "dropped": test.dropped,
+        "throughput": ok/elapsed if elapsed else 0,
+        "latency_ms": {
+            "all": _percentiles(every),
+            **{
+                op: _percentiles(test.latencies[op])
+                for op in OPERATIONS if test.latencies[op]
+            }
+        },
+        "statuses": {op: dict(statuses) for op, statuses in test.statuses.items()},
+        "memory": memory
+    }
+
+def print_report(report:dict, baseline:dict=None) -> None:
+    """
+    Print a report, with the change from baseline if one is given
+    """
+    def delta(value, old):
+        if old in (None, 0) or value is None:
+            return ""
+        return f" ({100*(value - old)/old:+.1f}%)"
+
+    def old(*keys):
+        value = baseline
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+    header = f"commit {report['commit']}"
+    if baseline is not None:
+        header += f" vs {baseline.get('commit')}"
+    print(header)
+    print(
+        f"{report['requests']} requests in {report['elapsed']:.1f}s, "
+        f"{report['ok']} ok, {report['dropped']} dropped"
+    )
+    print(
+        f"throughput {report['throughput']:.1f} req/s"
+        + delta(report["throughput"], old("throughput"))
+    )
+
+    print(f"{'latency (ms)':<14}{'count':>8}{'p50':>18}{'p95':>18}{'p99':>18}")
+    for op, stats in report["latency_ms"].items():
+        line = f"{op:<14}{stats['count']:>8}"
+        for p in ("p50", "p95", "p99"):
+            cell = f"{stats[p]:.1f}" + delta(stats[p], old("latency_ms", op, p))
+            line += f"{cell:>18}"
+        print(line)
+
+    for op, statuses in report["statuses"].items():
+        counts = ", ".join(f"{s}={n}" for s, n in sorted(statuses.items()))
+        print(f"{op} statuses: {counts}")
+
+    memory = report["memory"]
+    if memory.get("per_request_bytes") is not None:
+        print(
+            f"memory {memory['per_request_bytes']/1024:.1f} KiB per request in flight"
+            + delta(memory["per_request_bytes"], old("memory", "per_request_bytes"))
+            + f", peak {memory['peak_bytes']/1024**2:.1f} MiB above baseline"
+        )
+
+def _serve_fake(port:int, transients:int, seed:int, latency:float, jitter:float):
+    import uvicorn
+
+    fake = FakeArango(latency=latency, jitter=jitter)
+    fake.seed(synthetic_transients(transients, seed=seed))
+    uvicorn.run(create_app(fake), host="127.0.0.1", port=port, log_level="warning")
+
+def start_fake(args) -> multiprocessing.Process:
+    """
+    Serve the stand in on localhost from its own process, so that its work does not
+    count towards the latency or memory of the app being tested
+    """
+    process = multiprocessing.Process(
+        target=_serve_fake,
+        args=(args.fake_port, args.transients, args.seed, args.latency, args.jitter),
+        daemon=True
+    )
+    process.start()
+
+    url = f"http://127.0.0.1:{args.fake_port}"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            httpx.get(f"{url}/_api/version", timeout=1)
+            return process
+        except httpx.TransportError:
+            if not process.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"Could not serve the fake ArangoDB on port {args.fake_port}"
+                )
+            time.sleep(0.1)
+
+async def _run(args, settings:dict) -> dict:
+    if args.url:
+        # every user comes from this machine, so the rate limit of the app has to
+        # allow for all of them
+        clients = [
+            httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        ]*args.clients
+    else:
+        # the app reads ARANGO_URL when it is imported, so this has to come first
+        os.environ["ARANGO_URL"] = f"http://127.0.0.1:{args.fake_port}"
+
+        from fastapi import FastAPI
+        from ..client.api import API_ROUTER
+
+        app = FastAPI()
+        app.include_router(API_ROUTER)
+        # each user gets its own address so the rate limiter tells them apart
+        clients = [
+            httpx.AsyncClient(
+                transport=httpx.ASGITransport(
+                    app,
+                    client=(f"10.0.{user // 256}.{user % 256}", 12345)
+                ),
+                base_url="http://loadtest",
+                timeout=args.timeout
+            )
+            for user in range(args.clients)
+        ]
+
+    test = LoadTest(
+        clients,
+        mix=parse_mix(args.mix),
+        rps=args.rps,
+        duration=args.duration,
+        result_size=args.result_size,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        seed=args.seed
+    )
+
+    try:
+        await test.login_all()
+
+        memory = {}
+        trace = not args.url and not args.no_memory
+        if trace:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+        elapsed = await test.run()
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            tracemalloc.stop()
+            memory = {
+                "peak_bytes": peak,
+                "peak_in_flight": test.peak_in_flight,
+                "per_request_bytes": peak/max(test.peak_in_flight, 1)
+            }
+    finally:
+        for client in set(clients):
+            await client.aclose()
+        if not args.url:
+            from ..upstream import close_client
+            await close_client()
+
+    return build_report(test, elapsed, memory, settings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rps",
+        type=float,
+        default=50,
+        help="calls started per second"
+    )
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run for")
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help=f"weights of the operations {OPERATIONS}, default {DEFAULT_MIX}"
+    )
+    parser.add_argument("--clients", type=int, default=50, help="number of users")
+    parser.add_argument(
+        "--result-size",
+        type=int,
+        default=100,
+        help="documents returned by each cursor"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=25,
+        help="documents per batch"
+    )
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--url",
+        help="load test a running app at this url instead of API_ROUTER in process"
+    )
+    parser.add_argument(
+        "--transients",
+        type=int,
+        default=10_000,
+        help="synthetic transients to seed the fake ArangoDB with"
+    )
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--jitter", type=float, default=0.001)
+    parser.add_argument("--fake-port", type=int, default=8599)
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="do not trace memory, which slows everything down a little"
+    )
+    parser.add_argument("--output", help="save the report as JSON to this file")
+    parser.add_argument("--compare", help="a report saved with --output to compare to")
+    args = parser.parse_args()
+
+    settings = {
+        key: value for key, value in vars(args).items()
+        if key not in ("output", "compare")
+    }
+    fake = None if args.url else start_fake(args)
+    try:
+        report = asyncio.run(_run(args, settings))
+    finally:
+        if fake is not None:
+            fake.terminate()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print("Warning: the baseline was run with different settings!")
+
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
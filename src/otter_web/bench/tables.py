@@ -0,0 +1,117 @@
+"""
+Time building the rows of the search results table from a list of transients, the
+batched way in otter_web.tables against the row by row way the search page used to
+do it, at a few result sizes:
+
+    python -m otter_web.bench.tables --sizes 1000 10000 100000
+
+The row by row builder is slow enough that it is only run on the first
+--legacy-sample transients and its time for the full size is extrapolated from
+that. The rows it gives for the sample are also checked against the batched ones.
+"""
+import time
+import argparse
+
+from otter import Transient
+from astropy.coordinates import SkyCoord
+
+from ..models import TransientRead
+from ..tables import transient_rows, NO_DATE
+from .fake_arango import synthetic_transients
+
+# the keys otter.Otter.get_meta keeps, which is all the search page gets
+META_KEYS = (
+    "name",
+    "coordinate",
+    "date_reference",
+    "distance",
+    "classification",
+    "reference_alias"
+)
+
+def legacy_rows(events:list[dict]) -> list[dict]:
+    """
+    The rows as the search page built them before otter_web.tables, one transient
+    at a time
+    """
+    rows = []
+    for i, event_json in enumerate(events):
+        event = TransientRead(**event_json)
+        try:
+            disc_date = Transient(event_json).get_discovery_date()
+        except (KeyError, TypeError):
+            disc_date = None
+
+        coord_string = SkyCoord(
+            event.coordinate[0].ra, event.coordinate[0].dec, unit=(
+                event.coordinate[0].ra_units,
+                event.coordinate[0].dec_units
+            )
+        ).to_string("hmsdms", sep=":", precision=2)
+
+        try:
+            default_class = Transient(event_json).get_classification()[0]
+        except Exception:
+            default_class = None
+        if default_class is None:
+            default_class = "Unknown Class"
+
+        rows.append(
+            {
+                "id": f"{i}",
+                "name": event.name.default_name,
+                "class": default_class,
+                "ra": coord_string.split(" ")[0],
+                "dec": coord_string.split(" ")[1],
+                "date": disc_date.datetime if disc_date is not None else NO_DATE,
+            }
+        )
+    return rows
+
+def _time(function, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument(
+        "--legacy-sample",
+        type=int,
+        default=1000,
+        help="the most transients to time the row by row builder on"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    events = [
+        {key: doc[key] for key in META_KEYS if key in doc}
+        for doc in synthetic_transients(max(args.sizes), seed=args.seed)
+    ]
+
+    print(f"{'rows':>8} {'batched':>10} {'row by row':>12} {'speed up':>9}")
+    for size in args.sizes:
+        batched, rows = _time(transient_rows, events[:size])
+
+        sample = min(size, args.legacy_sample)
+        legacy, legacy_rows_ = _time(legacy_rows, events[:sample])
+        legacy *= size/sample
+        estimated = "*" if sample < size else " "
+
+        if rows[:sample] != legacy_rows_:
+            mismatches = sum(a != b for a, b in zip(rows, legacy_rows_))
+            print(
+                f"Warning: {mismatches} of {sample} rows differ from the row by row "
+                "ones!"
+            )
+
+        print(
+            f"{size:>8} {batched:>9.3f}s {legacy:>10.3f}s{estimated} "
+            f"{legacy/batched:>8.1f}x"
+        )
+    if any(size > args.legacy_sample for size in args.sizes):
+        print(f"* extrapolated from the first {args.legacy_sample} transients")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+In memory caches for responses the API proxy has already fetched from ArangoDB
+"""
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, Iterable, Optional
+
+# the tag used for entries whose dependencies are not known, these are dropped on
+# every invalidation
+ANY_TAG = "*"
+
+@dataclass
+class CachedResponse:
+    content: bytes
+    status_code: int = 200
+    headers: dict = field(default_factory=dict)
+    tags: frozenset = frozenset()
+    expires: float = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+class ResponseCache:
+    """
+    A least recently used cache of response bodies with a time to live and a limit on
+    the total number of bytes held. Each entry can be tagged, e.g. with the
+    collections it was read from, so that it can be dropped when those change.
+
+    Args:
+        ttl [float] : The number of seconds an entry is valid for
+        max_bytes [int] : The maximum total size of the cached bodies
+        max_entry_bytes [int] : Bodies larger than this are never cached, default is
+                                a quarter of max_bytes
+    """
+
+    def __init__(self, ttl:float, max_bytes:int, max_entry_bytes:int=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = (
+            max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        )
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        # bumped on every invalidation so that responses fetched before a write
+        # finished are not cached after it
+        self.generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key:Hashable) -> Optional[CachedResponse]:
+        """
+        Get the entry for key, or None if it is missing or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(
+            self,
+            key:Hashable,
+            content:bytes,
+            status_code:int=200,
+            headers:dict=None,
+            tags:Optional[Iterable[str]]=None,
+            ttl:float=None,
+            generation:int=None
+    ) -> bool:
+        """
+        Add a response to the cache, evicting the least recently used entries to make
+        room. Returns False if the body was too big or is already out of date.
+
+        Args:
+            key [Hashable] : The key to store the response under
+            content [bytes] : The response body
+            status_code [int] : The response status code
+            headers [dict] : The response headers to send back with a cached hit
+            tags [Iterable[str]] : Tags for invalidation, None means the dependencies
+                                   are unknown and the entry is dropped on any
+                                   invalidation
+            ttl [float] : Overrides the time to live of the cache for this entry
+            generation [int] : The value of self.generation when the response was
+                               requested, it is not cached if there has been an
+                               invalidation since
+        """
+        if len(content) > self.max_entry_bytes:
+            return False
+
+        entry = CachedResponse(
+            content=content,
+            status_code=status_code,
+            headers=headers or {},
+            tags=frozenset(tags) if tags is not None else frozenset({ANY_TAG}),
+            expires=time.monotonic() + (ttl if ttl is not None else self.ttl)
+        )
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self.nbytes += entry.size
+            while self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return True
+
+    def invalidate(self, *tags:str) -> int:
+        """
+        Drop every entry tagged with any of tags, or with unknown dependencies.
+        Returns the number of entries dropped.
+        """
+        tags = set(tags) | {ANY_TAG}
+        with self._lock:
+            self.generation += 1
+            stale = [key for key, entry in self._entries.items() if entry.tags & tags]
+            for key in stale:
+                self._drop(key)
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _drop(self, key:Hashable) -> None:
+        entry = self._entries.pop(key)
+        self.nbytes -= entry.size
@@ -0,0 +1,528 @@
+"""
+An in memory snapshot of the summary fields of every transient (names, position,
+redshift, classification, photometry and spectra flags and discovery date) held in
+NumPy arrays, like .otter/summary.csv, so the filters of the search page can be
+answered with array masks instead of a query to ArangoDB. The full documents are
+then only fetched for the keys that match.
+
+The snapshot is refreshed from the database incrementally: the _key and _rev of
+every transient are listed, and only the summaries of new or changed documents
+are fetched.
+"""
+import copy
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, Union
+
+import numpy as np
+from astropy.coordinates import SkyCoord
+
+from .tables import default_name, discovery_date, discovery_jds
+from .spatial import SkyIndex
+from .names import NameIndex
+
+logger = logging.getLogger(__name__)
+
+# run an AQL query with bind parameters and return the results
+QueryFunction = Callable[[str, dict], Iterable[dict]]
+
+WAVE_DETS = ("radio", "uvoir", "xray")
+
+LIST_QUERY = """
+FOR transient IN transients
+    RETURN {_key: transient._key, _rev: transient._rev}
+"""
+
+# only the parts of each document the summary is made from, with each photometry
+# entry cut down to its obs_type and whether it has any detections
+SUMMARY_QUERY = """
+FOR transient IN transients
+    FILTER transient._key IN @keys
+    RETURN MERGE(
+        KEEP(
+            transient, "_key", "_rev", "name", "_ra", "_dec", "distance",
+            "classification", "reference_alias", "date_reference"
+        ),
+        HAS(transient, "photometry") ? {
+            photometry: (
+                FOR p IN transient.photometry
+                RETURN {
+                    obs_type: p.obs_type,
+                    upperlimit: FLATTEN([p.upperlimit]) ANY == false ? false : true
+                }
+            )
+        } : {},
+        HAS(transient, "spectra") ? {spectra: true} : {}
+    )
+"""
+
+# the summaries are fetched this many keys at a time
+FETCH_BATCH_SIZE = 5000
+
+def _to_number(value) -> float:
+    """
+    A value as a number the way AQL's TO_NUMBER does it, where anything that is not
+    a number is 0
+    """
+    if isinstance(value, bool):
+        return float(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if np.isfinite(number) else 0.0
+
+def _sort_value(value) -> float:
+    """
+    A value as a number that compares with numbers the way it does in AQL, where
+    null and booleans sort before every number and strings, arrays and objects after
+    """
+    if value is None or isinstance(value, bool):
+        return -np.inf
+    if isinstance(value, (int, float)):
+        return float(value)
+    return np.inf
+
+@dataclass
+class _Summary:
+    rev: Optional[str]
+    name: str
+    aliases: list[str]
+    ra: float
+    dec: float
+    redshifts: list[float]
+    classes: list[tuple[str, float]]
+    spec_classed: float
+    unambiguous: bool
+    refs: list[str]
+    hasphot: bool
+    obs_types: set[str]
+    detected: bool
+    det_types: set[str]
+    hasspec: bool
+    date: Optional[dict]
+
+def summarize(doc:dict) -> _Summary:
+    """
+    The summary of a transient document, either a full one or one cut down by
+    SUMMARY_QUERY
+
+    Args:
+        doc [dict] : The transient document
+    """
+    name = doc.get("name") or {}
+    aliases = [
+        alias["value"] for alias in name.get("alias") or []
+        if isinstance(alias, dict) and isinstance(alias.get("value"), str)
+    ]
+
+    classification = doc.get("classification")
+    if not isinstance(classification, dict):
+        classification = {}
+    classes = [
+        (c["object_class"], _sort_value(c.get("confidence")))
+        for c in classification.get("value") or []
+        if isinstance(c, dict) and isinstance(c.get("object_class"), str)
+    ]
+
+    photometry = doc.get("photometry")
+    if not isinstance(photometry, list):
+        photometry = []
+    photometry = [p for p in photometry if isinstance(p, dict)]
+    det_types = set()
+    detected = False
+    for phot in photometry:
+        upperlimit = phot.get("upperlimit")
+        if not isinstance(upperlimit, list):
+            upperlimit = [upperlimit]
+        if any(value is False for value in upperlimit):
+            detected = True
+            det_types.add(phot.get("obs_type"))
+
+    ra, dec = doc.get("_ra"), doc.get("_dec")
+    return _Summary(
+        rev=doc.get("_rev"),
+        name=default_name(doc),
+        aliases=aliases,
+        ra=float(ra) if isinstance(ra, (int, float)) else np.nan,
+        dec=float(dec) if isinstance(dec, (int, float)) else np.nan,
+        redshifts=[
+            _to_number(d.get("value")) for d in doc.get("distance") or []
+            if isinstance(d, dict) and d.get("distance_type") == "redshift"
+        ],
+        classes=classes,
+        spec_classed=_sort_value(classification.get("spec_classed")),
+        unambiguous=bool(classification.get("unambiguous")),
+        refs=[
+            ref["name"] for ref in doc.get("reference_alias") or []
+            if isinstance(ref, dict) and isinstance(ref.get("name"), str)
+        ],
+        hasphot="photometry" in doc,
+        obs_types={p.get("obs_type") for p in photometry},
+        detected=detected,
+        det_types=det_types,
+        hasspec="spectra" in doc,
+        date=discovery_date(doc)
+    )
+
+class _Arrays:
+    """
+    The summaries of every transient as arrays, in the order of keys. Built once per
+    refresh and never changed after, apart from the positions and names of
+    transients approved since then being updated in sky and names, so searches can
+    use one while the next is built. A newly approved transient gets a row in a
+    copy instead, see with_transient.
+    """
+
+    def __init__(self, summaries:dict[str, _Summary]):
+        keys = list(summaries)
+        values = list(summaries.values())
+        n = len(values)
+        self.keys = np.array(keys, dtype=str)
+        self.rows = {key: i for i, key in enumerate(keys)}
+
+        self.ra = np.array([s.ra for s in values], dtype=float)
+        self.dec = np.array([s.dec for s in values], dtype=float)
+        self.sky = SkyIndex(self.keys, self.ra, self.dec)
+        self.zmin = np.array([min(s.redshifts, default=np.nan) for s in values])
+        self.zmax = np.array([max(s.redshifts, default=np.nan) for s in values])
+        self.spec_classed = np.array([s.spec_classed for s in values], dtype=float)
+        self.unambiguous = np.array([s.unambiguous for s in values], dtype=bool)
+        self.hasphot = np.array([s.hasphot for s in values], dtype=bool)
+        self.hasspec = np.array([s.hasspec for s in values], dtype=bool)
+        self.detected = np.array([s.detected for s in values], dtype=bool)
+        self.phot = {
+            wave: np.array([wave in s.obs_types for s in values], dtype=bool)
+            for wave in WAVE_DETS
+        }
+        self.det = {
+            wave: np.array([wave in s.det_types for s in values], dtype=bool)
+            for wave in WAVE_DETS
+        }
+        self.jd = discovery_jds([s.date for s in values])
+
+        self.names = NameIndex(keys, ([s.name, *s.aliases] for s in values))
+        self.aliases = {}
+        for i, s in enumerate(values):
+            for alias in s.aliases:
+                self.aliases.setdefault(alias, []).append(i)
+
+        # the classifications and references of every transient, flattened, with
+        # the position of the transient each one belongs to
+        self.class_rows = np.array(
+            [i for i, s in enumerate(values) for _ in s.classes], dtype=np.int64
+        )
+        class_names = [c for s in values for c, _ in s.classes]
+        self.class_names, self.class_codes = np.unique(
+            np.array(class_names, dtype=object), return_inverse=True
+        ) if class_names else (np.array([], dtype=object), np.array([], dtype=np.int64))
+        self.class_confidence = np.array(
+            [confidence for s in values for _, confidence in s.classes], dtype=float
+        )
+        self.refs = {}
+        for i, s in enumerate(values):
+            for ref in s.refs:
+                self.refs.setdefault(ref, []).append(i)
+
+        self.size = n
+
+    def add(self, key:str, summary:_Summary) -> None:
+        """
+        Add the position and names of a transient that is not in the arrays yet, or
+        update its position
+        """
+        self.sky.add([key], [summary.ra], [summary.dec])
+        self.names.add(key, [summary.name, *summary.aliases])
+
+    def with_transient(self, key:str, summary:_Summary) -> "_Arrays":
+        """
+        The arrays with a transient that was approved since they were built. Its
+        position and names are updated in place if it already has a row, otherwise
+        a copy with a row added for it is returned, so every filter can match it.
+        The copy shares sky and names with these arrays.
+        """
+        self.add(key, summary)
+        if key in self.rows:
+            return self
+
+        one = _Arrays({key: summary})
+        arrays = copy.copy(self)
+        i = self.size
+        for column in (
+                "keys", "ra", "dec", "zmin", "zmax", "spec_classed", "unambiguous",
+                "hasphot", "hasspec", "detected", "jd", "class_confidence"
+        ):
+            setattr(
+                arrays,
+                column,
+                np.concatenate([getattr(self, column), getattr(one, column)])
+            )
+        arrays.phot = {
+            wave: np.concatenate([self.phot[wave], one.phot[wave]])
+            for wave in WAVE_DETS
+        }
+        arrays.det = {
+            wave: np.concatenate([self.det[wave], one.det[wave]]) for wave in WAVE_DETS
+        }
+        arrays.rows = {**self.rows, key: i}
+
+        arrays.aliases = dict(self.aliases)
+        for alias in summary.aliases:
+            arrays.aliases[alias] = [*arrays.aliases.get(alias, []), i]
+        arrays.refs = dict(self.refs)
+        for ref in summary.refs:
+            arrays.refs[ref] = [*arrays.refs.get(ref, []), i]
+
+        class_names = list(self.class_names)
+        codes = []
+        for name, _ in summary.classes:
+            if name not in class_names:
+                class_names.append(name)
+            codes.append(class_names.index(name))
+        arrays.class_names = np.array(class_names, dtype=object)
+        arrays.class_codes = np.concatenate(
+            [self.class_codes, np.array(codes, dtype=np.int64)]
+        )
+        arrays.class_rows = np.concatenate(
+            [self.class_rows, np.full(len(codes), i, dtype=np.int64)]
+        )
+
+        arrays.size = i + 1
+        return arrays
+
+class CatalogSnapshot:
+    """
+    The summary fields of every transient, refreshed from ArangoDB with refresh and
+    searched with search
+
+    Args:
+        query [QueryFunction] : Runs an AQL query with bind parameters and returns
+                                the results
+    """
+
+    def __init__(self, query:QueryFunction):
+        self.query = query
+        self._summaries = {}
+        self._arrays = None
+        self._lock = threading.Lock()
+        self.refreshed = None
+
+        # the summaries of transients approved since the last refresh, by key
+        self._approved = {}
+        self._approved_lock = threading.Lock()
+
+    def __len__(self):
+        return 0 if self._arrays is None else self._arrays.size
+
+    @property
+    def ready(self) -> bool:
+        return self._arrays is not None
+
+    def refresh(self) -> int:
+        """
+        Bring the snapshot up to date with the database, fetching the summaries of
+        the transients that were added or changed since the last refresh. Returns the
+        number of transients that were added, changed or removed.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            revs = {doc["_key"]: doc.get("_rev") for doc in self.query(LIST_QUERY, {})}
+            summaries = {
+                key: summary for key, summary in self._summaries.items()
+                if key in revs
+            }
+            removed = len(self._summaries) - len(summaries)
+
+            stale = [
+                key for key, rev in revs.items()
+                if key not in summaries or summaries[key].rev != rev
+            ]
+            for i in range(0, len(stale), FETCH_BATCH_SIZE):
+                batch = stale[i:i + FETCH_BATCH_SIZE]
+                for doc in self.query(SUMMARY_QUERY, {"keys": batch}):
+                    if doc.get("_key") in revs:
+                        summaries[doc["_key"]] = summarize(doc)
+
+            # keep the order the database lists them in
+            self._summaries = {key: summaries[key] for key in revs if key in summaries}
+            if stale or removed or self._arrays is None:
+                arrays = _Arrays(self._summaries)
+                with self._approved_lock:
+                    # forget the approved transients this refresh has caught up with
+                    self._approved = {
+                        key: summary for key, summary in self._approved.items()
+                        if key not in self._summaries
+                        or self._summaries[key].rev != summary.rev
+                    }
+                    for key, summary in self._approved.items():
+                        arrays = arrays.with_transient(key, summary)
+                    self._arrays = arrays
+            self.refreshed = time.time()
+
+            logger.info(
+                f"Catalog snapshot of {len(self._summaries)} transients refreshed in "
+                f"{time.perf_counter() - start:.2f}s, {len(stale)} fetched and "
+                f"{removed} removed"
+            )
+            return len(stale) + removed
+
+    def add_transient(self, doc:dict) -> None:
+        """
+        Add the position and names of a transient that was just approved (or update
+        them, if it was merged into one that is already in the snapshot), so
+        searches and suggestions find it before the next refresh
+
+        Args:
+            doc [dict] : The transient document, with its _key and _rev
+        """
+        summary = summarize(doc)
+        with self._approved_lock:
+            self._approved[doc["_key"]] = summary
+            if self._arrays is not None:
+                self._arrays = self._arrays.with_transient(doc["_key"], summary)
+
+    def suggest(self, text:str, limit:int=10) -> list[str]:
+        """
+        Transient names to suggest for what has been typed into a name field, see
+        NameIndex.suggest. Empty if the snapshot has not been loaded yet.
+
+        Args:
+            text [str] : What has been typed so far
+            limit [int] : The most names to suggest
+        """
+        arrays = self._arrays
+        if arrays is None:
+            return []
+        return arrays.names.suggest(text, limit)
+
+    def cone(self, ra:float, dec:float, radius:float=5) -> Optional[np.ndarray]:
+        """
+        The keys of the transients within radius of a position, including those
+        approved since the last refresh, or None if the snapshot has not been
+        loaded yet
+
+        Args:
+            ra [float] : The right ascension of the centre, in degrees
+            dec [float] : The declination of the centre, in degrees
+            radius [float] : The radius, in arcseconds
+        """
+        arrays = self._arrays
+        if arrays is None:
+            return None
+        return arrays.sky.query(ra, dec, radius)
+
+    def search(
+            self,
+            names:Union[str, list[str]]=None,
+            coords:SkyCoord=None,
+            radius:float=5,
+            minz:float=None,
+            maxz:float=None,
+            mindec:float=-90,
+            maxdec:float=90,
+            refs:Union[str, list[str]]=None,
+            hasphot:bool=False,
+            has_radio_phot:bool=False,
+            has_uvoir_phot:bool=False,
+            has_xray_phot:bool=False,
+            hasspec:bool=False,
+            spec_classed:bool=False,
+            unambiguous:bool=False,
+            classification:str=None,
+            class_confidence_threshold:float=0,
+            has_det:bool=False,
+            wave_det:Optional[str]=None,
+            **kwargs
+    ) -> Optional[np.ndarray]:
+        """
+        The keys of the transients matching the filters, which are the same as for
+        otter.Otter.query (and otter_web.selection.transient_query), or None if the
+        snapshot has not been loaded yet. Other keyword arguments, like the ra, dec
+        and ra_unit the search page keeps next to coords, are ignored.
+
+        A name is matched against the default name and the aliases, where
+        otter.Otter.query matches it against the whole name object.
+        """
+        arrays = self._arrays
+        if arrays is None:
+            return None
+
+        mask = np.ones(arrays.size, dtype=bool)
+        if hasphot or has_radio_phot or has_xray_phot or has_uvoir_phot:
+            mask &= arrays.hasphot
+        wanted_waves = (has_radio_phot, has_uvoir_phot, has_xray_phot)
+        for wave, wanted in zip(WAVE_DETS, wanted_waves):
+            if wanted:
+                mask &= arrays.phot[wave]
+
+        if coords is not None:
+            keys = arrays.sky.query(coords.ra.deg, coords.dec.deg, radius)
+            mask &= _rows(
+                [arrays.rows[key] for key in keys.tolist() if key in arrays.rows],
+                arrays.size
+            )
+
+        # AQL sorts null before every number, so a transient without a _dec passes a
+        # maximum but not a minimum
+        if mindec > -90:
+            mask &= arrays.dec >= mindec
+        if maxdec < 90:
+            mask &= ~(arrays.dec > maxdec)
+
+        if has_det:
+            mask &= arrays.detected if wave_det is None else arrays.det[wave_det]
+        if hasspec:
+            mask &= arrays.hasspec
+        if spec_classed:
+            mask &= arrays.spec_classed >= 1
+        if unambiguous:
+            mask &= arrays.unambiguous
+
+        if classification is not None:
+            matching_names = np.array(
+                [classification in name for name in arrays.class_names], dtype=bool
+            )
+            matching = (
+                matching_names[arrays.class_codes]
+                if len(arrays.class_codes) else np.zeros(0, dtype=bool)
+            ) & (arrays.class_confidence > _to_number(class_confidence_threshold))
+            mask &= _rows(arrays.class_rows[matching], arrays.size)
+
+        if minz is not None:
+            mask &= arrays.zmax >= minz
+        if maxz is not None:
+            mask &= arrays.zmin <= maxz
+
+        if names is not None:
+            if isinstance(names, str):
+                mask &= _rows(
+                    [
+                        arrays.rows[key] for key in arrays.names.ids(names)
+                        if key in arrays.rows
+                    ],
+                    arrays.size
+                )
+            else:
+                mask &= _rows(
+                    [i for name in names for i in arrays.aliases.get(name, [])],
+                    arrays.size
+                )
+
+        if refs is not None:
+            refs = [refs] if isinstance(refs, str) else refs
+            mask &= _rows(
+                [i for ref in refs for i in arrays.refs.get(ref, [])],
+                arrays.size
+            )
+
+        return arrays.keys[mask]
+
+def _rows(indexes:Iterable[int], size:int) -> np.ndarray:
+    """
+    A mask of size that is True at indexes
+    """
+    mask = np.zeros(size, dtype=bool)
+    mask[np.asarray(indexes, dtype=np.int64)] = True
+    return mask
@@ -5,4 +5,5 @@ from .upload import *
 from .vetting import *
 from .citing import *
 from .api import *
+from .monitoring import *
 from .redback_model_display import *
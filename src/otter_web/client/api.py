@@ -3,250 +3,1728 @@ An API endpoint to query the database, with some protection
 """
 
 import os
-import requests
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
 from functools import partial
-from typing import Callable
-from nicegui import ui, Client, run
-from fastapi.responses import RedirectResponse, JSONResponse
+from typing import Callable, Optional
+import httpx
+from nicegui import ui, Client, app
+from fastapi.responses import (
+    RedirectResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse
+)
 from fastapi import Request, APIRouter
+from fastapi.routing import APIRoute
 
 from ..theme import frame
-from ..config import API_URL, WEB_BASE_URL
+from ..config import (
+    API_URL,
+    WEB_BASE_URL,
+    API_TIMEOUT,
+    API_RETRIES,
+    API_RATE_LIMIT,
+    API_RATE_BURST,
+    API_MAX_CONCURRENT,
+    API_MAX_QUEUE,
+    API_QUEUE_TIMEOUT,
+    API_STREAM_RESPONSES,
+    API_COMPRESS,
+    API_COMPRESS_MIN_SIZE,
+    API_COALESCE,
+    API_CURSOR_BUFFER_MAX_BYTES,
+    API_METADATA_CACHE_TTL,
+    API_BULK_BATCH_SIZE,
+    API_EXPORT_BATCH_SIZE,
+    API_EXPORT_CURSOR_TTL,
+    API_CURSOR_CACHE,
+    API_CURSOR_CACHE_TTL,
+    API_CURSOR_CACHE_MAX_BYTES,
+    API_CURSOR_PREFETCH,
+    API_CURSOR_PREFETCH_MAX_BYTES,
+    API_CURSOR_PREFETCH_MAX_CURSORS,
+    API_WORKER_ID,
+    API_TOKEN_CACHE,
+    API_TOKEN_REFRESH_MARGIN,
+    API_TOKEN_REAUTH_MAX_AGE,
+    API_AQL_GUARD,
+    API_AQL_MAX_COST,
+    API_AQL_MAX_ITEMS,
+    API_AQL_MAX_RUNTIME,
+    API_AQL_MEMORY_LIMIT
+)
+from ..upstream import (
+    get_client,
+    start_client,
+    close_client,
+    SingleFlight,
+    CircuitOpen,
+    UPSTREAM_HEALTH,
+    RETRYABLE_STATUS,
+    is_connection_error,
+    backoff
+)
+from ..cache import ResponseCache
+from ..readahead import CursorReadAhead
+from ..tokens import TokenCache
+from ..compression import negotiate, compress, compress_stream
+from ..admission import Overloaded, RateLimiter, ConcurrencyLimiter
+from ..metrics import (
+    REGISTRY,
+    UPSTREAM_REQUESTS,
+    UPSTREAM_LATENCY,
+    UPSTREAM_BYTES_IN,
+    UPSTREAM_BYTES_OUT,
+    UPSTREAM_RETRIES,
+    ratio
+)
+from ..selection import parse_filters, transient_query
+from ..aql import (
+    is_read_only,
+    is_cacheable,
+    normalize_query,
+    collections_read,
+    collections_written,
+    check_plan,
+    with_limits
+)
 
 from otter import Otter
 
-API_ROUTER = APIRouter()
+logger = logging.getLogger(__name__)
+
 HOP_BY_HOP_HEADERS = {
     "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
     "te", "trailers", "transfer-encoding", "upgrade", "host"
 }
+# response headers that the app server sets itself
+UNSAFE_RESPONSE_HEADERS = {"server", "date"}
+
+# per client request limits, and a cap on the calls waiting on ArangoDB at once
+RATE_LIMITER = RateLimiter(rate=API_RATE_LIMIT, burst=API_RATE_BURST)
+UPSTREAM_LIMITER = ConcurrencyLimiter(
+    max_concurrent=API_MAX_CONCURRENT,
+    max_queue=API_MAX_QUEUE,
+    queue_timeout=API_QUEUE_TIMEOUT
+)
+
+# results of read only AQL queries, only used if API_CURSOR_CACHE is set
+CURSOR_CACHE = ResponseCache(
+    ttl=API_CURSOR_CACHE_TTL,
+    max_bytes=API_CURSOR_CACHE_MAX_BYTES
+)
+
+# the listings pyArango fetches on every connection, which almost never change
+METADATA_CACHE = ResponseCache(ttl=API_METADATA_CACHE_TTL, max_bytes=16*1024**2)
+
+# open AQL cursors whose next batch is fetched before the client asks for it, only
+# used if API_CURSOR_PREFETCH is set
+READ_AHEAD = CursorReadAhead(
+    worker=API_WORKER_ID,
+    max_bytes=API_CURSOR_PREFETCH_MAX_BYTES,
+    max_cursors=API_CURSOR_PREFETCH_MAX_CURSORS
+)
+
+# the JWTs handed out through /_open/auth, only used if API_TOKEN_CACHE is set
+TOKENS = TokenCache(
+    margin=API_TOKEN_REFRESH_MARGIN,
+    max_age=API_TOKEN_REAUTH_MAX_AGE
+)
+
+# what ArangoDB estimated each recent query would cost, so the same query is not
+# explained again every time it is run. Only used if API_AQL_GUARD is set
+EXPLAIN_CACHE = ResponseCache(ttl=300, max_bytes=4*1024**2)
+
+# identical ArangoDB calls that are running right now, only used if API_COALESCE
+# is set
+IN_FLIGHT = SingleFlight()
+
+REGISTRY.counter_function(
+    "otter_cursor_cache_hits_total",
+    "AQL cursor requests answered from the cursor cache",
+    lambda: CURSOR_CACHE.hits
+)
+REGISTRY.counter_function(
+    "otter_cursor_cache_misses_total",
+    "Cacheable AQL cursor requests that had to go to ArangoDB",
+    lambda: CURSOR_CACHE.misses
+)
+REGISTRY.gauge_function(
+    "otter_cursor_cache_hit_ratio",
+    "Fraction of cacheable AQL cursor requests answered from the cursor cache",
+    lambda: ratio(CURSOR_CACHE.hits, CURSOR_CACHE.hits + CURSOR_CACHE.misses)
+)
+REGISTRY.gauge_function(
+    "otter_cursor_cache_bytes",
+    "Size of the response bodies held in the cursor cache",
+    lambda: CURSOR_CACHE.nbytes
+)
+REGISTRY.counter_function(
+    "otter_metadata_cache_hits_total",
+    "Metadata requests answered from the metadata cache",
+    lambda: METADATA_CACHE.hits
+)
+REGISTRY.counter_function(
+    "otter_metadata_cache_misses_total",
+    "Metadata requests that had to go to ArangoDB",
+    lambda: METADATA_CACHE.misses
+)
+REGISTRY.gauge_function(
+    "otter_metadata_cache_hit_ratio",
+    "Fraction of metadata requests answered from the metadata cache",
+    lambda: ratio(METADATA_CACHE.hits, METADATA_CACHE.hits + METADATA_CACHE.misses)
+)
+REGISTRY.counter_function(
+    "otter_cursor_prefetch_hits_total",
+    "Cursor batches handed to the client from the read ahead buffer",
+    lambda: READ_AHEAD.hits
+)
+REGISTRY.counter_function(
+    "otter_cursor_prefetch_misses_total",
+    "Cursor batches that had to be fetched while the client waited",
+    lambda: READ_AHEAD.misses
+)
+REGISTRY.counter_function(
+    "otter_cursor_prefetch_expired_total",
+    "Read ahead cursors dropped because they expired before the client came back",
+    lambda: READ_AHEAD.expired
+)
+REGISTRY.gauge_function(
+    "otter_cursor_prefetch_bytes",
+    "Size of the cursor batches held in the read ahead buffer",
+    lambda: READ_AHEAD.nbytes
+)
+REGISTRY.counter_function(
+    "otter_token_cache_hits_total",
+    "Logins answered with a token from the token cache",
+    lambda: TOKENS.hits
+)
+REGISTRY.counter_function(
+    "otter_token_cache_misses_total",
+    "Logins that had to go to ArangoDB",
+    lambda: TOKENS.misses
+)
+REGISTRY.counter_function(
+    "otter_token_refreshes_total",
+    "Times the proxy logged a client in again because its token ran out",
+    lambda: TOKENS.refreshes
+)
+REGISTRY.counter_function(
+    "otter_upstream_coalesced_total",
+    "Proxy requests that shared an identical in flight ArangoDB call",
+    lambda: IN_FLIGHT.coalesced
+)
+REGISTRY.counter_function(
+    "otter_rate_limited_total",
+    "Proxy requests turned away because the client was over its rate limit",
+    lambda: RATE_LIMITER.rejected
+)
+REGISTRY.counter_function(
+    "otter_upstream_rejected_total",
+    "Proxy requests turned away because too many calls were waiting on ArangoDB",
+    lambda: UPSTREAM_LIMITER.rejected
+)
+REGISTRY.gauge_function(
+    "otter_upstream_active",
+    "Calls to ArangoDB currently holding a slot",
+    lambda: UPSTREAM_LIMITER.active
+)
+REGISTRY.gauge_function(
+    "otter_upstream_waiting",
+    "Calls to ArangoDB currently waiting for a slot",
+    lambda: UPSTREAM_LIMITER.waiting
+)
+REGISTRY.gauge_function(
+    "otter_upstream_circuit_open",
+    "1 if calls to ArangoDB are failing fast because it is down, 0.5 while probing",
+    lambda: {UPSTREAM_HEALTH.CLOSED: 0, UPSTREAM_HEALTH.HALF_OPEN: 0.5}.get(
+        UPSTREAM_HEALTH.state, 1
+    )
+)
+REGISTRY.counter_function(
+    "otter_upstream_circuit_trips_total",
+    "Times the circuit to ArangoDB opened",
+    lambda: UPSTREAM_HEALTH.trips
+)
+REGISTRY.counter_function(
+    "otter_upstream_circuit_rejected_total",
+    "Calls to ArangoDB that failed fast because the circuit was open",
+    lambda: UPSTREAM_HEALTH.rejected
+)
+
+NOT_MODIFIED = REGISTRY.counter(
+    "otter_not_modified_total",
+    "Conditional metadata requests answered with 304 Not Modified"
+)
+AQL_REJECTED = REGISTRY.counter(
+    "otter_aql_rejected_total",
+    "AQL queries turned away because they were estimated to be too expensive"
+)
+
+# one pooled connection to ArangoDB for the lifetime of the app
+app.on_startup(start_client)
+app.on_shutdown(close_client)
 
-async def arangodb_proxy_post(request:Request, proxy_url:str):
+def _auth_identity(request:Request) -> str:
     """
-    Some general proxy code to post JSON to arangodb
+    A short hash of the credentials on the request, so responses fetched for one
+    user are never handed to another
 
     Args:
         request [Request] : the fastapi request object
-        proxy_url [str] : The url to spoof
     """
-    # Filter and forward headers
-    headers = {
+    auth = request.headers.get("authorization", "")
+    return hashlib.sha256(auth.encode()).hexdigest()[:16]
+
+def _client_identity(request:Request) -> str:
+    """
+    Who is making the request, for rate limiting. This is the address of the client,
+    split by login for bearer tokens the token cache handed out. Other credentials
+    can not be checked here, so they count against the address like no credentials
+    do, otherwise a client could get a fresh limit with every made up header. The
+    address only comes from X-Forwarded-For when the server is run with
+    forwarded_allow_ips=TRUSTED_PROXIES, as start.py does, for the same reason.
+
+    Args:
+        request [Request] : the fastapi request object
+    """
+    host = f"host:{request.client.host if request.client else 'unknown'}"
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if API_TOKEN_CACHE and scheme.lower() == "bearer":
+        login = TOKENS.issued(token.strip())
+        if login is not None:
+            return f"{host}:login:{login[:16]}"
+    return host
+
+def _too_many_requests(e:Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": True, "code": 429, "errorMessage": str(e)},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+class AdmittedRoute(APIRoute):
+    """
+    A route that turns clients away with a 429 when they are over their rate limit
+    """
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def admitted_handler(request:Request):
+            try:
+                RATE_LIMITER.check(_client_identity(request))
+            except Overloaded as e:
+                return _too_many_requests(e)
+            return await handler(request)
+
+        return admitted_handler
+
+API_ROUTER = APIRouter(route_class=AdmittedRoute)
+
+def _forward_headers(request:Request) -> dict:
+    """
+    The headers from the incoming request that should be sent on to ArangoDB. The
+    content-length is dropped too since the upstream client computes its own.
+
+    Args:
+        request [Request] : the fastapi request object
+    """
+    return {
         key: value
         for key, value in request.headers.items()
-        if key.lower() not in HOP_BY_HOP_HEADERS
+        if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() != "content-length"
     }
 
+def _response_headers(response:httpx.Response, decoded:bool=False) -> dict:
+    """
+    The headers from the ArangoDB response that are safe to hand back to the client
+
+    Args:
+        response [httpx.Response] : The response from ArangoDB
+        decoded [bool] : True if the body was decoded by the client, in which case the
+                         upstream content-encoding and content-length no longer apply
+    """
+    skip = HOP_BY_HOP_HEADERS | UNSAFE_RESPONSE_HEADERS
+    if decoded:
+        skip = skip | {"content-encoding", "content-length"}
+    return {
+        key: value
+        for key, value in response.headers.items()
+        if key.lower() not in skip
+    }
+
+def _route_label(request:Request) -> str:
+    """
+    The template of the route that matched the request, for labelling metrics
+    """
+    return getattr(request.scope.get("route"), "path", None) or "unmatched"
+
+async def _iter_upstream(
+        response:httpx.Response,
+        route:str="unmatched",
+        prefix:bytes=b"",
+        chunks=None
+):
+    """
+    Yield the raw, still encoded, body of the ArangoDB response chunk by chunk and
+    give the connection back to the pool when done (or when the client goes away).
+    prefix is the start of the body if it was already read from chunks, the raw
+    iterator of the response.
+    """
+    nbytes = len(prefix)
     try:
-        body = await request.json()
-    except Exception as e:
+        if prefix:
+            yield prefix
+        async for chunk in chunks or response.aiter_raw():
+            nbytes += len(chunk)
+            yield chunk
+    finally:
+        await response.aclose()
+        UPSTREAM_BYTES_IN.inc(nbytes, route=route)
+
+def _buffered_response(
+        request:Request,
+        content:bytes,
+        status_code:int,
+        headers:dict
+) -> Response:
+    """
+    A response with a body we already hold in full, compressed if the client
+    accepts it and it is big enough to be worth it
+
+    Args:
+        request [Request] : the fastapi request object
+        content [bytes] : The uncompressed body
+        status_code [int] : The status code of the response
+        headers [dict] : The headers of the response
+    """
+    headers = dict(headers)
+    if API_COMPRESS:
+        headers["vary"] = "Accept-Encoding"
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        if encoding is not None and len(content) >= API_COMPRESS_MIN_SIZE:
+            content = compress(content, encoding)
+            headers["content-encoding"] = encoding
+
+    return Response(content=content, status_code=status_code, headers=headers)
+
+def _streaming_response(
+        request:Request,
+        response:httpx.Response,
+        prefix:bytes=b"",
+        chunks=None
+) -> StreamingResponse:
+    """
+    Relay a streamed ArangoDB response. A body ArangoDB already compressed is passed
+    through as is, otherwise it is compressed on the fly if the client accepts it.
+
+    Args:
+        request [Request] : the fastapi request object
+        response [httpx.Response] : The ArangoDB response, with the body not yet read
+        prefix [bytes] : The start of the body, if some of it was already read
+        chunks [AsyncIterator] : The raw iterator prefix was read from
+    """
+    headers = _response_headers(response)
+    body = _iter_upstream(
+        response,
+        route=_route_label(request),
+        prefix=prefix,
+        chunks=chunks
+    )
+
+    if API_COMPRESS:
+        headers["vary"] = "Accept-Encoding"
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        length = response.headers.get("content-length")
+        if (
+                encoding is not None and
+                "content-encoding" not in response.headers and
+                (length is None or int(length) >= API_COMPRESS_MIN_SIZE)
+        ):
+            body = compress_stream(body, encoding)
+            headers.pop("content-length", None)
+            headers["content-encoding"] = encoding
+
+    return StreamingResponse(body, status_code=response.status_code, headers=headers)
+
+def _proxy_error(e:Exception, error_message:str) -> JSONResponse:
+    if isinstance(e, Overloaded):
+        return _too_many_requests(e)
+    if isinstance(e, CircuitOpen):
         return JSONResponse(
-            status_code=400,
-            content={"error": True, "code": 400, "errorMessage": f"Invalid JSON body: {str(e)}"}
+            status_code=503,
+            content={"error": True, "code": 503, "errorMessage": str(e)},
+            headers={"Retry-After": str(e.retry_after)}
         )
+    return JSONResponse(
+        status_code=500,
+        content={
+            'error': True,
+            "code": 500,
+            "errorMessage": f'{error_message}: {e}'
+        }
+    )
+
+async def _arangodb_send(
+        request:Request,
+        method:str,
+        proxy_url:str,
+        body:bytes=None,
+        timeout:float=API_TIMEOUT,
+        stream:bool=False,
+        headers:dict=None,
+        reauthenticate:bool=True,
+        idempotent:bool=None
+) -> httpx.Response:
+    """
+    Send a request on to arangodb. Raises if the request fails or ArangoDB returns
+    an error status, Overloaded if too many calls are already waiting on ArangoDB or
+    CircuitOpen if ArangoDB is known to be down. Idempotent calls are retried if
+    ArangoDB can not be reached. A slot is held until the response headers arrive, or
+    the whole body if it is not streamed.
+
+    Args:
+        request [Request] : the fastapi request object
+        method [str] : The HTTP method to use
+        proxy_url [str] : The url to spoof
+        body [bytes] : The raw body to send, default is to send no body
+        timeout [float] : The timeout, in seconds, for the call to ArangoDB
+        stream [bool] : If True, the body of the response is not read yet
+        headers [dict] : Headers to set on top of the ones from the request
+        reauthenticate [bool] : If True, a token from the token cache that is about
+                                to expire is swapped for a fresh one
+        idempotent [bool] : If the call can safely be made twice, default is True for
+                            GET and HEAD only
+    """
+    headers = _forward_headers(request) | (headers or {})
+    if API_TOKEN_CACHE and reauthenticate:
+        headers = await _reauthenticate(request, headers)
+    if not stream:
+        # the body is read in full here anyway, so it is compressed for the client
+        # afterwards instead of being compressed by ArangoDB and decoded again
+        headers["accept-encoding"] = "identity"
+    elif "accept-encoding" not in headers:
+        # a streamed body is passed on as ArangoDB encoded it, so it must not be
+        # encoded unless the client asked for it (httpx asks for gzip by default)
+        headers["accept-encoding"] = "identity"
+
+    client = get_client()
+    upstream_request = client.build_request(
+        method,
+        proxy_url,
+        headers=headers,
+        content=body,
+        timeout=timeout
+    )
+
+    route = _route_label(request)
+    if idempotent is None:
+        idempotent = method in ("GET", "HEAD")
+
+    attempt = 0
+    while True:
+        probe = UPSTREAM_HEALTH.allow()
+        UPSTREAM_BYTES_OUT.inc(len(body or b""), route=route)
+        try:
+            async with UPSTREAM_LIMITER.slot():
+                start = time.perf_counter()
+                try:
+                    response = await client.send(upstream_request, stream=stream)
+                except Exception:
+                    UPSTREAM_REQUESTS.inc(route=route, method=method, status="error")
+                    raise
+                finally:
+                    UPSTREAM_LATENCY.observe(
+                        time.perf_counter() - start, route=route, method=method
+                    )
+        except Exception as e:
+            if not is_connection_error(e):
+                UPSTREAM_HEALTH.release(probe)
+                raise
+            UPSTREAM_HEALTH.record_failure()
+            if not idempotent or attempt >= API_RETRIES:
+                raise
+        except BaseException:
+            UPSTREAM_HEALTH.release(probe)
+            raise
+        else:
+            UPSTREAM_REQUESTS.inc(
+                route=route, method=method, status=response.status_code
+            )
+            if not stream:
+                UPSTREAM_BYTES_IN.inc(len(response.content), route=route)
+
+            if response.status_code not in RETRYABLE_STATUS:
+                UPSTREAM_HEALTH.record_success()
+                break
+            UPSTREAM_HEALTH.record_failure()
+            if not idempotent or attempt >= API_RETRIES:
+                break
+            await response.aclose()
+
+        UPSTREAM_RETRIES.inc(route=route, method=method)
+        await asyncio.sleep(backoff(attempt))
+        attempt += 1
 
-    # Send query to ArangoDB
     try:
-        response = await run.io_bound(
-            requests.post,
+        response.raise_for_status()
+    except Exception:
+        await response.aclose()
+        raise
+    return response
+
+async def _arangodb_fetch(
+        request:Request,
+        method:str,
+        proxy_url:str,
+        body:bytes=None,
+        timeout:float=API_TIMEOUT,
+        coalesce:bool=True,
+        reauthenticate:bool=True,
+        idempotent:bool=None
+) -> httpx.Response:
+    """
+    Send a request on to arangodb and read the whole response. If API_COALESCE is set,
+    identical requests that arrive while this one is running wait for it and get the
+    same response instead of going to ArangoDB themselves.
+
+    Args:
+        request [Request] : the fastapi request object
+        method [str] : The HTTP method to use
+        proxy_url [str] : The url to spoof
+        body [bytes] : The raw body to send, default is to send no body
+        timeout [float] : The timeout, in seconds, for the call to ArangoDB
+        coalesce [bool] : Set to False if the request must not be shared
+        reauthenticate [bool] : Passed on to _arangodb_send
+        idempotent [bool] : Passed on to _arangodb_send
+    """
+    send = partial(
+        _arangodb_send,
+        request,
+        method,
+        proxy_url,
+        body=body,
+        timeout=timeout,
+        reauthenticate=reauthenticate,
+        idempotent=idempotent
+    )
+    if not (API_COALESCE and coalesce):
+        return await send()
+
+    key = (
+        method,
+        proxy_url,
+        _auth_identity(request),
+        hashlib.sha256(body or b"").hexdigest()
+    )
+    return await IN_FLIGHT.do(key, send)
+
+async def _login(
+        request:Request,
+        key:str,
+        credentials:bytes,
+        refresh:bool=False
+) -> httpx.Response:
+    """
+    Log in to ArangoDB and remember the token in the token cache
+
+    Args:
+        request [Request] : the fastapi request object
+        key [str] : The token cache key of the credentials
+        credentials [bytes] : The body of the login request
+        refresh [bool] : True if the proxy is logging in for the client
+    """
+    response = await _arangodb_fetch(
+        request,
+        "POST",
+        f"{API_URL}/_open/auth",
+        body=credentials,
+        reauthenticate=False,
+        idempotent=True
+    )
+    TOKENS.put(
+        key,
+        credentials,
+        response.content,
+        headers=_response_headers(response, decoded=True),
+        refresh=refresh
+    )
+    return response
+
+async def _reauthenticate(request:Request, headers:dict) -> dict:
+    """
+    Swap a bearer token that was handed out through the token cache and is about to
+    expire for a fresh one, logging in again with the same credentials if nobody has
+    yet. If that fails the headers are left alone and ArangoDB has the last word.
+
+    Args:
+        request [Request] : the fastapi request object
+        headers [dict] : The headers that are about to be sent to ArangoDB
+    """
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return headers
+
+    stale = TOKENS.stale(token.strip())
+    if stale is None:
+        return headers
+
+    key, credentials = stale
+    login = TOKENS.get(key)
+    if login is None:
+        try:
+            await _login(request, key, credentials, refresh=True)
+        except Exception:
+            return headers
+        login = TOKENS.get(key)
+        if login is None:
+            return headers
+
+    return headers | {"authorization": f"bearer {login.token}"}
+
+@dataclass
+class _CursorResponse:
+    """
+    The response of ArangoDB to creating a cursor. Either the whole body was read,
+    and parsed into result, or only its start was and the rest is still to be
+    streamed from upstream through chunks.
+    """
+    status_code: int
+    headers: dict
+    content: bytes
+    result: Optional[dict] = None
+    upstream: Optional[httpx.Response] = None
+    chunks: object = None
+
+    @classmethod
+    def read(cls, status_code:int, headers:dict, content:bytes) -> "_CursorResponse":
+        try:
+            result = json.loads(content)
+        except ValueError:
+            result = None
+        if not isinstance(result, dict):
+            result = None
+        return cls(status_code, headers, content, result=result)
+
+    @property
+    def has_more(self) -> bool:
+        return self.result is not None and bool(self.result.get("hasMore"))
+
+    @property
+    def complete(self) -> bool:
+        """
+        True if the body was read and holds the whole result, so there is no server
+        side cursor state tied to it
+        """
+        return self.result is not None and not self.has_more
+
+    async def aclose(self) -> None:
+        if self.upstream is not None:
+            await self.upstream.aclose()
+
+async def _read_cursor(
+        request:Request,
+        proxy_url:str,
+        body:bytes
+) -> _CursorResponse:
+    """
+    Create a cursor in ArangoDB and read the response, but stop once more than
+    API_CURSOR_BUFFER_MAX_BYTES of it have arrived so a big result can be streamed
+    to the client instead of being held in memory
+
+    Args:
+        request [Request] : the fastapi request object
+        proxy_url [str] : The cursor url of the database
+        body [bytes] : The body of the cursor request
+    """
+    if not API_STREAM_RESPONSES:
+        response = await _arangodb_send(
+            request,
+            "POST",
             proxy_url,
-            headers=headers,
-            json=body
+            body=body,
+            idempotent=True
         )
-        response.raise_for_status()
-    except Exception as e:
-        response = JSONResponse(
-            status_code=500,
-            content={
-                'error': True,
-                "code": 500,
-                "errorMessage": f'Failed to fetch data from ArangoDB through the Proxy: {e}'
-            }
+        return _CursorResponse.read(
+            response.status_code,
+            _response_headers(response, decoded=True),
+            response.content
         )
-        return response
 
-    json_resp = JSONResponse(
-        status_code=response.status_code,
-        content=response.json()
+    # the body has to be plain to be parsed, it is compressed for the client after
+    response = await _arangodb_send(
+        request,
+        "POST",
+        proxy_url,
+        body=body,
+        stream=True,
+        headers={"accept-encoding": "identity"},
+        idempotent=True
     )
-    return json_resp
+    chunks = response.aiter_raw()
+    parts = []
+    nbytes = 0
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            nbytes += len(chunk)
+            if nbytes > API_CURSOR_BUFFER_MAX_BYTES:
+                return _CursorResponse(
+                    response.status_code,
+                    _response_headers(response),
+                    b"".join(parts),
+                    upstream=response,
+                    chunks=chunks
+                )
+    except BaseException:
+        await response.aclose()
+        raise
 
-async def arangodb_proxy_put(request:Request, proxy_url:str):
+    await response.aclose()
+    UPSTREAM_BYTES_IN.inc(nbytes, route=_route_label(request))
+    return _CursorResponse.read(
+        response.status_code,
+        _response_headers(response, decoded=True),
+        b"".join(parts)
+    )
+
+async def _create_cursor(
+        request:Request,
+        proxy_url:str,
+        body:bytes
+) -> _CursorResponse:
+    """
+    Create a cursor in ArangoDB. If API_COALESCE is set, identical requests that
+    arrive while this one is running get the same response if it is a complete
+    result that was read in full, and create their own cursor otherwise.
+
+    Args:
+        request [Request] : the fastapi request object
+        proxy_url [str] : The cursor url of the database
+        body [bytes] : The body of the cursor request
+    """
+    send = partial(_read_cursor, request, proxy_url, body)
+    if not API_COALESCE:
+        return await send()
+
+    key = (
+        "POST",
+        proxy_url,
+        _auth_identity(request),
+        hashlib.sha256(body).hexdigest()
+    )
+    return await IN_FLIGHT.do(
+        key,
+        send,
+        share=lambda cursor: cursor.complete,
+        discard=_CursorResponse.aclose
+    )
+
+def _read_ahead(
+        request:Request,
+        db:str,
+        content:bytes,
+        ttl:float=None,
+        result:dict=None
+) -> bytes:
+    """
+    Start fetching the next batch of the cursor in a response that has more to come,
+    and hand the client a cursor id that routes back to this worker. Returns the body
+    to send to the client.
+
+    Args:
+        request [Request] : the fastapi request object
+        db [str] : The database the cursor is in
+        content [bytes] : The cursor response from ArangoDB
+        ttl [float] : The ttl the cursor was created with, in seconds
+        result [dict] : content already parsed, if it was
+    """
+    try:
+        result = dict(json.loads(content) if result is None else result)
+        cursor_id = str(result["id"])
+    except (ValueError, KeyError, TypeError):
+        return content
+
+    if not result.get("hasMore"):
+        return content
+    if not READ_AHEAD.open(cursor_id, _auth_identity(request), ttl=ttl):
+        # no room, the client pages through this one the normal way
+        return content
+
+    READ_AHEAD.fetch_ahead(
+        cursor_id,
+        partial(
+            _arangodb_send,
+            request,
+            "PUT",
+            f"{API_URL}/_db/{db}/_api/cursor/{cursor_id}"
+        )
+    )
+    result["id"] = READ_AHEAD.client_id(cursor_id)
+    return json.dumps(result).encode()
+
+async def arangodb_proxy(
+        request:Request,
+        method:str,
+        proxy_url:str,
+        body:bytes=None,
+        timeout:float=API_TIMEOUT,
+        error_message:str="Failed to fetch data from ArangoDB through the Proxy",
+        coalesce:bool=False
+):
+    """
+    Send a request on to arangodb and relay the response back to the client. If
+    API_STREAM_RESPONSES is set the body is forwarded chunk by chunk without ever
+    being parsed, otherwise it is read fully before being sent on.
+
+    Args:
+        request [Request] : the fastapi request object
+        method [str] : The HTTP method to use
+        proxy_url [str] : The url to spoof
+        body [bytes] : The raw body to send, default is to send no body
+        timeout [float] : The timeout, in seconds, for the call to ArangoDB
+        error_message [str] : The start of the error message if the call fails
+        coalesce [bool] : If True, the request is safe to share with identical
+                          concurrent requests. Shared responses are always buffered.
+    """
+    stream = API_STREAM_RESPONSES and not (coalesce and API_COALESCE)
+    try:
+        if stream:
+            response = await _arangodb_send(
+                request,
+                method,
+                proxy_url,
+                body=body,
+                timeout=timeout,
+                stream=True
+            )
+        else:
+            response = await _arangodb_fetch(
+                request,
+                method,
+                proxy_url,
+                body=body,
+                timeout=timeout,
+                coalesce=coalesce
+            )
+    except Exception as e:
+        return _proxy_error(e, error_message)
+
+    if not stream:
+        return _buffered_response(
+            request,
+            response.content,
+            status_code=response.status_code,
+            headers=_response_headers(response, decoded=True)
+        )
+
+    return _streaming_response(request, response)
+
+async def arangodb_proxy_post(
+        request:Request,
+        proxy_url:str,
+        timeout:float=API_TIMEOUT
+):
     """
     Some general proxy code to post JSON to arangodb
 
     Args:
         request [Request] : the fastapi request object
         proxy_url [str] : The url to spoof
+        timeout [float] : The timeout, in seconds, for the call to ArangoDB
     """
-    # Filter and forward headers
-    headers = {
-        key: value
-        for key, value in request.headers.items()
-        if key.lower() not in HOP_BY_HOP_HEADERS
-    }
+    try:
+        await request.json()
+        body = await request.body()
+    except Exception as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "code": 400,
+                "errorMessage": f"Invalid JSON body: {str(e)}"
+            }
+        )
+
+    # the body was validated so forward the raw bytes
+    return await arangodb_proxy(request, "POST", proxy_url, body=body, timeout=timeout)
 
+async def arangodb_proxy_put(request:Request, proxy_url:str, timeout:float=API_TIMEOUT):
+    """
+    Some general proxy code to put JSON to arangodb
+
+    Args:
+        request [Request] : the fastapi request object
+        proxy_url [str] : The url to spoof
+        timeout [float] : The timeout, in seconds, for the call to ArangoDB
+    """
     # Make sure Authorization header is passed through
-    if 'Authorization' not in headers:
+    if 'authorization' not in request.headers:
         return JSONResponse(
             status_code=400,
             content={"error": True, "code": 400, "errorMessage": "Missing Authorization header"}
         )
     
     try:
-        body = await request.json()
+        await request.json()
+        body = await request.body()
     except Exception as e:
         return JSONResponse(
             status_code=400,
-            content={"error": True, "code": 400, "errorMessage": f"Invalid JSON body: {str(e)}"}
-        )
-
-    # Send query to ArangoDB
-    try:
-        response = await run.io_bound(
-            requests.put,
-            proxy_url,
-            headers=headers,
-            json=body
-        )
-        response.raise_for_status()
-    except Exception as e:
-        response = JSONResponse(
-            status_code=500,
             content={
-                'error': True,
-                "code": 500,
-                "errorMessage": f'Failed to fetch data from ArangoDB through the Proxy: {e}'
+                "error": True,
+                "code": 400,
+                "errorMessage": f"Invalid JSON body: {str(e)}"
             }
         )
-        return response
-
-    json_resp = JSONResponse(
-        status_code=response.status_code,
-        content=response.json()
-    )
-    return json_resp
 
+    # the body was validated so forward the raw bytes
+    return await arangodb_proxy(request, "PUT", proxy_url, body=body, timeout=timeout)
 
-async def arangodb_proxy_get(request:Request, proxy_url:str):
+async def arangodb_proxy_get(request:Request, proxy_url:str, timeout:float=API_TIMEOUT):
     """
-    Some general proxy code to post JSON to arangodb
+    Some general proxy code to get JSON from arangodb
 
     Args:
         request [Request] : the fastapi request object
         proxy_url [str] : The url to spoof
+        timeout [float] : The timeout, in seconds, for the call to ArangoDB
     """
-    headers = {
-        key: value
-        for key, value in request.headers.items()
-        if key.lower() not in HOP_BY_HOP_HEADERS
-    }
-    
     try:
-        body = await request.body()
+        await request.body()
     except Exception as e:
         return JSONResponse(
             status_code=400,
             content={"error": True, "code": 400, "errorMessage": f"Invalid request body: {str(e)}"}
         )
 
-    # Send query to ArangoDB
-    try:
-        response = await run.io_bound(
-            requests.get,
-            proxy_url,
-            headers=headers
+    return await arangodb_proxy(
+        request, "GET", proxy_url, timeout=timeout, coalesce=True
+    )
+
+def _etag(content:bytes) -> str:
+    """
+    A weak ETag for a body, weak because the same body may be sent compressed in
+    different ways
+    """
+    return f'W/"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+def _etag_matches(if_none_match:str, etag:str) -> bool:
+    """
+    True if the If-None-Match header of a request matches etag, using the weak
+    comparison that is required for If-None-Match
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque
+        for tag in if_none_match.split(",")
+    )
+
+async def arangodb_proxy_metadata(request:Request, proxy_url:str):
+    """
+    Proxy a GET of metadata that almost never changes. The response is kept for
+    API_METADATA_CACHE_TTL seconds and has an ETag, so a client that already has it
+    gets a 304 Not Modified back.
+
+    Args:
+        request [Request] : the fastapi request object
+        proxy_url [str] : The url to spoof
+    """
+    cache_key = (proxy_url, _auth_identity(request))
+    cached = METADATA_CACHE.get(cache_key)
+    if cached is None:
+        generation = METADATA_CACHE.generation
+        try:
+            response = await _arangodb_fetch(request, "GET", proxy_url)
+        except Exception as e:
+            return _proxy_error(
+                e, "Failed to fetch data from ArangoDB through the Proxy"
+            )
+
+        headers = _response_headers(response, decoded=True)
+        headers["etag"] = _etag(response.content)
+        headers["cache-control"] = "private, no-cache"
+        content, status_code = response.content, response.status_code
+        METADATA_CACHE.put(
+            cache_key,
+            content,
+            status_code=status_code,
+            headers=headers,
+            tags=(),
+            generation=generation
         )
-        response.raise_for_status()
-    except Exception as e:
-        response = JSONResponse(
-            status_code=500,
-            content={
-                'error': True,
-                "code": 500,
-                "errorMessage": f'Failed to fetch data from ArangoDB through the Proxy: {e}'
+    else:
+        content = cached.content
+        status_code, headers = cached.status_code, cached.headers
+
+    if _etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        NOT_MODIFIED.inc()
+        return Response(
+            status_code=304,
+            headers={
+                "etag": headers["etag"],
+                "cache-control": headers["cache-control"]
             }
         )
-        return response
 
-    json_resp = JSONResponse(
-        status_code=response.status_code,
-        content=response.json()
+    return _buffered_response(
+        request, content, status_code=status_code, headers=headers
     )
-    return json_resp
 
 @API_ROUTER.get(os.path.join(WEB_BASE_URL, "api", "_api/user/{user}/database"))
 async def api_db(user:str, request:Request):
     redirect_url = f"{API_URL}/_api/user/{user}/database"
-    return await arangodb_proxy_get(request, redirect_url)
+    return await arangodb_proxy_metadata(request, redirect_url)
     
 @API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/collection"))
 async def api_collection(db:str, request:Request):
     redirect_url = f"{API_URL}/_db/{db}/_api/collection"
-    return await arangodb_proxy_get(request, redirect_url)
+    return await arangodb_proxy_metadata(request, redirect_url)
     
 @API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/gharial"))
 async def api_gharial(db:str, request:Request):
     redirect_url = f"{API_URL}/_db/{db}/_api/gharial"
-    return await arangodb_proxy_get(request, redirect_url)
+    return await arangodb_proxy_metadata(request, redirect_url)
     
 # http://127.0.0.1:8080/api/_db/otter/_api/foxx?excludeSystem=False
 @API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/foxx"))
 async def api_foxx(db: str, request: Request):
     redirect_url = f"{API_URL}/_db/{db}/_api/foxx"
-    return await arangodb_proxy_get(request, redirect_url)
+    return await arangodb_proxy_metadata(request, redirect_url)
+
+async def _check_query_cost(
+        request:Request,
+        db:str,
+        query:str,
+        bind_vars:dict=None
+) -> Optional[JSONResponse]:
+    """
+    Ask ArangoDB to explain a query and return the error to send back if it is
+    estimated to be too expensive to run, or None if it can go ahead. Queries that
+    can not be explained are let through so ArangoDB reports what is wrong with them
+    when they are run.
+
+    Args:
+        request [Request] : the fastapi request object
+        db [str] : The database the query is run on
+        query [str] : The AQL query string
+        bind_vars [dict] : The bind parameters of the query
+    """
+    if not (API_AQL_MAX_COST or API_AQL_MAX_ITEMS):
+        return None
+
+    key = (db, query, json.dumps(bind_vars, sort_keys=True, default=str))
+    verdict = EXPLAIN_CACHE.get(key)
+    if verdict is None:
+        try:
+            response = await _arangodb_fetch(
+                request,
+                "POST",
+                f"{API_URL}/_db/{db}/_api/explain",
+                body=json.dumps({"query": query, "bindVars": bind_vars or {}}).encode(),
+                idempotent=True
+            )
+            plan = response.json().get("plan") or {}
+        except Exception:
+            return None
+        reason = check_plan(plan, API_AQL_MAX_COST, API_AQL_MAX_ITEMS)
+        EXPLAIN_CACHE.put(
+            key,
+            (reason or "").encode(),
+            status_code=200 if reason is None else 400,
+            tags=()
+        )
+    elif verdict.status_code == 200:
+        return None
+    else:
+        reason = verdict.content.decode()
+
+    if reason is None:
+        return None
+    AQL_REJECTED.inc()
+    return JSONResponse(
+        status_code=400,
+        content={
+            "error": True,
+            "code": 400,
+            "errorNum": 32, # ERROR_RESOURCE_LIMIT
+            "errorMessage": reason
+        }
+    )
+
+def _invalidate_written(db:str, query:str, bind_vars:dict=None) -> None:
+    """
+    Drop the cached results that a query which writes may have changed, or all of
+    them if the collections it writes to can not be worked out
+
+    Args:
+        db [str] : The database the query was run on
+        query [str] : The AQL query string
+        bind_vars [dict] : The bind parameters of the query
+    """
+    written = collections_written(query, bind_vars)
+    if written is None:
+        CURSOR_CACHE.clear()
+    else:
+        CURSOR_CACHE.invalidate(*(f"{db}/{collection}" for collection in written))
 
 @API_ROUTER.post(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/cursor"))
 async def api_proxy_cursor(db: str, request: Request):
     proxy_url = f"{API_URL}/_db/{db}/_api/cursor"
-    arango_resp = await arangodb_proxy_post(request, proxy_url)
-    return arango_resp
+    if not (API_AQL_GUARD or API_CURSOR_CACHE or API_COALESCE or API_CURSOR_PREFETCH):
+        return await arangodb_proxy_post(request, proxy_url)
+
+    try:
+        payload = await request.json()
+        query = payload["query"]
+    except Exception:
+        # let the regular proxy report the bad request
+        return await arangodb_proxy_post(request, proxy_url)
+
+    if not isinstance(query, str):
+        return await arangodb_proxy_post(request, proxy_url)
+
+    body = await request.body()
+    if API_AQL_GUARD:
+        try:
+            payload = with_limits(payload, API_AQL_MAX_RUNTIME, API_AQL_MEMORY_LIMIT)
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={"error": True, "code": 400, "errorMessage": str(e)}
+            )
+        rejection = await _check_query_cost(request, db, query, payload.get("bindVars"))
+        if rejection is not None:
+            return rejection
+        body = json.dumps(payload).encode()
+
+    if not is_read_only(query):
+        response = await arangodb_proxy(request, "POST", proxy_url, body=body)
+        _invalidate_written(db, query, payload.get("bindVars"))
+        return response
+
+    use_cache = API_CURSOR_CACHE and is_cacheable(query)
+    if use_cache:
+        options = {key: value for key, value in payload.items() if key != "query"}
+        cache_key = (
+            db,
+            _auth_identity(request),
+            normalize_query(query),
+            json.dumps(options, sort_keys=True, default=str)
+        )
+        cached = CURSOR_CACHE.get(cache_key)
+        if cached is not None:
+            return _buffered_response(
+                request,
+                cached.content,
+                status_code=cached.status_code,
+                headers=cached.headers | {"x-otter-cache": "hit"}
+            )
+
+    generation = CURSOR_CACHE.generation
+    try:
+        cursor = await _create_cursor(request, proxy_url, body)
+    except Exception as e:
+        return _proxy_error(e, "Failed to fetch data from ArangoDB through the Proxy")
+
+    if cursor.upstream is not None:
+        # too big to hold on to, so it is passed on as it arrives instead
+        return _streaming_response(
+            request,
+            cursor.upstream,
+            prefix=cursor.content,
+            chunks=cursor.chunks
+        )
+
+    content = cursor.content
+    if API_CURSOR_PREFETCH and cursor.has_more:
+        content = _read_ahead(
+            request,
+            db,
+            content,
+            ttl=payload.get("ttl"),
+            result=cursor.result
+        )
+
+    if not use_cache:
+        return _buffered_response(
+            request,
+            content,
+            status_code=cursor.status_code,
+            headers=cursor.headers
+        )
+
+    # only complete results can be cached, a cursor with more batches is stateful
+    if cursor.complete:
+        collections = collections_read(query, payload.get("bindVars"))
+        CURSOR_CACHE.put(
+            cache_key,
+            cursor.content,
+            status_code=cursor.status_code,
+            headers=cursor.headers,
+            tags=None if collections is None else {f"{db}/{c}" for c in collections},
+            generation=generation
+        )
+
+    return _buffered_response(
+        request,
+        content,
+        status_code=cursor.status_code,
+        headers=cursor.headers | {"x-otter-cache": "miss"}
+    )
 
 @API_ROUTER.put(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/collection/{collection}/truncate"))
 async def api_put_truncate(db: str, collection: str, request: Request):
     proxy_url = f"{API_URL}/_db/{db}/_api/collection/{collection}/truncate"
     arango_resp = await arangodb_proxy_put(request, proxy_url)
+    CURSOR_CACHE.invalidate(f"{db}/{collection}")
     return arango_resp
 
 @API_ROUTER.post(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/document/{collection}"))
 async def api_add_doc(db: str, collection:str, request: Request):
     proxy_url = f"{API_URL}/_db/{db}/_api/document/{collection}"
     arango_resp = await arangodb_proxy_post(request, proxy_url)
+    CURSOR_CACHE.invalidate(f"{db}/{collection}")
     return arango_resp
 
+async def _iter_ndjson(request:Request):
+    """
+    Yield the non-empty lines of a newline delimited JSON body as it is received
+    """
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def _iter_bulk_documents(request:Request):
+    """
+    Yield (document, error) pairs from a bulk import body, which is either a JSON
+    array of documents or one document per line. error is None unless that item
+    could not be parsed.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        async for line in _iter_ndjson(request):
+            try:
+                yield json.loads(line), None
+            except ValueError as e:
+                yield None, f"Invalid JSON document: {e}"
+        return
+
+    docs = json.loads(await request.body())
+    if not isinstance(docs, list):
+        raise ValueError("The body must be a JSON array of documents")
+    for doc in docs:
+        yield doc, None
+
+async def _import_batch(
+        request:Request,
+        proxy_url:str,
+        batch:list[tuple[int, dict]],
+        details:list
+) -> None:
+    """
+    Send one batch of documents to the ArangoDB document API and record the result
+    of each item in details. Unless ArangoDB answers with one result for each
+    document, every document in the batch is recorded as failed with its error.
+    """
+    body = json.dumps([doc for _, doc in batch]).encode()
+    failure = None
+    try:
+        response = await _arangodb_send(
+            request,
+            "POST",
+            proxy_url,
+            body=body,
+            headers={"content-type": "application/json"}
+        )
+        results = response.json()
+    except httpx.HTTPStatusError as e:
+        # the whole batch was turned away, e.g. the collection does not exist
+        try:
+            error = e.response.json()
+        except ValueError:
+            error = {}
+        if not isinstance(error, dict):
+            error = {}
+        failure = {
+            "errorNum": error.get("errorNum"),
+            "errorMessage": f"Batch failed: {error.get('errorMessage') or e}"
+        }
+    except Exception as e:
+        failure = {"errorNum": None, "errorMessage": f"Batch failed: {e}"}
+    else:
+        if (
+                not isinstance(results, list)
+                or len(results) != len(batch)
+                or not all(isinstance(result, dict) for result in results)
+        ):
+            failure = {
+                "errorNum": None,
+                "errorMessage": (
+                    f"Batch failed: ArangoDB answered {response.status_code} "
+                    f"without a result for each of the {len(batch)} documents"
+                )
+            }
+    if failure is not None:
+        results = [{"error": True, **failure}]*len(batch)
+
+    for (index, _), result in zip(batch, results):
+        if result.get("error", False):
+            details.append({
+                "index": index,
+                "error": True,
+                "errorNum": result.get("errorNum"),
+                "errorMessage": result.get("errorMessage")
+            })
+        else:
+            details.append({
+                "index": index,
+                "error": False,
+                "_id": result.get("_id"),
+                "_key": result.get("_key")
+            })
+
+@API_ROUTER.post(
+    os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/document/{collection}/bulk")
+)
+async def api_bulk_import(db: str, collection: str, request: Request):
+    """
+    Import many documents at once. The body is a JSON array of documents, or one
+    document per line with a content type of application/x-ndjson, which is read as
+    it arrives. The documents are sent to ArangoDB in batches of batchSize (a query
+    parameter) and the result is a summary with the outcome of each item by its
+    position in the body. Other query parameters are passed on to ArangoDB.
+    """
+    params = dict(request.query_params)
+    try:
+        batch_size = int(params.pop("batchSize", API_BULK_BATCH_SIZE))
+    except ValueError:
+        batch_size = 0
+    if batch_size <= 0:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "code": 400,
+                "errorMessage": "batchSize must be a positive integer"
+            }
+        )
+
+    proxy_url = str(
+        httpx.URL(f"{API_URL}/_db/{db}/_api/document/{collection}", params=params)
+    )
+
+    details = []
+    batch = []
+    try:
+        index = 0
+        async for doc, error in _iter_bulk_documents(request):
+            if error is not None:
+                details.append({
+                    "index": index,
+                    "error": True,
+                    "errorNum": None,
+                    "errorMessage": error
+                })
+            else:
+                batch.append((index, doc))
+            index += 1
+
+            if len(batch) >= batch_size:
+                await _import_batch(request, proxy_url, batch, details)
+                batch = []
+
+        if batch:
+            await _import_batch(request, proxy_url, batch, details)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "code": 400,
+                "errorMessage": f"Invalid JSON body: {str(e)}"
+            }
+        )
+    finally:
+        CURSOR_CACHE.invalidate(f"{db}/{collection}")
+
+    details.sort(key=lambda item: item["index"])
+    errors = sum(item["error"] for item in details)
+    return JSONResponse(
+        status_code=200,
+        content={
+            "error": errors > 0,
+            "code": 200,
+            "created": len(details) - errors,
+            "errors": errors,
+            "details": details
+        }
+    )
+
+async def _next_export_batch(request:Request, db:str, cursor_id:str) -> dict:
+    """
+    Read the next batch of an export cursor. This is not retried since the cursor
+    may have moved on even if the response never arrived.
+    """
+    response = await _arangodb_fetch(
+        request,
+        "PUT",
+        f"{API_URL}/_db/{db}/_api/cursor/{cursor_id}",
+        coalesce=False,
+        idempotent=False
+    )
+    return response.json()
+
+async def _iter_export(request:Request, db:str, batch:dict):
+    """
+    Yield the documents of an open cursor as newline delimited JSON, starting from
+    the first batch it was created with. The next batch is fetched while the current
+    one is sent, so no more than two batches are held at once. If ArangoDB fails part
+    way through the last line is an error object, since the status code has already
+    been sent, and a cursor the client stops reading early is deleted.
+
+    Args:
+        request [Request] : the fastapi request object
+        db [str] : The database the cursor is in
+        batch [dict] : The response that created the cursor
+    """
+    pending = None
+    try:
+        while True:
+            if batch.get("hasMore"):
+                pending = asyncio.ensure_future(
+                    _next_export_batch(request, db, batch["id"])
+                )
+            lines = b"".join(
+                json.dumps(doc).encode() + b"\n" for doc in batch.get("result", [])
+            )
+            if lines:
+                yield lines
+            if pending is None:
+                return
+            batch = await pending
+            pending = None
+    except Exception as e:
+        logger.warning(f"NDJSON export from {db} failed part way through: {e}")
+        error = {"error": True, "code": 500, "errorMessage": f"Export failed: {e}"}
+        yield json.dumps(error).encode() + b"\n"
+    finally:
+        if pending is not None:
+            pending.cancel()
+        if batch.get("hasMore"):
+            try:
+                await _arangodb_send(
+                    request,
+                    "DELETE",
+                    f"{API_URL}/_db/{db}/_api/cursor/{batch['id']}"
+                )
+            except Exception:
+                pass
+
+@API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/_db/{db}/export"))
+async def api_export(db: str, request: Request):
+    """
+    Stream the transients matching the search page filters given in the query
+    string (names, ra, dec, ra_unit, radius, minz, maxz, mindec, maxdec,
+    classification, hasphot and so on, see otter_web.selection) as newline delimited
+    JSON, one document per line. names and refs can be given more than once to match
+    any of them. The documents are read from ArangoDB batchSize at a time as they are
+    sent, so the export can be as big as the catalog.
+    """
+    params = [
+        (key, value)
+        for key, value in request.query_params.multi_items()
+        if key != "batchSize"
+    ]
+    try:
+        batch_size = int(request.query_params.get("batchSize", API_EXPORT_BATCH_SIZE))
+        if batch_size <= 0:
+            raise ValueError("batchSize must be a positive integer")
+        query, bind_vars = transient_query(**parse_filters(params))
+    except Exception as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": True, "code": 400, "errorMessage": f"Invalid export: {e}"}
+        )
+
+    body = {
+        "query": query,
+        "bindVars": bind_vars,
+        "batchSize": batch_size,
+        "ttl": API_EXPORT_CURSOR_TTL,
+        "options": {"stream": True}
+    }
+    try:
+        response = await _arangodb_fetch(
+            request,
+            "POST",
+            f"{API_URL}/_db/{db}/_api/cursor",
+            body=json.dumps(body).encode(),
+            coalesce=False,
+            idempotent=True
+        )
+        batch = response.json()
+    except Exception as e:
+        return _proxy_error(e, "Failed to start the export from ArangoDB")
+
+    headers = {"content-type": "application/x-ndjson"}
+    chunks = _iter_export(request, db, batch)
+    if API_COMPRESS:
+        headers["vary"] = "Accept-Encoding"
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        if encoding is not None:
+            chunks = compress_stream(chunks, encoding)
+            headers["content-encoding"] = encoding
+
+    return StreamingResponse(chunks, status_code=200, headers=headers)
+
 @API_ROUTER.post(os.path.join(WEB_BASE_URL, "api/_open/auth"))
 async def get_jwt_token(request:Request):
     proxy_url = f"{API_URL}/_open/auth"
     print(proxy_url)
-    arango_resp = await arangodb_proxy_post(request, proxy_url)
-    return arango_resp
+    if not API_TOKEN_CACHE:
+        return await arangodb_proxy_post(request, proxy_url)
+
+    try:
+        key = TOKENS.key(await request.json())
+        body = await request.body()
+    except Exception:
+        # let the regular proxy report the bad request
+        key = None
+    if key is None:
+        return await arangodb_proxy_post(request, proxy_url)
+
+    login = TOKENS.get(key)
+    if login is not None:
+        return _buffered_response(
+            request,
+            login.content,
+            status_code=200,
+            headers=login.headers | {"x-otter-cache": "hit"}
+        )
+
+    try:
+        response = await _login(request, key, body)
+    except Exception as e:
+        return _proxy_error(e, "Failed to fetch data from ArangoDB through the Proxy")
+
+    return _buffered_response(
+        request,
+        response.content,
+        status_code=response.status_code,
+        headers=_response_headers(response, decoded=True) | {"x-otter-cache": "miss"}
+    )
 
 @API_ROUTER.put(os.path.join(WEB_BASE_URL, "api/_db/{db}/_api/cursor/{cursor_id}"))
 async def api_cursor_next_batch(db: str, cursor_id: str, request: Request):
     """Fetch the next batch from an existing cursor (used by pyArango pagination)."""
     proxy_url = f"{API_URL}/_db/{db}/_api/cursor/{cursor_id}"
-    headers = {
-        key: value
-        for key, value in request.headers.items()
-        if key.lower() not in HOP_BY_HOP_HEADERS
-    }
 
     # Read body if present, but don't require it — pyArango sends no body for cursor advancement
     try:
-        body = await request.json()
+        await request.json()
+        body = await request.body()
     except Exception:
         body = None
 
-    try:
-        response = await run.io_bound(
-            requests.put,
-            proxy_url,
-            headers=headers,
-            **({"json": body} if body is not None else {})
+    if API_CURSOR_PREFETCH:
+        worker, upstream_id = READ_AHEAD.parse(cursor_id)
+        if worker is not None:
+            return await _read_ahead_next_batch(request, db, worker, upstream_id, body)
+
+    return await arangodb_proxy(
+        request,
+        "PUT",
+        proxy_url,
+        body=body,
+        error_message="Failed to advance cursor"
+    )
+
+async def _read_ahead_next_batch(
+        request:Request,
+        db:str,
+        worker:str,
+        cursor_id:str,
+        body:bytes=None
+):
+    """
+    Hand the client the batch that was already fetched for a read ahead cursor, or
+    fetch it now if there is not one, and start on the batch after that
+
+    Args:
+        request [Request] : the fastapi request object
+        db [str] : The database the cursor is in
+        worker [str] : The worker the cursor id says holds the cursor
+        cursor_id [str] : The ArangoDB cursor id
+        body [bytes] : The raw body from the client, if there was one
+    """
+    if worker != READ_AHEAD.worker:
+        # another worker has advanced this cursor, so going to ArangoDB from here
+        # would skip the batch it holds
+        return JSONResponse(
+            status_code=421,
+            content={
+                "error": True,
+                "code": 421,
+                "errorMessage": f"Cursor {cursor_id} is held by worker {worker}, "
+                                "requests for it must be routed to that worker"
+            }
         )
-        response.raise_for_status()
-    except Exception as e:
+
+    cursor = READ_AHEAD.get(cursor_id)
+    if cursor is not None and cursor.identity != _auth_identity(request):
         return JSONResponse(
-            status_code=500,
-            content={"error": True, "code": 500, "errorMessage": f"Failed to advance cursor: {e}"}
+            status_code=404,
+            content={
+                "error": True,
+                "code": 404,
+                "errorNum": 1600,
+                "errorMessage": "cursor not found"
+            }
         )
-    return JSONResponse(status_code=response.status_code, content=response.json())
+
+    ttl = cursor.ttl if cursor is not None else None
+    batch = READ_AHEAD.take(cursor_id)
+    try:
+        if batch is not None:
+            response = await batch
+        else:
+            response = await _arangodb_fetch(
+                request,
+                "PUT",
+                f"{API_URL}/_db/{db}/_api/cursor/{cursor_id}",
+                body=body,
+                coalesce=False
+            )
+    except httpx.HTTPStatusError as e:
+        # e.g. the cursor expired, the client gets ArangoDB's own answer for it
+        return _buffered_response(
+            request,
+            e.response.content,
+            status_code=e.response.status_code,
+            headers=_response_headers(e.response, decoded=True)
+        )
+    except Exception as e:
+        return _proxy_error(e, "Failed to advance cursor")
+
+    return _buffered_response(
+        request,
+        _read_ahead(request, db, response.content, ttl=ttl),
+        status_code=response.status_code,
+        headers=_response_headers(response, decoded=True)
+    )
@@ -6,7 +6,8 @@ import logging
 from nicegui import ui, app
 from ..theme import frame
 from ..config import API_URL, WEB_BASE_URL
-from .search_util import SearchInput
+from .search_util import SearchInput, name_input
+from ..upstream import call_upstream, CircuitOpen
 
 from otter import Otter, Transient
 
@@ -98,11 +99,7 @@ _Disclaimer:_ We have done our best include every possible citation. But, as you
             After you press submit, it will download a bibtex file with all of the
             appropriate citations"""
         ).style("font-size:150%;")
-        names = ui.input(
-            'Transient Name',
-            placeholder='Enter a transient name or partial name',
-            on_change = search_input.add_name
-        )
+        name_input(search_input)
     
         ui.button(
             "Download Citations",
@@ -147,7 +144,15 @@ def generate_bibtex_file(names):
         close_button=True
     )
 
-    transients = db.query(names=names)
+    try:
+        transients = call_upstream(db.query, names=names)
+    except CircuitOpen as exc:
+        ui.notify(
+            f"Only the OTTER citation could be generated! {exc}",
+            position="center",
+            type="negative"
+        )
+        return OTTER_BIBTEX.encode("utf-8")
 
     all_bibcodes = []    
     for t in transients:
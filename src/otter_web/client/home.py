@@ -11,7 +11,9 @@ from ..theme import frame
 from ..config import API_URL, WEB_BASE_URL
 
 from .transient_pages import *
-from .search_util import SearchResults, simple_form, _post_table
+from .search_util import (
+    SearchResults, simple_form, _post_table, download_results_button
+)
 
 from otter import Otter, Transient
 
@@ -71,9 +73,6 @@ async def page():
         ui.label("Search Results").classes("text-h4")
         post_table([]) # start with an empty results table
 
-        ui.button(
-            "Download Results",
-            on_click=lambda: search_results.write_results_to_zip()
-        )
+        download_results_button(search_results)
 
     
@@ -0,0 +1,90 @@
+"""
+Request timing for every route and a /metrics endpoint in the Prometheus text format
+"""
+import os
+import hmac
+import time
+
+from nicegui import app, Client
+from fastapi import Request
+from fastapi.responses import Response
+
+from ..config import WEB_BASE_URL, METRICS_TOKEN
+from ..metrics import (
+    REGISTRY,
+    CONTENT_TYPE,
+    HTTP_REQUESTS,
+    HTTP_LATENCY,
+    HTTP_BYTES_IN,
+    HTTP_BYTES_OUT,
+    PAGE_RENDER
+)
+
+class MetricsMiddleware:
+    """
+    Time every HTTP request and count the bytes going in and out, labelled by the
+    route template (e.g. /transient/{transient_name}) so each page and API route gets
+    its own series. This is plain ASGI middleware so that streamed responses are timed
+    until the last byte is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats = {"status": 500, "bytes_in": 0, "bytes_out": 0}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                stats["bytes_in"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                stats["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                stats["bytes_out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            elapsed = time.perf_counter() - start
+
+            # the router fills in the matched route, unmatched paths are lumped
+            # together so random urls can not blow up the number of series
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+
+            HTTP_REQUESTS.inc(route=route, method=method, status=stats["status"])
+            HTTP_LATENCY.observe(elapsed, route=route, method=method)
+            HTTP_BYTES_IN.inc(stats["bytes_in"], route=route)
+            HTTP_BYTES_OUT.inc(stats["bytes_out"], route=route)
+            if route in Client.page_routes.values():
+                PAGE_RENDER.observe(elapsed, page=route)
+
+app.add_middleware(MetricsMiddleware)
+
+@app.get(os.path.join(WEB_BASE_URL, "metrics"), include_in_schema=False)
+def metrics(request:Request) -> Response:
+    """
+    The metrics, for requests with the bearer token METRICS_TOKEN
+
+    Args:
+        request [Request] : the fastapi request object
+    """
+    if not METRICS_TOKEN:
+        return Response(status_code=404)
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+            token.strip().encode(), METRICS_TOKEN.encode()
+    ):
+        return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
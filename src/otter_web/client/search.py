@@ -7,7 +7,7 @@ from ..theme import frame
 from ..config import API_URL, WEB_BASE_URL
 from ..models import TransientRead
 
-from .search_util import _post_table, SearchResults, show_form
+from .search_util import _post_table, SearchResults, show_form, download_results_button
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +43,4 @@ async def search():
         ui.label("Search Results").classes("text-h4")
         post_table([]) # start with an empty results table
 
-        ui.button(
-            "Download Results",
-            on_click=lambda: search_results.write_results_to_zip()
-        )
+        download_results_button(search_results)
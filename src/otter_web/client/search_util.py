@@ -1,26 +1,201 @@
 import os
-import io
-import zipfile
 import json
+import time
+import asyncio
 import logging
-import datetime
-from typing import List
+import threading
+from typing import AsyncIterator, Iterator, List, Optional
+from urllib.parse import urlencode
 
-from nicegui import ui, events
+from nicegui import ui, app, events, run, background_tasks
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from ..theme import frame
-from ..config import API_URL, WEB_BASE_URL
-from ..models import TransientRead
+from ..config import (
+    API_URL,
+    WEB_BASE_URL,
+    TABLE_SERVER_SIDE_ROWS,
+    API_AQL_GUARD,
+    API_AQL_MAX_COST,
+    API_AQL_MAX_ITEMS,
+    API_AQL_MEMORY_LIMIT,
+    API_AQL_INTERACTIVE_LIMIT,
+    API_AQL_INTERACTIVE_MAX_RUNTIME,
+    CATALOG_SNAPSHOT,
+    CATALOG_SNAPSHOT_REFRESH,
+    NAME_SUGGESTIONS,
+    SEARCH_TIMEOUT,
+    AQL_EDITOR_DEBOUNCE,
+    AQL_EDITOR_BATCH_SIZE,
+    RESULTS_ZIP_BATCH_SIZE,
+    EXPORT_CHUNK_SIZE
+)
+from ..upstream import call_upstream, CircuitOpen
+from .api import API_ROUTER
+from ..aql import QueryRejected, add_limit, check_plan
+from ..tables import transient_rows, default_name, ResultIndex
+from ..catalog import CatalogSnapshot, FETCH_BATCH_SIZE
+from ..selection import META_KEYS, parse_filters, search_coords, transient_query
+from ..zipstream import ZipStream
+from .. import columnar
 
 from functools import partialmethod, partial
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from astropy.coordinates import SkyCoord
 
 from otter import Otter, Transient, util
+from pyArango.theExceptions import AQLQueryError, pyArangoException
 
 logger = logging.getLogger(__name__)
 db = Otter(url=API_URL)
 
+def _snapshot_query(query:str, bind_vars:dict) -> list[dict]:
+    return call_upstream(
+        db.AQLQuery,
+        query,
+        bindVars=bind_vars,
+        rawResults=True,
+        batchSize=FETCH_BATCH_SIZE
+    )
+
+CATALOG = CatalogSnapshot(_snapshot_query)
+
+async def refresh_catalog() -> None:
+    if not CATALOG_SNAPSHOT:
+        return
+    try:
+        await run.io_bound(CATALOG.refresh)
+    except Exception as e:
+        logger.warning(f"Could not refresh the catalog snapshot: {e}")
+
+if CATALOG_SNAPSHOT:
+    app.timer(CATALOG_SNAPSHOT_REFRESH, refresh_catalog)
+
+@dataclass
+class SearchProgress:
+    """
+    How far a search running in a worker thread has got, and a way to stop it. The
+    search stops between batches once it is cancelled or past its deadline, and
+    returns what it has fetched so far.
+    """
+    deadline: Optional[float] = None
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    fetched: int = 0
+    total: Optional[int] = None
+    partial: bool = False
+
+    def stopped(self) -> bool:
+        return self.cancelled.is_set() or (
+            self.deadline is not None and time.monotonic() >= self.deadline
+        )
+
+def get_meta(progress:SearchProgress=None, **kwargs) -> list[Transient]:
+    """
+    The metadata of the transients matching the search, like otter.Otter.get_meta.
+    The matching transients are found in the catalog snapshot when it is loaded and
+    only their documents are fetched, otherwise the search is run in ArangoDB, where
+    it is killed if it runs past the deadline of progress.
+
+    Args:
+        progress [SearchProgress] : Where to report progress to, and the deadline
+        **kwargs : The filters, see otter.Otter.query
+    """
+    keys = CATALOG.search(**kwargs) if CATALOG_SNAPSHOT else None
+    if keys is None:
+        if progress is not None and progress.deadline is not None:
+            remaining = progress.deadline - time.monotonic()
+            kwargs["options"] = {"maxRuntime": max(remaining, 0.001)}
+        return db.get_meta(**kwargs)
+
+    if progress is not None:
+        progress.total = len(keys)
+    return fetch_transients(keys.tolist(), keep=META_KEYS, progress=progress)
+
+def fetch_transients(
+        keys:list[str],
+        keep:list[str]=None,
+        otter:Otter=None,
+        progress:SearchProgress=None,
+        batch_size:int=FETCH_BATCH_SIZE
+) -> list[Transient]:
+    """
+    The transients with the given keys, in the same order, skipping any that have
+    been deleted
+
+    Args:
+        keys [list[str]] : The _key of each transient
+        keep [list[str]] : Only fetch these top level keys, default is all of them.
+                           The _key is only left in if it is one of them
+        otter [Otter] : The connection to fetch them with, default is db
+        progress [SearchProgress] : Where to report progress to. If the search is
+                                    stopped only the transients fetched so far are
+                                    returned, and progress.partial is set
+        batch_size [int] : The number of transients to fetch at a time
+    """
+    otter = db if otter is None else otter
+    if keep is None:
+        query = """
+        FOR transient IN transients
+            FILTER transient._key IN @keys
+            RETURN transient
+        """
+        bind_vars = {}
+    else:
+        query = """
+        FOR transient IN transients
+            FILTER transient._key IN @keys
+            RETURN MERGE(KEEP(transient, @keep), {_key: transient._key})
+        """
+        bind_vars = {"keep": keep}
+
+    docs = {}
+    for i in range(0, len(keys), batch_size):
+        if progress is not None and progress.stopped():
+            progress.partial = True
+            break
+        batch = keys[i:i + batch_size]
+        for doc in otter.AQLQuery(
+                query,
+                bindVars=bind_vars | {"keys": batch},
+                rawResults=True,
+                batchSize=batch_size
+        ):
+            key = doc["_key"] if keep is None or "_key" in keep else doc.pop("_key")
+            docs[key] = Transient(doc)
+        if progress is not None:
+            progress.fetched = len(docs)
+
+    return [docs[key] for key in keys if key in docs]
+
+def cone_search(
+        coords:SkyCoord,
+        radius:float=5,
+        otter:Otter=None,
+        snapshot:bool=True
+) -> list[Transient]:
+    """
+    The full documents of the transients within radius of a position, like
+    otter.Otter.query(coords=coords, radius=radius). The transients are found with the
+    spatial index of the catalog snapshot when it is loaded, otherwise the search is
+    run in ArangoDB.
+
+    Args:
+        coords [SkyCoord] : The position to search around
+        radius [float] : The radius, in arcseconds
+        otter [Otter] : The connection to fetch the documents with, default is db
+        snapshot [bool] : Set to False to always search ArangoDB, for checks before
+                          a write that can not rely on a snapshot that may be out
+                          of date (or behind another worker's writes)
+    """
+    keys = (
+        CATALOG.cone(coords.ra.deg, coords.dec.deg, radius)
+        if CATALOG_SNAPSHOT and snapshot else None
+    )
+    if keys is None:
+        return (db if otter is None else otter).query(coords=coords, radius=radius)
+    return fetch_transients(keys.tolist(), otter=otter)
+
 class SearchInput:
 
     def __init__(self):
@@ -61,36 +236,41 @@ class SearchInput:
 @dataclass
 class SearchResults:
     results: list[dict]
+    # the search running for this page, which a new one replaces
+    search: Optional[asyncio.Task] = None
+    # the filters of the search the results are from
+    filters: Optional[dict] = None
 
     @ui.refreshable
-    def write_results_to_zip(self):
+    def write_results_to_zip(self, full:bool=False):
         """
-        Writes the search results to a zipfile in memory to stage for download
+        Download the search results as a zip of one JSON file per transient. The
+        archive is streamed from results_zip as it is written, so the download starts
+        straight away however many results there are.
 
-        Modified from https://stackoverflow.com/questions/2463770/python-in-memory-zip-library
+        Args:
+            full [bool] : If True, download the full documents instead of the metadata
         """
-        if self.results is None:
+        if self.results is None or self.filters is None:
             ui.notify("You must do a search to download search results!")
             return
 
-        zip_buffer = io.BytesIO()
+        ui.download(results_zip_url(self.filters, full=full), "search-results.zip")
 
-        with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-            for data in self.results:
-                file_name = f"{data.default_name}.json"
-                file_str = io.BytesIO(
-                    bytes(
-                        json.dumps(dict(data), indent=4),
-                        encoding="utf-8"
-                    )
-                )
-                zip_file.writestr(file_name, file_str.getvalue())
+    def export_results(self, fmt:str, photometry:bool=False):
+        """
+        Download the search results as a table, see export_results
 
+        Args:
+            fmt [str] : The format, one of columnar.FORMATS
+            photometry [bool] : If True, also download the cleaned photometry, in a
+                                zip with the table of the transients
+        """
+        if self.results is None or self.filters is None:
+            ui.notify("You must do a search to download search results!")
+            return
 
-        ui.download(
-            zip_buffer.getvalue(),
-            "search-results.zip"
-        )
+        ui.download(export_url(self.filters, fmt, photometry=photometry))
 
 def _post_table(events:List[dict]) -> None:
     columns = [
@@ -130,53 +310,44 @@ def _post_table(events:List[dict]) -> None:
             ":format":"value => (value != '0001-01-01T00:00:00') ? new Date(value).toLocaleString('default', {year: 'numeric', month: 'long', day: 'numeric'}) : 'No Date'"},
     ]
 
-    rows = []
-    for i, event_json in enumerate(events):
-        event = TransientRead(**event_json)
-        try:
-            disc_date = Transient(event_json).get_discovery_date()
-        except (KeyError, TypeError):
-            disc_date = None
-            
-        coord_string = SkyCoord(
-            event.coordinate[0].ra, event.coordinate[0].dec, unit=(
-                event.coordinate[0].ra_units,
-                event.coordinate[0].dec_units
-            )
-        ).to_string("hmsdms", sep=":", precision=2)
+    pagination = {
+        'rowsPerPage': 10,
+        'sortBy': 'date',
+        'descending': True
+    }
+    server_side = len(events) > TABLE_SERVER_SIDE_ROWS
+    if server_side:
+        index = ResultIndex(events)
+        pagination |= {'page': 1, 'rowsNumber': len(index)}
+        rows = index.page(1, 10, sort_by='date', descending=True)
+    else:
+        rows = transient_rows(events)
 
-        try:
-            default_class = Transient(event_json).get_classification()[0]
-        except Exception:
-            default_class = None
-        
-        rows.append(
-            {
-                "id": f"{i}",
-                "name": event.name.default_name,
-                "class": default_class if default_class is not None else "Unknown Class",
-                "ra": coord_string.split(" ")[0],
-                "dec": coord_string.split(" ")[1],
-                "date": (
-                    disc_date.datetime
-                    if disc_date is not None
-                    else datetime.datetime(1,1,1)
-                ),
-            }
-        )
-    
     table = (
         ui.table(
             columns=columns, rows=rows,
             row_key="id",
-            pagination={
-                'rowsPerPage': 10,
-                'sortBy': 'date',
-                'descending': True
-            }
+            pagination=pagination
         ).props("flat").classes("w-full")
     )
 
+    if server_side:
+        # giving the table a rowsNumber makes it ask for every page it shows
+        def load_page(e):
+            request = e.args['pagination']
+            # never build every row, whatever the browser asks for
+            request['rowsPerPage'] = min(request['rowsPerPage'] or 100, 100)
+            table.rows = index.page(
+                request['page'],
+                request['rowsPerPage'],
+                sort_by=request.get('sortBy'),
+                descending=request.get('descending', False)
+            )
+            table.pagination = request | {'rowsNumber': len(index)}
+
+        table.props(':rows-per-page-options="[10, 25, 50, 100]"')
+        table.on('request', load_page, ['pagination'])
+
     table.add_slot(
         'body-cell-title',
         r'<td><a :href="props.row.url">{{ props.row.title }}</a></td>'
@@ -206,7 +377,30 @@ async def _row_click_navigate(e, open_new_tab=True):
     )
 
         
-def do_search(search_input, search_results, post_table):
+def _search_status(progress:SearchProgress, elapsed:float) -> str:
+    status = f"Searching... {elapsed:.1f}s"
+    if progress.total is not None:
+        status += f", fetched {progress.fetched} of {progress.total} transients"
+    return status
+
+async def do_search(search_input, search_results, post_table, status=None):
+    """
+    Run the search in a worker thread, so the page stays responsive for everyone
+    else while it runs. A new search from the same page cancels the one it replaces,
+    and a search still running SEARCH_TIMEOUT seconds in is stopped and shows what it
+    has found so far.
+
+    Args:
+        search_input [SearchInput] : The filters of the search
+        search_results [SearchResults] : Where the results are kept for downloading
+        post_table [ui.refreshable] : Shows the results
+        status [ui.label] : Shows the progress and time taken, if given
+    """
+    previous = search_results.search
+    if previous is not None and not previous.done():
+        previous.cancel()
+    search_results.search = asyncio.current_task()
+
     ui.notify('Search Initiated...')
 
     # do some validation
@@ -224,7 +418,7 @@ def do_search(search_input, search_results, post_table):
             ui.notify(
                 'If RA or Dec is provided then the RA, Dec, RA Unit, and Dec Unit must all be provided!'
             )
-        
+            return
             
     # now do some cleaning
     if 'ra' in search_input.search_kwargs:
@@ -238,23 +432,431 @@ def do_search(search_input, search_results, post_table):
         )
 
     logger.debug(search_input.search_kwargs)
-    res = db.get_meta(**search_input.search_kwargs)
+    start = time.monotonic()
+    progress = SearchProgress(
+        deadline=start + SEARCH_TIMEOUT if SEARCH_TIMEOUT > 0 else None
+    )
+    search = asyncio.ensure_future(
+        run.io_bound(
+            call_upstream,
+            get_meta,
+            progress=progress,
+            **search_input.search_kwargs
+        )
+    )
+    try:
+        while not search.done():
+            await asyncio.wait({search}, timeout=0.25)
+            elapsed = time.monotonic() - start
+            if status is not None:
+                status.set_text(_search_status(progress, elapsed))
+            # the worker only checks the deadline between batches, so give up
+            # waiting on it if a single call to ArangoDB hangs well past it
+            if progress.deadline is not None and elapsed > 2*SEARCH_TIMEOUT:
+                progress.cancelled.set()
+                search.cancel()
+                ui.notify(
+                    f"Search timed out after {elapsed:.0f}s!", type="negative"
+                )
+                if status is not None:
+                    status.set_text(f"Search timed out after {elapsed:.0f}s")
+                return
+        res = search.result()
+    except asyncio.CancelledError:
+        # replaced by a newer search, which now owns the status label
+        progress.cancelled.set()
+        search.cancel()
+        raise
+    except AQLQueryError as e:
+        if progress.stopped():
+            message = f"Search timed out after {SEARCH_TIMEOUT:.0f}s!"
+        else:
+            message = f"Search failed! {e}"
+        ui.notify(message, type="negative")
+        if status is not None:
+            status.set_text(message)
+        return
+    except CircuitOpen as e:
+        ui.notify(f"Search failed! {e}", type="negative")
+        if status is not None:
+            status.set_text("")
+        return
+    if res is None:
+        # the app is shutting down
+        return
+
+    elapsed = time.monotonic() - start
     search_results.results = res
+    search_results.filters = dict(search_input.search_kwargs)
     # logger.info(res)
     post_table.refresh(res)
-    ui.notify("Search Completed!")
+    if progress.partial:
+        message = (
+            f"Search timed out after {elapsed:.1f}s, showing the first {len(res)} of "
+            f"{progress.total} results"
+        )
+        ui.notify(message, type="warning")
+    else:
+        message = f"Found {len(res)} transients in {elapsed:.1f}s"
+        ui.notify("Search Completed!")
+    if status is not None:
+        status.set_text(message)
+
+def _filter_params(filters:dict) -> list[tuple]:
+    """
+    The query string parameters that parse_filters reads the filters back from
+    """
+    params = []
+    for key, value in filters.items():
+        if key == "coords" or value is None:
+            continue
+        for one in value if isinstance(value, list) else [value]:
+            params.append((key, int(one) if isinstance(one, bool) else one))
+    return params
+
+def results_zip_url(filters:dict, full:bool=False) -> str:
+    """
+    The url results_zip downloads the results of a search from
+
+    Args:
+        filters [dict] : The search_kwargs of the search
+        full [bool] : If True, download the full documents instead of the metadata
+    """
+    params = _filter_params(filters)
+    if full:
+        params.append(("full", 1))
+    url = os.path.join(WEB_BASE_URL, "api/search/results.zip")
+    return url + "?" + urlencode(params)
+
+def export_url(filters:dict, fmt:str, photometry:bool=False) -> str:
+    """
+    The url export_results downloads the results of a search from
+
+    Args:
+        filters [dict] : The search_kwargs of the search
+        fmt [str] : The format, one of columnar.FORMATS
+        photometry [bool] : If True, also download the cleaned photometry
+    """
+    params = _filter_params(filters) + [("format", fmt)]
+    if photometry:
+        params.append(("photometry", 1))
+    return os.path.join(WEB_BASE_URL, "api/search/export") + "?" + urlencode(params)
+
+def _result_keys(filters:dict) -> Iterator[list[str]]:
+    """
+    The keys of the transients matching the filters, FETCH_BATCH_SIZE at a time,
+    from the catalog snapshot if it is loaded or else read off a cursor
+    """
+    coords = None
+    if "ra" in filters and "dec" in filters:
+        coords = search_coords(
+            filters["ra"], filters["dec"], filters.get("ra_unit", "deg")
+        )
+    keys = CATALOG.search(coords=coords, **filters) if CATALOG_SNAPSHOT else None
+    if keys is not None:
+        keys = keys.tolist()
+        for i in range(0, len(keys), FETCH_BATCH_SIZE):
+            yield keys[i:i + FETCH_BATCH_SIZE]
+        return
+
+    query, bind_vars = transient_query(**filters, returns="transient._key")
+    cursor = call_upstream(
+        db.AQLQuery,
+        query,
+        bindVars=bind_vars,
+        rawResults=True,
+        batchSize=FETCH_BATCH_SIZE,
+        options={"stream": True}
+    )
+    try:
+        while True:
+            yield list(cursor.response.get("result") or [])
+            try:
+                call_upstream(cursor.nextBatch, idempotent=False)
+            except StopIteration:
+                return
+    finally:
+        if cursor.response.get("hasMore"):
+            _delete_cursor(cursor)
+
+def _iter_results_zip(filters:dict, full:bool) -> Iterator[bytes]:
+    """
+    The zip of the transients matching the filters, a few files at a time. The keys
+    are found first and the documents are fetched by key in small batches as they are
+    written, so only one batch is ever held in memory.
+    """
+    archive = ZipStream()
+    keep = None if full else META_KEYS
+    batch_size = RESULTS_ZIP_BATCH_SIZE if full else FETCH_BATCH_SIZE
+    try:
+        for keys in _result_keys(filters):
+            for i in range(0, len(keys), batch_size):
+                for doc in fetch_transients(
+                        keys[i:i + batch_size],
+                        keep=keep,
+                        batch_size=batch_size
+                ):
+                    yield archive.add(
+                        f"{default_name(doc)}.json",
+                        json.dumps(dict(doc), indent=4).encode("utf-8")
+                    )
+    except Exception as e:
+        # the download has already started, so say what went wrong in the archive
+        logger.warning(f"Zip download of search results failed part way through: {e}")
+        message = f"The download failed part way through: {e}\n"
+        yield archive.add("ERROR.txt", message.encode())
+    yield archive.close()
+
+@API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/search/results.zip"))
+async def results_zip(request:Request, full:bool=False):
+    """
+    Download the transients matching the search page filters given in the query
+    string (the same ones as api/_db/{db}/export) as a zip of one JSON file per
+    transient, with the metadata the search page shows or, with full=1, the full
+    documents. The archive is streamed as it is written.
+    """
+    params = [
+        (key, value)
+        for key, value in request.query_params.multi_items()
+        if key != "full"
+    ]
+    try:
+        filters = parse_filters(params)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "code": 400,
+                "errorMessage": f"Invalid download: {e}"
+            }
+        )
+
+    return StreamingResponse(
+        _iter_results_zip(filters, full),
+        media_type="application/zip",
+        headers={"content-disposition": 'attachment; filename="search-results.zip"'}
+    )
+
+def _all_keys(filters:dict) -> list[str]:
+    return [key for keys in _result_keys(filters) for key in keys]
+
+async def _export_files(
+        filters:dict,
+        fmt:str,
+        photometry:bool
+) -> AsyncIterator[tuple[str, bytes]]:
+    """
+    The files of a table export, as (name, piece of the file) pairs. The documents
+    are fetched in batches and each batch is turned into rows in the process pool.
+    The metadata table is written a batch at a time as they come in, see
+    columnar.TableWriter. The columns of the photometry table depend on the
+    transients in it, so it is written in the process pool once every batch is in.
+    """
+    keep = None if photometry else META_KEYS + ["_key"]
+    batch_size = RESULTS_ZIP_BATCH_SIZE if photometry else FETCH_BATCH_SIZE
+    keys = await run.io_bound(_all_keys, filters)
+
+    extension, _ = columnar.FORMATS[fmt]
+    name = f"search-results.{extension}"
+    writer = columnar.TableWriter(fmt, columnar.METADATA_UNITS)
+    photometry_parts = []
+    for i in range(0, len(keys), batch_size):
+        docs = await run.io_bound(
+            fetch_transients, keys[i:i + batch_size], keep=keep, batch_size=batch_size
+        )
+        # plain dicts are cheaper to send to the worker than Transients
+        frames = await run.cpu_bound(
+            columnar.frames, [dict(doc) for doc in docs], photometry
+        )
+        del docs
+        # the writer keeps its file open between batches, so it runs in a thread
+        yield name, await run.io_bound(writer.write, frames["metadata"])
+        if photometry:
+            photometry_parts.append(frames["photometry"])
+    yield name, await run.io_bound(writer.close)
+
+    if photometry:
+        yield (
+            f"search-results-photometry.{extension}",
+            await run.cpu_bound(columnar.write, photometry_parts, fmt)
+        )
+
+async def _iter_export(filters:dict, fmt:str, photometry:bool) -> AsyncIterator[bytes]:
+    """
+    The bytes of a table export, a chunk at a time. With photometry the two tables
+    are sent in a zip, where a failure part way through is written into the archive
+    as ERROR.txt, otherwise a failure ends the response early so the download is
+    marked as failed instead of looking complete.
+    """
+    if not photometry:
+        async for _, data in _export_files(filters, fmt, photometry):
+            for i in range(0, len(data), EXPORT_CHUNK_SIZE):
+                yield data[i:i + EXPORT_CHUNK_SIZE]
+        return
+
+    archive = ZipStream()
+    try:
+        async for name, data in _export_files(filters, fmt, photometry):
+            yield archive.write(name, data)
+    except Exception as e:
+        logger.warning(f"{fmt} export of search results failed part way through: {e}")
+        message = f"The export failed part way through: {e}\n"
+        yield archive.add("ERROR.txt", message.encode())
+    yield archive.close()
+
+@API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/search/export"))
+async def export_results(
+        request:Request,
+        format:str="ecsv",
+        photometry:bool=False
+):
+    """
+    Download the transients matching the search page filters given in the query
+    string as a table with one row per transient: its name, aliases, position,
+    redshift, class, discovery date and references. With photometry=1 a second
+    table of the cleaned photometry, one row per point, is sent with it in a zip.
+
+    The format is parquet or arrow (Arrow IPC), which need pyarrow installed, or
+    ecsv or votable for astropy and TOPCAT.
+    """
+    params = [
+        (key, value)
+        for key, value in request.query_params.multi_items()
+        if key not in ("format", "photometry")
+    ]
+    try:
+        filters = parse_filters(params)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": True, "code": 400, "errorMessage": f"Invalid export: {e}"}
+        )
+    if format not in columnar.FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": True,
+                "code": 400,
+                "errorMessage": (
+                    f"Unknown format {format!r}, use one of "
+                    f"{', '.join(columnar.FORMATS)}"
+                )
+            }
+        )
+    if not columnar.available(format):
+        return JSONResponse(
+            status_code=501,
+            content={
+                "error": True,
+                "code": 501,
+                "errorMessage": (
+                    f"{format} exports need pyarrow, which is not installed on "
+                    "this server"
+                )
+            }
+        )
+
+    extension, media_type = columnar.FORMATS[format]
+    if photometry:
+        filename, media_type = f"search-results-{format}.zip", "application/zip"
+    else:
+        filename = f"search-results.{extension}"
+    return StreamingResponse(
+        _iter_export(filters, format, photometry),
+        media_type=media_type,
+        headers={"content-disposition": f'attachment; filename="{filename}"'}
+    )
 
-def submit_form_with_enter(
+# the labels of the table formats in the download menu
+EXPORT_LABELS = {
+    "ecsv": "ECSV table",
+    "votable": "VOTable",
+    "parquet": "Parquet table",
+    "arrow": "Arrow IPC table",
+}
+
+def download_results_button(search_results:SearchResults) -> None:
+    """
+    The "Download Results" button under a search results table, which downloads a
+    zip of JSON files, with a menu of the table formats the server can write
+    """
+    with ui.row().classes("items-center"):
+        with ui.dropdown_button(
+                "Download Results",
+                split=True,
+                auto_close=True,
+                on_click=lambda: search_results.write_results_to_zip()
+        ):
+            ui.item(
+                "JSON files (zip)",
+                on_click=lambda: search_results.write_results_to_zip()
+            )
+            for fmt, label in EXPORT_LABELS.items():
+                if columnar.available(fmt):
+                    ui.item(
+                        label,
+                        on_click=lambda fmt=fmt: search_results.export_results(
+                            fmt, photometry=photometry.value
+                        )
+                    )
+        photometry = ui.checkbox("Include cleaned photometry in tables")
+
+def name_input(search_input) -> ui.input:
+    """
+    The "Transient Name" field of the search forms, which suggests names from the
+    catalog snapshot as they are typed
+
+    Args:
+        search_input [SearchInput] : Where the name typed in is kept
+    """
+    def on_change(e):
+        search_input.add_name(e)
+        names.set_autocomplete(
+            CATALOG.suggest(e.value or "", NAME_SUGGESTIONS) if CATALOG_SNAPSHOT else []
+        )
+
+    names = ui.input(
+        'Transient Name',
+        placeholder='Enter a transient name or partial name',
+        on_change = on_change
+    )
+    return names
+
+@API_ROUTER.get(os.path.join(WEB_BASE_URL, "api/names"))
+async def api_names(q:str, limit:int=NAME_SUGGESTIONS):
+    """
+    Transient names to suggest for a partial name, for typeahead fields. Names that
+    start with q come first, then names that contain it, then names close to it.
+    """
+    if not (CATALOG_SNAPSHOT and CATALOG.ready):
+        return JSONResponse(
+            status_code=503,
+            content={
+                "error": True,
+                "code": 503,
+                "errorMessage": "The transient names are still being loaded"
+            }
+        )
+    return {
+        "error": False,
+        "code": 200,
+        "result": CATALOG.suggest(q, max(0, min(limit, 100)))
+    }
+
+async def submit_form_with_enter(
         event:events.KeyEventArguments,
         search_input,
         search_results,
-        post_table
+        post_table,
+        status=None
 ) -> None:
     if event.key.enter and event.action.keydown:
-        do_search(
+        await do_search(
             search_input,
             search_results,
-            post_table
+            post_table,
+            status
         )
     
 def search_form(search_results, post_table):
@@ -275,11 +877,7 @@ def search_form(search_results, post_table):
     
     with ui.column():
         with ui.row():
-            names = ui.input(
-                'Transient Name',
-                placeholder='Enter a transient name or partial name',
-                on_change = search_input.add_name
-            )
+            names = name_input(search_input)
 
             searchclass = ui.select(
                 classes,
@@ -394,33 +992,236 @@ def search_form(search_results, post_table):
         lambda: do_search(
             search_input,
             search_results,
-            post_table
+            post_table,
+            status
         )
     )
+    status = ui.label()
 
     ui.keyboard(
         on_key=lambda e: submit_form_with_enter(
             e,
             search_input,
             search_results,
-            post_table
+            post_table,
+            status
         ),
         ignore = ["select", "button", "textarea"]
     )
 
+class AQLPager:
+    """
+    An AQL query typed in on the search page, read from a streaming cursor a batch
+    at a time so only the rows being looked at are fetched. At most
+    API_AQL_INTERACTIVE_LIMIT rows are ever read. With API_AQL_GUARD set the query
+    gets that LIMIT if it has none, is explained first and raises QueryRejected if it
+    is estimated to be too expensive, and is run with a short time and memory limit.
+
+    Args:
+        query [str] : The AQL query string
+        batch_size [int] : The number of rows to read at a time
+    """
+
+    def __init__(self, query:str, batch_size:int=AQL_EDITOR_BATCH_SIZE):
+        self.query = query
+        self.batch_size = batch_size
+        self.rows = []
+        self.done = False
+        self.truncated = False
+        self._cursor = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def has_more(self) -> bool:
+        return not self.done and len(self.rows) < API_AQL_INTERACTIVE_LIMIT
+
+    def start(self) -> list:
+        """
+        Run the query and read the first batch, returning all the rows read so far
+        """
+        query = self.query
+        options = {"stream": True}
+        limits = {}
+        if API_AQL_GUARD:
+            query = add_limit(query, API_AQL_INTERACTIVE_LIMIT)
+            if API_AQL_MAX_COST or API_AQL_MAX_ITEMS:
+                explained = call_upstream(db.explainAQLQuery, query)
+                if explained.get("error"):
+                    raise AQLQueryError(explained.get("errorMessage"), query, explained)
+                reason = check_plan(
+                    explained.get("plan") or {},
+                    API_AQL_MAX_COST,
+                    API_AQL_MAX_ITEMS
+                )
+                if reason is not None:
+                    raise QueryRejected(reason)
+            options["maxRuntime"] = API_AQL_INTERACTIVE_MAX_RUNTIME
+            limits["memoryLimit"] = API_AQL_MEMORY_LIMIT
+
+        cursor = call_upstream(
+            db.AQLQuery,
+            query,
+            rawResults=True,
+            batchSize=self.batch_size,
+            options=options,
+            **limits
+        )
+        with self._lock:
+            self._cursor = cursor
+            closed = self._closed
+        if closed:
+            # superseded while it was starting
+            self.close()
+            return self.rows
+        return self._read(cursor.response)
+
+    def more(self) -> list:
+        """
+        Read the next batch, returning all the rows read so far. Raises the
+        pyArangoException if the cursor can not be read any more, e.g. it expired or
+        the query ran out of time, after which there is nothing more to read.
+        """
+        if not self.has_more or self._cursor is None:
+            return self.rows
+        try:
+            call_upstream(self._cursor.nextBatch, idempotent=False)
+        except StopIteration:
+            self.done = True
+            return self.rows
+        except pyArangoException:
+            self.done = True
+            raise
+        return self._read(self._cursor.response)
+
+    def _read(self, response:dict) -> list:
+        if response.get("error"):
+            self.done = True
+            raise AQLQueryError(response.get("errorMessage"), self.query, response)
+        self.rows.extend(response.get("result") or [])
+        if not response.get("hasMore"):
+            self.done = True
+        if len(self.rows) >= API_AQL_INTERACTIVE_LIMIT:
+            del self.rows[API_AQL_INTERACTIVE_LIMIT:]
+            self.truncated = True
+            self.close()
+        return self.rows
+
+    def close(self) -> None:
+        """
+        Stop reading, and delete the cursor so ArangoDB stops running the query
+        """
+        with self._lock:
+            self._closed = True
+            cursor, self._cursor = self._cursor, None
+        finished = self.done
+        self.done = True
+        if cursor is not None and not finished:
+            _delete_cursor(cursor)
+
+def _delete_cursor(query) -> None:
+    """
+    Delete the cursor of a pyArango query that has not been read to the end, so
+    ArangoDB stops running it
+    """
+    if query.cursor is None:
+        return
+    try:
+        db.connection.session.delete(query.cursor.getURL())
+    except Exception as e:
+        logger.debug(f"Could not delete AQL cursor {query.cursor.id}: {e}")
+
 def raw_aql_query(post_table):
     query = """FOR transient IN transients
     RETURN transient
         """
-        
+    current = None # the AQLPager of the query being shown
+    waiting = None # the task waiting for the typing to stop
+
+    def close(pager):
+        background_tasks.create(run.io_bound(pager.close))
+
+    def show(pager):
+        post_table.refresh(pager.rows)
+        if pager.has_more:
+            status.set_text(f"Showing the first {len(pager.rows)} rows")
+        elif pager.truncated:
+            status.set_text(
+                f"Showing the first {len(pager.rows)} rows, the most the editor shows"
+            )
+        else:
+            status.set_text(f"{len(pager.rows)} rows")
+        more.set_visibility(pager.has_more)
+
+    async def execute(text):
+        nonlocal current
+        if current is not None:
+            close(current)
+        pager = current = AQLPager(text)
+        more.set_visibility(False)
+        status.set_text("Running...")
+        try:
+            await run.io_bound(pager.start)
+        except asyncio.CancelledError:
+            close(pager)
+            raise
+        except (QueryRejected, pyArangoException, CircuitOpen) as exc:
+            if current is pager:
+                status.set_text(str(exc))
+            return
+        if current is not pager:
+            close(pager)
+            return
+        show(pager)
+
+    async def load_more():
+        pager = current
+        if pager is None or not pager.has_more:
+            return
+        more.disable()
+        try:
+            await run.io_bound(pager.more)
+        except (pyArangoException, CircuitOpen) as exc:
+            if current is pager:
+                status.set_text(str(exc))
+                more.set_visibility(pager.has_more)
+            return
+        finally:
+            more.enable()
+        if current is pager:
+            show(pager)
+
+    async def run_after_typing(text):
+        await asyncio.sleep(AQL_EDITOR_DEBOUNCE)
+        await execute(text)
+
+    def on_change(e):
+        nonlocal waiting
+        if waiting is not None and not waiting.done():
+            waiting.cancel()
+        if auto.value:
+            waiting = background_tasks.create(run_after_typing(e.value))
+
+    async def run_now():
+        if waiting is not None and not waiting.done():
+            waiting.cancel()
+        await execute(editor.value)
+
     editor = ui.codemirror(
         value=f"{query}",
         language="AQL",
-        on_change=lambda e : post_table.refresh(
-            [r for r in db.AQLQuery(e.value, rawResults=True)]
-        )
+        on_change=on_change
     ).classes("w-full")
-    
+    with ui.row().classes("items-center"):
+        ui.button("Run", on_click=run_now)
+        auto = ui.checkbox(
+            "Run when I stop typing",
+            value=AQL_EDITOR_DEBOUNCE > 0
+        )
+        status = ui.label()
+    more = ui.button("Load more", on_click=load_more)
+    more.set_visibility(False)
+
 # Function to switch between forms
 def show_form(selected_form, search_results, post_table, containers=None):
     if containers is not None:
@@ -450,11 +1251,7 @@ def simple_form(search_results, post_table):
     
     with ui.column():
         with ui.row():
-            names = ui.input(
-                'Transient Name',
-                placeholder='Enter a transient name or partial name',
-                on_change = search_input.add_name
-            )
+            names = name_input(search_input)
 
             searchclass = ui.select(
                 classes,
@@ -497,16 +1294,19 @@ def simple_form(search_results, post_table):
             lambda: do_search(
                 search_input,
                 search_results,
-                post_table
+                post_table,
+                status
             )
         )
+        status = ui.label()
 
         ui.keyboard(
             on_key=lambda e: submit_form_with_enter(
                 e,
                 search_input,
                 search_results,
-                post_table
+                post_table,
+                status
             ),
             ignore = ["select", "button", "textarea"]
         )
@@ -16,6 +16,7 @@ from dustmaps.sfd import SFDWebQuery
 from ..theme import frame
 from ..config import API_URL, WEB_BASE_URL
 from ..util import _TimeoutError, _timeout_handler
+from ..upstream import call_upstream, CircuitOpen
 
 from otter import Otter
 from otter.exceptions import FailedQueryError
@@ -608,8 +609,13 @@ async def transient_subpage(transient_default_name:str):
     global MAX_T
 
     logger.info("Connecting to the database and loading metadata...")
-    db = Otter(url=API_URL)
-    dataset = db.query(names=transient_default_name)[0]
+    try:
+        db = call_upstream(Otter, url=API_URL)
+        dataset = call_upstream(db.query, names=transient_default_name)[0]
+    except CircuitOpen as e:
+        with frame():
+            ui.label(f"{e}").classes("text-h6")
+        return
     json_data = json.dumps(dict(dataset), indent=4)
     
     obs_types = {
@@ -17,6 +17,7 @@ import pandas as pd
 from nicegui import ui, app, background_tasks, run 
 from ..theme import frame
 from ..config import API_URL, vetting_password, WEB_BASE_URL
+from ..upstream import call_upstream
 
 from functools import partialmethod, partial
 from dataclasses import dataclass
@@ -267,7 +268,12 @@ async def send_to_vetting(upload_input: UploadInput, input_type:str, outpath:str
             local_outpath = outpath,
             db = db
         )
-        local_db.upload_private(collection="vetting", testing=False)
+        call_upstream(
+            local_db.upload_private,
+            collection="vetting",
+            testing=False,
+            idempotent=False
+        )
     except Exception as e:
         log.exception(f"""
         Upload failed with exception {e}! Please try again or contact an OTTER admin!
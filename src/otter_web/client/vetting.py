@@ -11,6 +11,8 @@ import pandas as pd
 
 from ..config import vetting_password, unrestricted_page_routes, otterpath, API_URL, WEB_BASE_URL
 from ..theme import frame
+from ..upstream import call_upstream, CircuitOpen
+from .search_util import CATALOG, cone_search, refresh_catalog
 
 from otter import Otter, Transient
 
@@ -21,7 +23,7 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from pyArango.connection import Connection
 from pyArango.database import Database
 
-from nicegui import app, ui
+from nicegui import app, ui, background_tasks
 
 log = logging.getLogger("otter-log")
 
@@ -87,14 +89,19 @@ def vetting() -> None:
         ]
 
         rows = []
-        conn = Connection(
-            username="vetting-user",
-            password=vetting_password,
-            arangoURL=API_URL
-        )
+        try:
+            conn = call_upstream(
+                Connection,
+                username="vetting-user",
+                password=vetting_password,
+                arangoURL=API_URL
+            )
 
-        db = Database(conn, "otter")
-        transients_to_vet = db.AQLQuery("FOR t IN vetting RETURN t")
+            db = call_upstream(Database, conn, "otter")
+            transients_to_vet = call_upstream(db.AQLQuery, "FOR t IN vetting RETURN t")
+        except CircuitOpen as e:
+            ui.label(f"{e}").classes("text-h6")
+            return
         for t in transients_to_vet:
             comment = t["schema_version"]["comment"].split("|")
             name, email = comment[0:2]
@@ -219,13 +226,21 @@ def approve(doc, testing=False):
     try:
         # this will upload the dataset to the transients collection in the arangodb
         # database
-        db = Otter(
+        db = call_upstream(
+            Otter,
             username="vetting-user",
             password=vetting_password,
             url = API_URL
         )
 
-        res = db.query(coords=Transient(t).get_skycoord())
+        # whether it is a duplicate has to come from the database itself, another
+        # worker may have approved it since our snapshot was taken
+        res = call_upstream(
+            cone_search,
+            Transient(t).get_skycoord(),
+            otter=db,
+            snapshot=False
+        )
         if len(res) > 1:
             raise OtterLimitationError(
                 "Some objects in Otter are too close! Consider reducing the search radius!"
@@ -269,13 +284,28 @@ def approve(doc, testing=False):
             
             merged = t
 
-        doc = db.upload(merged, collection="transients", testing=testing)
-        
+        doc = call_upstream(
+            db.upload,
+            merged,
+            collection="transients",
+            testing=testing,
+            idempotent=False
+        )
+
     except Exception as e:
         ui.notify("Processing the dataset failed, please check again!", type="negative")
         ui.notify(e, type="negative")
         log.exception(e)
         return
+
+    if not testing:
+        # so searches find it straight away. It is already in the database by now,
+        # so this failing must not look like the approval failed
+        try:
+            CATALOG.add_transient(doc.getStore())
+        except Exception as e:
+            log.exception(f"Could not add the approved transient to the catalog: {e}")
+        background_tasks.create(refresh_catalog())
     
     ui.navigate.to(os.path.join(WEB_BASE_URL, "vetting"))
     ui.notification("Data was successfully processed!")
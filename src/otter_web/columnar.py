@@ -0,0 +1,297 @@
+"""
+Search results as columnar tables, one row per transient and optionally one row per
+cleaned photometry point, written as Parquet or Arrow IPC (which need pyarrow) for
+loading quickly, or as ECSV or VOTable for astropy, TOPCAT and the other astronomy
+tools. The functions here are run in a worker process, so they only take and return
+things that can be pickled. TableWriter keeps the file it is writing open between
+batches, so it is used from a thread instead.
+"""
+import io
+import json
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import astropy.units as u
+from astropy.table import Table
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError: # pragma: no cover
+    pyarrow = None
+
+from otter import Transient
+
+from .zipstream import Sink
+from .tables import (
+    coordinate_degrees,
+    coordinate_strings,
+    default_classification,
+    default_name,
+    default_redshift,
+    discovery_date,
+    discovery_jds
+)
+
+# the extension and media type of each format
+FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+    "ecsv": ("ecsv", "text/x-ecsv; charset=utf-8"),
+    "votable": ("vot", "application/x-votable+xml"),
+}
+
+# the formats written with pyarrow
+ARROW_FORMATS = {"parquet", "arrow"}
+
+# the units of the columns of the metadata table
+METADATA_UNITS = {"ra": u.deg, "dec": u.deg, "discovery_mjd": u.day}
+
+# the Julian date of MJD 0
+MJD_ZERO = 2400000.5
+
+def available(fmt:str) -> bool:
+    """
+    Whether a format can be written, which for Parquet and Arrow needs pyarrow
+    """
+    return fmt in FORMATS and (fmt not in ARROW_FORMATS or pyarrow is not None)
+
+def _joined(values:list) -> str:
+    return ", ".join(value for value in values if isinstance(value, str))
+
+def metadata_frame(events:list[dict]) -> pd.DataFrame:
+    """
+    One row for each transient, with its key, name, aliases, position, redshift,
+    class, discovery date and references
+
+    Args:
+        events [list[dict]] : The transient documents, at least with the META_KEYS
+    """
+    coordinates = []
+    for event in events:
+        coordinate = event.get("coordinate") or [None]
+        coordinates.append(coordinate[0] if isinstance(coordinate[0], dict) else None)
+    ra, dec = coordinate_degrees(coordinates)
+    ra_hms, dec_dms = coordinate_strings(coordinates)
+
+    dates = [discovery_date(event) for event in events]
+    mjds = discovery_jds(dates) - MJD_ZERO
+    mjds[~np.isfinite(mjds)] = np.nan
+
+    return pd.DataFrame({
+        "key": [str(event.get("_key", "")) for event in events],
+        "name": [default_name(event) for event in events],
+        "aliases": [
+            _joined(
+                alias.get("value")
+                for alias in (event.get("name") or {}).get("alias") or []
+                if isinstance(alias, dict)
+            )
+            for event in events
+        ],
+        "ra": ra,
+        "dec": dec,
+        "ra_hms": ra_hms,
+        "dec_dms": dec_dms,
+        "redshift": [default_redshift(event) for event in events],
+        "classification": [default_classification(event) or "" for event in events],
+        "discovery_mjd": mjds,
+        "references": [
+            _joined(
+                ref.get("name") for ref in event.get("reference_alias") or []
+                if isinstance(ref, dict)
+            )
+            for event in events
+        ],
+    })
+
+def photometry_frame(events:list[dict]) -> pd.DataFrame:
+    """
+    One row for each cleaned photometry point of the transients, the same as the
+    photometry download on the transient pages (fluxes in Jy and dates in MJD), with
+    the key and name of the transient it belongs to. Transients without photometry,
+    or whose photometry can not be cleaned, are left out.
+
+    Args:
+        events [list[dict]] : The full transient documents
+    """
+    frames = []
+    for event in events:
+        if not event.get("photometry"):
+            continue
+        try:
+            phot = Transient(event).clean_photometry(flux_unit="Jy", date_unit="mjd")
+        except Exception:
+            continue
+        if phot is None or not len(phot):
+            continue
+        phot = phot.reset_index(drop=True)
+        phot.insert(0, "name", default_name(event))
+        phot.insert(0, "key", str(event.get("_key", "")))
+        frames.append(phot)
+    if not frames:
+        return pd.DataFrame({"key": [], "name": []}, dtype=str)
+    return pd.concat(frames, ignore_index=True)
+
+def frames(events:list[dict], photometry:bool=False) -> dict[str, pd.DataFrame]:
+    """
+    The metadata table, and the photometry table if it is asked for, of a batch of
+    transients
+
+    Args:
+        events [list[dict]] : The transient documents, full ones if photometry is
+                              True
+        photometry [bool] : If True, also build the photometry table
+    """
+    tables = {"metadata": metadata_frame(events)}
+    if photometry:
+        tables["photometry"] = photometry_frame(events)
+    return tables
+
+def _text(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, default=str)
+
+def _plain(frame:pd.DataFrame) -> pd.DataFrame:
+    """
+    frame with every column that is not numbers or booleans turned into strings,
+    since cleaned photometry can have lists, dicts and mixed types in a column that
+    none of the formats can store
+    """
+    frame = frame.copy()
+    for column in frame.columns:
+        if frame[column].dtype == object:
+            frame[column] = frame[column].map(_text).astype(str)
+    frame.columns = [str(column) for column in frame.columns]
+    return frame
+
+def _with_units(table:"pyarrow.Table", units:dict) -> "pyarrow.Table":
+    """
+    table with the unit of each column that has one in its schema metadata
+    """
+    metadata = {
+        f"unit.{column}".encode(): unit.to_string().encode()
+        for column, unit in units.items()
+    }
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+def write(parts:list[pd.DataFrame], fmt:str, units:Optional[dict]=None) -> bytes:
+    """
+    The file of one table, in a format from FORMATS
+
+    Args:
+        parts [list[pd.DataFrame]] : The table, in batches with the same columns or
+                                     some missing
+        fmt [str] : The format to write
+        units [dict] : The astropy unit of each column that has one
+    """
+    frame = _plain(pd.concat(parts, ignore_index=True) if parts else pd.DataFrame())
+    units = {column: unit for column, unit in (units or {}).items() if column in frame}
+    buffer = io.BytesIO()
+    if fmt in ARROW_FORMATS:
+        table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+        table = _with_units(table, units)
+        if fmt == "parquet":
+            pyarrow.parquet.write_table(table, buffer)
+        else:
+            sink = pyarrow.BufferOutputStream()
+            with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            buffer.write(sink.getvalue().to_pybytes())
+    elif fmt == "ecsv":
+        text = io.StringIO()
+        Table.from_pandas(frame, units=units).write(text, format="ascii.ecsv")
+        buffer.write(text.getvalue().encode("utf-8"))
+    elif fmt == "votable":
+        Table.from_pandas(frame, units=units).write(buffer, format="votable")
+    else:
+        raise ValueError(f"Unknown format {fmt!r}")
+    return buffer.getvalue()
+
+class TableWriter:
+    """
+    One table written a batch of rows at a time, with each call returning the bytes
+    of the file written since the last one so they can be sent on straight away.
+    Parquet (a row group per batch), Arrow IPC and ECSV are written as the batches
+    come in, which needs every batch to have the same columns with the same types,
+    like the metadata tables. astropy can only write a VOTable in one go, so those
+    batches are held until the writer is closed.
+
+    Args:
+        fmt [str] : The format to write, from FORMATS
+        units [dict] : The astropy unit of each column that has one
+    """
+
+    def __init__(self, fmt:str, units:Optional[dict]=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}")
+        self.fmt = fmt
+        self.units = units or {}
+        self._sink = Sink()
+        self._writer = None
+        self._schema = None
+        self._started = False
+        # the batches not written yet, every one for a VOTable and otherwise only
+        # empty ones, which can not tell pyarrow the types of their columns
+        self._parts = []
+
+    def write(self, frame:pd.DataFrame) -> bytes:
+        """
+        Add a batch of rows to the table
+
+        Args:
+            frame [pd.DataFrame] : The rows
+        """
+        if self.fmt == "votable" or not len(frame):
+            self._parts.append(frame)
+            return b""
+
+        frame = _plain(frame)
+        units = {column: unit for column, unit in self.units.items() if column in frame}
+        if self.fmt in ARROW_FORMATS:
+            self._write_arrow(frame, units)
+        else:
+            text = io.StringIO()
+            Table.from_pandas(frame, units=units).write(text, format="ascii.ecsv")
+            lines = text.getvalue().splitlines(keepends=True)
+            if self._started:
+                # the header and the line of column names are already written
+                header = next(
+                    i for i, line in enumerate(lines) if not line.startswith("#")
+                )
+                lines = lines[header + 1:]
+            self._sink.write("".join(lines).encode("utf-8"))
+        self._started = True
+        return self._sink.take()
+
+    def _write_arrow(self, frame:pd.DataFrame, units:dict) -> None:
+        if self._writer is None:
+            table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+            table = _with_units(table, units)
+            self._schema = table.schema
+            if self.fmt == "parquet":
+                self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema)
+            else:
+                self._writer = pyarrow.ipc.new_file(self._sink, self._schema)
+        else:
+            # the types of the first batch, since later ones must match it
+            table = pyarrow.Table.from_pandas(
+                frame, schema=self._schema, preserve_index=False
+            ).replace_schema_metadata(self._schema.metadata)
+        self._writer.write_table(table)
+
+    def close(self) -> bytes:
+        """
+        Finish the file, returning the rest of it
+        """
+        if not self._started:
+            # nothing has been written, so the whole table (perhaps with no rows) is
+            return write(self._parts, self.fmt, self.units)
+        if self._writer is not None:
+            self._writer.close()
+        return self._sink.take()
@@ -0,0 +1,93 @@
+"""
+Compression of API responses, negotiated from the Accept-Encoding of the client
+"""
+import zlib
+from typing import AsyncIterator, Optional
+
+try:
+    import brotli
+except ImportError: # pragma: no cover
+    brotli = None
+
+from .config import API_COMPRESS_LEVEL
+
+def _parse_accept_encoding(accept_encoding:str) -> dict[str, float]:
+    """
+    Map each coding in an Accept-Encoding header to its q value
+    """
+    codings = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        codings[coding.lower()] = q
+    return codings
+
+def negotiate(accept_encoding:Optional[str]) -> Optional[str]:
+    """
+    Choose the encoding to compress a response with, preferring brotli if it is
+    installed. Returns None if the client does not accept any we support.
+
+    Args:
+        accept_encoding [str] : The Accept-Encoding header of the request
+    """
+    if not accept_encoding:
+        return None
+
+    codings = _parse_accept_encoding(accept_encoding)
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    best, best_q = None, 0.0
+    for coding in supported:
+        q = codings.get(coding, codings.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress(content:bytes, encoding:str) -> bytes:
+    """
+    Compress a whole body
+
+    Args:
+        content [bytes] : The body to compress
+        encoding [str] : Either "gzip" or "br"
+    """
+    if encoding == "br":
+        return brotli.compress(content, quality=API_COMPRESS_LEVEL)
+    compressor = zlib.compressobj(API_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(content) + compressor.flush()
+
+async def compress_stream(
+        chunks:AsyncIterator[bytes],
+        encoding:str
+) -> AsyncIterator[bytes]:
+    """
+    Compress a body as it is streamed, chunk by chunk
+
+    Args:
+        chunks [AsyncIterator[bytes]] : The uncompressed body
+        encoding [str] : Either "gzip" or "br"
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=API_COMPRESS_LEVEL)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(API_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+
+    try:
+        async for chunk in chunks:
+            out = process(chunk)
+            if out:
+                yield out
+        yield finish()
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
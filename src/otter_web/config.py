@@ -8,9 +8,182 @@ import os
 # REMAIN DIFFERENT (BUT CAUGHT UP WITH) MAIN
 API_URL = os.environ.get("ARANGO_URL", "http://localhost:8529")
 print(f"Connecting to {API_URL}")
+
+# settings for the pooled client the API proxy uses to talk to ArangoDB.
+# Timeouts are in seconds
+API_POOL_SIZE = int(os.environ.get("OTTER_API_POOL_SIZE", 100))
+API_KEEPALIVE_POOL_SIZE = int(os.environ.get("OTTER_API_KEEPALIVE_POOL_SIZE", 20))
+API_KEEPALIVE_EXPIRY = float(os.environ.get("OTTER_API_KEEPALIVE_EXPIRY", 30))
+API_CONNECT_TIMEOUT = float(os.environ.get("OTTER_API_CONNECT_TIMEOUT", 5))
+API_TIMEOUT = float(os.environ.get("OTTER_API_TIMEOUT", 60))
+
+# how the app copes with ArangoDB going away. Idempotent calls that fail to connect
+# (or get a 502/503/504) are retried up to API_RETRIES times, waiting a random time
+# of up to API_RETRY_BACKOFF*2**attempt seconds (but no more than
+# API_RETRY_BACKOFF_MAX) in between. After API_BREAKER_THRESHOLD failures in a row
+# every call fails straight away for API_BREAKER_RESET seconds, then a single call is
+# let through to probe whether the database is back
+API_RETRIES = int(os.environ.get("OTTER_API_RETRIES", 2))
+API_RETRY_BACKOFF = float(os.environ.get("OTTER_API_RETRY_BACKOFF", 0.1))
+API_RETRY_BACKOFF_MAX = float(os.environ.get("OTTER_API_RETRY_BACKOFF_MAX", 2))
+API_BREAKER_THRESHOLD = int(os.environ.get("OTTER_API_BREAKER_THRESHOLD", 5))
+API_BREAKER_RESET = float(os.environ.get("OTTER_API_BREAKER_RESET", 10))
+
+# admission control for the API proxy. Each client address (and each login from it
+# with a token handed out through the token cache) gets API_RATE_LIMIT requests per
+# second with bursts of up to API_RATE_BURST, and at most API_MAX_CONCURRENT calls
+# go to ArangoDB at once with up to API_MAX_QUEUE more waiting API_QUEUE_TIMEOUT
+# seconds for a slot. Setting API_RATE_LIMIT or API_MAX_CONCURRENT to 0 turns that
+# limit off. The rate limit is off unless it is set, since the scripts using the API
+# through pyArango or otter do not retry requests that get a 429
+API_RATE_LIMIT = float(os.environ.get("OTTER_API_RATE_LIMIT", 0))
+API_RATE_BURST = float(os.environ.get("OTTER_API_RATE_BURST", 40))
+API_MAX_CONCURRENT = int(os.environ.get("OTTER_API_MAX_CONCURRENT", 32))
+API_MAX_QUEUE = int(os.environ.get("OTTER_API_MAX_QUEUE", 128))
+API_QUEUE_TIMEOUT = float(os.environ.get("OTTER_API_QUEUE_TIMEOUT", 10))
+
+# the addresses or networks of the reverse proxies in front of the website, which
+# are trusted to set X-Forwarded-For and X-Forwarded-Proto. The client address is
+# the right-most one in X-Forwarded-For that is not a trusted proxy, so a client can
+# not pick its own address (and its own rate limit) by sending the header itself.
+# The default trusts the loopback and private networks, e.g. a proxy in another
+# container on the docker network
+TRUSTED_PROXIES = os.environ.get(
+    "OTTER_TRUSTED_PROXIES",
+    "127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+)
+
+# forward ArangoDB response bodies chunk by chunk instead of reading them fully
+# into memory first. Set to 0 to buffer them instead
+API_STREAM_RESPONSES = os.environ.get("OTTER_API_STREAM_RESPONSES", "1") == "1"
+
+# compress API proxy responses of at least API_COMPRESS_MIN_SIZE bytes with gzip,
+# or brotli if it is installed, when the client accepts it. The level is used for
+# both, gzip accepts 1-9 and brotli 0-11
+API_COMPRESS = os.environ.get("OTTER_API_COMPRESS", "1") == "1"
+API_COMPRESS_MIN_SIZE = int(os.environ.get("OTTER_API_COMPRESS_MIN_SIZE", 1024))
+API_COMPRESS_LEVEL = int(os.environ.get("OTTER_API_COMPRESS_LEVEL", 5))
+
+# share one ArangoDB call between identical requests (same method, url, body and
+# credentials) that arrive while it is still running
+API_COALESCE = os.environ.get("OTTER_API_COALESCE", "1") == "1"
+
+# AQL cursor responses of up to API_CURSOR_BUFFER_MAX_BYTES are read in full, so a
+# complete result can be shared with identical requests, cached and read ahead of.
+# Bigger ones are streamed to the client as they arrive and are never shared,
+# cached or read ahead of
+API_CURSOR_BUFFER_MAX_BYTES = int(
+    os.environ.get("OTTER_API_CURSOR_BUFFER_MAX_BYTES", 1024**2)
+)
+
+# the number of documents sent to ArangoDB at a time by the bulk import route
+API_BULK_BATCH_SIZE = int(os.environ.get("OTTER_API_BULK_BATCH_SIZE", 500))
+
+# the number of documents read from ArangoDB at a time by the NDJSON export route,
+# and how many seconds its cursor is kept open for a client that stops reading
+API_EXPORT_BATCH_SIZE = int(os.environ.get("OTTER_API_EXPORT_BATCH_SIZE", 1000))
+API_EXPORT_CURSOR_TTL = float(os.environ.get("OTTER_API_EXPORT_CURSOR_TTL", 300))
+
+# how long, in seconds, to keep the database, collection, graph and foxx listings
+# that pyArango fetches on every new connection
+API_METADATA_CACHE_TTL = float(os.environ.get("OTTER_API_METADATA_CACHE_TTL", 30))
+
+# opt in cache of read only AQL cursor results. The TTL is in seconds. Writes made
+# through the API proxy drop the results they may have changed, but the website's
+# own writes (approving transients in vetting, uploads) go straight to ArangoDB, so
+# results cached before them can be served for up to API_CURSOR_CACHE_TTL seconds
+API_CURSOR_CACHE = os.environ.get("OTTER_API_CURSOR_CACHE", "0") == "1"
+API_CURSOR_CACHE_TTL = float(os.environ.get("OTTER_API_CURSOR_CACHE_TTL", 300))
+API_CURSOR_CACHE_MAX_BYTES = int(
+    os.environ.get("OTTER_API_CURSOR_CACHE_MAX_BYTES", 256*1024**2)
+)
+
+# fetch the next batch of an open AQL cursor while the client is still reading the
+# current one. The fetched batches are held by the worker that created the cursor,
+# so behind a load balancer with several workers the cursor urls need to be routed
+# back to the same worker (the worker id is the part after the "-" in the cursor id)
+API_CURSOR_PREFETCH = os.environ.get("OTTER_API_CURSOR_PREFETCH", "0") == "1"
+API_CURSOR_PREFETCH_MAX_BYTES = int(
+    os.environ.get("OTTER_API_CURSOR_PREFETCH_MAX_BYTES", 64*1024**2)
+)
+API_CURSOR_PREFETCH_MAX_CURSORS = int(
+    os.environ.get("OTTER_API_CURSOR_PREFETCH_MAX_CURSORS", 1000)
+)
+API_WORKER_ID = os.environ.get("OTTER_WORKER_ID", str(os.getpid()))
+
+# hand out the JWT from the last login with the same credentials until it is
+# API_TOKEN_REFRESH_MARGIN seconds from expiring, and log clients in again for their
+# calls to ArangoDB in those last seconds, for up to API_TOKEN_REAUTH_MAX_AGE seconds
+# after they last logged in themselves (by default the one hour lifetime of an
+# ArangoDB token). A token that has already expired is never swapped for a new one
+API_TOKEN_CACHE = os.environ.get("OTTER_API_TOKEN_CACHE", "1") == "1"
+API_TOKEN_REFRESH_MARGIN = float(os.environ.get("OTTER_API_TOKEN_REFRESH_MARGIN", 300))
+API_TOKEN_REAUTH_MAX_AGE = float(os.environ.get("OTTER_API_TOKEN_REAUTH_MAX_AGE", 3600))
+
+# guard against runaway AQL sent to the cursor route and the search page. Queries
+# are explained first and turned away if ArangoDB estimates they cost more than
+# API_AQL_MAX_COST or return more than API_AQL_MAX_ITEMS documents (0 turns either
+# check off), and are run with ArangoDB's own limits of API_AQL_MAX_RUNTIME seconds
+# and API_AQL_MEMORY_LIMIT bytes. Queries typed into the search page also get a
+# LIMIT of API_AQL_INTERACTIVE_LIMIT if they have none and a shorter run time, and
+# the editor never shows more rows than that either way. Explaining a query costs
+# an extra round trip to ArangoDB, so the guard is off unless it is turned on
+API_AQL_GUARD = os.environ.get("OTTER_API_AQL_GUARD", "0") == "1"
+API_AQL_MAX_COST = float(os.environ.get("OTTER_API_AQL_MAX_COST", 1e7))
+API_AQL_MAX_ITEMS = float(os.environ.get("OTTER_API_AQL_MAX_ITEMS", 0))
+API_AQL_MAX_RUNTIME = float(os.environ.get("OTTER_API_AQL_MAX_RUNTIME", 120))
+API_AQL_MEMORY_LIMIT = int(os.environ.get("OTTER_API_AQL_MEMORY_LIMIT", 2*1024**3))
+API_AQL_INTERACTIVE_LIMIT = int(os.environ.get("OTTER_API_AQL_INTERACTIVE_LIMIT", 1000))
+API_AQL_INTERACTIVE_MAX_RUNTIME = float(
+    os.environ.get("OTTER_API_AQL_INTERACTIVE_MAX_RUNTIME", 10)
+)
+
+# the AQL editor on the search page runs the query once it has not been typed in for
+# AQL_EDITOR_DEBOUNCE seconds (0 to only run it with the Run button), and reads the
+# results AQL_EDITOR_BATCH_SIZE rows at a time as "Load more" is pressed
+AQL_EDITOR_DEBOUNCE = float(os.environ.get("OTTER_AQL_EDITOR_DEBOUNCE", 0.8))
+AQL_EDITOR_BATCH_SIZE = int(os.environ.get("OTTER_AQL_EDITOR_BATCH_SIZE", 100))
+
+# "Download Results" streams the zip as it is written, fetching the full documents
+# RESULTS_ZIP_BATCH_SIZE at a time so only that many are ever held in memory. The
+# table exports with photometry fetch the full documents the same number at a time
+RESULTS_ZIP_BATCH_SIZE = int(os.environ.get("OTTER_RESULTS_ZIP_BATCH_SIZE", 100))
+
+# the table exports of search results are written and sent on a batch of rows at a
+# time, in pieces of at most EXPORT_CHUNK_SIZE bytes. VOTables and the photometry
+# tables are the exception, they are held in memory and written in one go at the end
+EXPORT_CHUNK_SIZE = int(os.environ.get("OTTER_EXPORT_CHUNK_SIZE", 1 << 20))
+
 WEB_BASE_URL = "/"
 print(f"The WEB_BASE_URL for the app is set to {WEB_BASE_URL}")
 
+# search results tables with more rows than this are paginated and sorted on the
+# server, so only the rows on the page being looked at are sent to the browser. Set
+# to 0 to always do it on the server
+TABLE_SERVER_SIDE_ROWS = int(os.environ.get("OTTER_TABLE_SERVER_SIDE_ROWS", 500))
+
+# keep the summary fields of every transient in memory and answer the filters of
+# the search page from those, so only the matching documents are fetched from
+# ArangoDB. The snapshot is brought up to date every CATALOG_SNAPSHOT_REFRESH
+# seconds, and searches go to ArangoDB as before until it is first loaded
+CATALOG_SNAPSHOT = os.environ.get("OTTER_CATALOG_SNAPSHOT", "1") == "1"
+CATALOG_SNAPSHOT_REFRESH = float(os.environ.get("OTTER_CATALOG_SNAPSHOT_REFRESH", 300))
+
+# how long, in seconds, a search from the search forms may take before it is stopped
+# and shows what it has found so far. Set to 0 to let searches run for as long as
+# they take
+SEARCH_TIMEOUT = float(os.environ.get("OTTER_SEARCH_TIMEOUT", 30))
+
+# the number of names suggested as a transient name is typed, from the names in the
+# catalog snapshot
+NAME_SUGGESTIONS = int(os.environ.get("OTTER_NAME_SUGGESTIONS", 10))
+
+# the /metrics endpoint for Prometheus is only served to requests with the header
+# "Authorization: Bearer <METRICS_TOKEN>", since the route names, error rates and
+# cache sizes it shows are not meant to be public. It is turned off if no token is
+# set
+METRICS_TOKEN = os.environ.get("OTTER_METRICS_TOKEN", "")
+
 # a hashmap of page routes that are unrestricted. The only one that shouldn't
 # be in here for now is the vetting page
 unrestricted_page_routes = {
@@ -0,0 +1,235 @@
+"""
+A small in process metrics registry that renders the Prometheus text format, so the
+app can be monitored without running any other services
+"""
+import math
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# latency buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+def _format_labels(labels:tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+def _format_value(value:float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name:str, help:str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(_Metric):
+    """
+    A value that only goes up, e.g. the number of requests
+    """
+    type = "counter"
+
+    def __init__(self, name:str, help:str):
+        super().__init__(name, help)
+        self._values = {}
+
+    def inc(self, amount:float=1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+class Histogram(_Metric):
+    """
+    The distribution of some value, e.g. how long requests take
+
+    Args:
+        name [str] : The name of the metric
+        help [str] : A description of the metric
+        buckets [tuple] : The upper bounds of the buckets
+    """
+    type = "histogram"
+
+    def __init__(self, name:str, help:str, buckets:tuple=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value:float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0))
+            if counts is None:
+                counts = [0]*(len(self.buckets) + 1)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """
+        A context manager that observes how long the with block took
+        """
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._values.items()
+            ]
+
+        lines = self.header()
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(key + (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram:Histogram, labels:dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+class CallbackMetric(_Metric):
+    """
+    A metric whose value is read from somewhere else when it is scraped, e.g. the
+    hit counter on a cache
+
+    Args:
+        name [str] : The name of the metric
+        help [str] : A description of the metric
+        fn [Callable] : Returns the current value, or a dict mapping a dict of labels
+                        (as a tuple of pairs) to the value
+        type [str] : "gauge" or "counter"
+    """
+
+    def __init__(self, name:str, help:str, fn:Callable, type:str="gauge"):
+        super().__init__(name, help)
+        self.fn = fn
+        self.type = type
+
+    def render(self) -> list[str]:
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return self.header() + [
+            f"{self.name}{_format_labels(key)} {_format_value(val)}"
+            for key, val in value.items()
+        ]
+
+class Registry:
+    """
+    A collection of metrics that can be rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric:_Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"A metric called {metric.name} is already registered!")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name:str, help:str) -> Counter:
+        return self._add(Counter(name, help))
+
+    def histogram(self, name:str, help:str, buckets:tuple=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, buckets))
+
+    def gauge_function(self, name:str, help:str, fn:Callable) -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, fn, type="gauge"))
+
+    def counter_function(self, name:str, help:str, fn:Callable) -> CallbackMetric:
+        return self._add(CallbackMetric(name, help, fn, type="counter"))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "otter_http_requests_total",
+    "HTTP requests handled by the app, by route template, method and status"
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    "otter_http_request_duration_seconds",
+    "Time to handle an HTTP request, including sending the body"
+)
+HTTP_BYTES_IN = REGISTRY.counter(
+    "otter_http_request_bytes_total",
+    "Bytes received in HTTP request bodies"
+)
+HTTP_BYTES_OUT = REGISTRY.counter(
+    "otter_http_response_bytes_total",
+    "Bytes sent in HTTP response bodies"
+)
+PAGE_RENDER = REGISTRY.histogram(
+    "otter_page_render_seconds",
+    "Time to build each NiceGUI page"
+)
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "otter_upstream_requests_total",
+    "Calls made to ArangoDB by the API proxy, by proxy route, method and status"
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "otter_upstream_request_duration_seconds",
+    "Time until ArangoDB answered a call from the API proxy"
+)
+UPSTREAM_BYTES_OUT = REGISTRY.counter(
+    "otter_upstream_request_bytes_total",
+    "Bytes sent to ArangoDB by the API proxy"
+)
+UPSTREAM_BYTES_IN = REGISTRY.counter(
+    "otter_upstream_response_bytes_total",
+    "Bytes received from ArangoDB by the API proxy"
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "otter_upstream_retries_total",
+    "Idempotent calls to ArangoDB that were retried after failing to connect"
+)
+
+def ratio(numerator:Union[int, float], denominator:Union[int, float]) -> float:
+    """
+    numerator/denominator, or 0 if the denominator is 0
+    """
+    return numerator/denominator if denominator else 0
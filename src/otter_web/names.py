@@ -0,0 +1,187 @@
+"""
+A trigram index of transient names for partial name searches and suggestions. Every
+default name and alias is upper cased and filed under each run of three characters
+in it, so the names containing some text are found by checking only the names filed
+under its rarest trigram, and names that are close to some text (a missing space, a
+typo) are found by counting the trigrams they share with it. Text too short to have
+a trigram is looked up in the names sorted alphabetically instead.
+"""
+import heapq
+import bisect
+import threading
+from collections import Counter
+from typing import Hashable, Iterable
+
+# trigrams in more than this fraction of the names say little about how similar two
+# names are, so they are not counted for fuzzy matches
+COMMON_TRIGRAM = 0.05
+
+# the smallest fraction of trigrams (the Jaccard index) a name has to share with the
+# text for it to be a fuzzy match
+MIN_SIMILARITY = 0.3
+
+def trigrams(text:str) -> set[str]:
+    """
+    Every run of three characters in text
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class NameIndex:
+    """
+    The names of a set of transients, each with an id, that can be searched by part
+    of a name. Names can be added to it while it is being searched.
+
+    Args:
+        ids [Iterable[Hashable]] : The id of each transient, e.g. its _key
+        names [Iterable[Iterable[str]]] : The default name and aliases of each
+    """
+
+    def __init__(self, ids:Iterable[Hashable]=(), names:Iterable[Iterable[str]]=()):
+        self._lock = threading.Lock()
+        self._ids = []
+        self._values = []
+        self._upper = []
+        self._postings = {}
+        for one_id, one_names in zip(ids, names):
+            self._add(one_id, one_names)
+
+        # the upper cased names in alphabetical order, with their entries
+        order = sorted(range(len(self._upper)), key=self._upper.__getitem__)
+        self._sorted = [self._upper[i] for i in order]
+        self._sorted_entries = order
+
+    def __len__(self):
+        return len(self._values)
+
+    def _add(self, one_id:Hashable, names:Iterable[str]) -> None:
+        for name in dict.fromkeys(names):
+            entry = len(self._values)
+            upper = name.upper()
+            # everything about an entry is in place before it is filed under its
+            # trigrams, so a search never finds half of one
+            self._ids.append(one_id)
+            self._values.append(name)
+            self._upper.append(upper)
+            for trigram in trigrams(upper):
+                self._postings.setdefault(trigram, []).append(entry)
+
+    def add(self, one_id:Hashable, names:Iterable[str]) -> None:
+        """
+        Add the names of a transient
+
+        Args:
+            one_id [Hashable] : The id of the transient
+            names [Iterable[str]] : Its default name and aliases
+        """
+        with self._lock:
+            start = len(self._values)
+            self._add(one_id, names)
+            for entry in range(start, len(self._values)):
+                position = bisect.bisect_right(self._sorted, self._upper[entry])
+                self._sorted.insert(position, self._upper[entry])
+                self._sorted_entries.insert(position, entry)
+
+    def _starting(self, text:str) -> Iterable[int]:
+        """
+        The entries whose upper cased name starts with text, which is already upper
+        cased, in alphabetical order
+        """
+        start = bisect.bisect_left(self._sorted, text)
+        end = bisect.bisect_left(self._sorted, text + "\U0010ffff")
+        entries = self._sorted_entries
+        return (entries[position] for position in range(start, end))
+
+    def _containing(self, text:str) -> Iterable[int]:
+        """
+        The entries whose upper cased name contains text, which is already upper cased
+        """
+        upper = self._upper
+        if len(text) < 3:
+            return (i for i in range(len(upper)) if text in upper[i])
+        postings = [self._postings.get(trigram, ()) for trigram in trigrams(text)]
+        rarest = min(postings, key=len)
+        return (i for i in list(rarest) if text in upper[i])
+
+    def ids(self, text:str) -> list[Hashable]:
+        """
+        The ids of the transients with a name containing text, ignoring case, in the
+        order they were added
+
+        Args:
+            text [str] : Part of a name
+        """
+        ids = self._ids
+        matches = sorted(self._containing(text.upper()))
+        return list(dict.fromkeys(ids[i] for i in matches))
+
+    def fuzzy(self, text:str, limit:int=10) -> list[tuple[float, str]]:
+        """
+        The names sharing the most trigrams with text, best first, as (similarity,
+        name) pairs
+
+        Args:
+            text [str] : A name or part of one, it does not have to be spelled exactly
+            limit [int] : The most names to return
+        """
+        wanted = trigrams(text.upper())
+        if not wanted:
+            return []
+        too_common = COMMON_TRIGRAM*len(self._upper)
+        shared = Counter()
+        for trigram in wanted:
+            posting = self._postings.get(trigram, ())
+            if len(posting) <= too_common:
+                shared.update(list(posting))
+
+        # a name sharing fewer trigrams than this can not be similar enough, however
+        # short it is
+        fewest = MIN_SIMILARITY*len(wanted)/(1 + MIN_SIMILARITY)
+        scores = {}
+        for i, count in shared.items():
+            if count < fewest:
+                continue
+            name = self._values[i]
+            similarity = count/(len(wanted) + len(trigrams(self._upper[i])) - count)
+            if similarity >= MIN_SIMILARITY:
+                scores[name] = max(similarity, scores.get(name, 0))
+        return heapq.nlargest(limit, ((s, n) for n, s in scores.items()))
+
+    def suggest(self, text:str, limit:int=10) -> list[str]:
+        """
+        Names to suggest for what has been typed so far: names that start with it
+        first, then names that contain it, both shortest first, then names that are
+        close to it. For fewer than three characters only names that start with it
+        are suggested, in alphabetical order.
+
+        Args:
+            text [str] : What has been typed into a name field
+            limit [int] : The most names to suggest
+        """
+        text = text.strip()
+        if not text or limit <= 0:
+            return []
+        upper = text.upper()
+
+        values = self._values
+        if len(upper) < 3:
+            suggestions = []
+            for i in self._starting(upper):
+                if values[i] not in suggestions:
+                    suggestions.append(values[i])
+                    if len(suggestions) == limit:
+                        break
+            return suggestions
+
+        ranked = heapq.nsmallest(
+            limit*4,
+            (
+                (not self._upper[i].startswith(upper), len(values[i]), values[i])
+                for i in self._containing(upper)
+            )
+        )
+        suggestions = list(dict.fromkeys(name for _, _, name in ranked))[:limit]
+        if len(suggestions) < limit:
+            for _, name in self.fuzzy(text, limit):
+                if name not in suggestions:
+                    suggestions.append(name)
+        return suggestions[:limit]
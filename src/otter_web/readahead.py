@@ -0,0 +1,161 @@
+"""
+Read ahead of open AQL cursors, so the next batch is already on its way from
+ArangoDB while the client is still working through the current one
+"""
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+# the default lifetime of an ArangoDB cursor, in seconds, if the query did not set one
+DEFAULT_CURSOR_TTL = 30
+
+@dataclass
+class _OpenCursor:
+    identity: str
+    ttl: float
+    expires: float
+    batch: Optional[asyncio.Task] = None
+    nbytes: int = 0
+
+class CursorReadAhead:
+    """
+    The open cursors of this worker, each with at most one batch fetched ahead of the
+    client. The batch is the only copy of those results once ArangoDB has moved on,
+    so batches are never evicted to make room. Instead no new batch is fetched while
+    the buffer is full, and a cursor is only forgotten once ArangoDB has expired it
+    too.
+
+    Args:
+        worker [str] : Identifies this worker in the cursor ids handed to clients
+        max_bytes [int] : Stop reading ahead while the fetched batches take up more
+                          than this
+        max_cursors [int] : The number of cursors to read ahead at once
+    """
+
+    def __init__(self, worker:str, max_bytes:int, max_cursors:int):
+        self.worker = worker
+        self.max_bytes = max_bytes
+        self.max_cursors = max_cursors
+        self._cursors = {}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._cursors)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(cursor.nbytes for cursor in self._cursors.values())
+
+    def client_id(self, cursor_id:str) -> str:
+        """
+        The id to hand to the client for an ArangoDB cursor id
+        """
+        return f"{cursor_id}-{self.worker}"
+
+    @staticmethod
+    def parse(client_id:str) -> tuple[Optional[str], str]:
+        """
+        Split a cursor id from a client into the worker holding it and the ArangoDB
+        cursor id. The worker is None if the cursor is not read ahead.
+        """
+        cursor_id, sep, worker = client_id.partition("-")
+        if not sep:
+            return None, client_id
+        return worker, cursor_id
+
+    def open(self, cursor_id:str, identity:str, ttl:float=None) -> bool:
+        """
+        Start tracking a cursor. Returns False if there is no room for it, in which
+        case it is left for the client to page through itself.
+
+        Args:
+            cursor_id [str] : The ArangoDB cursor id
+            identity [str] : Who created the cursor, only they can read from it
+            ttl [float] : The ttl the cursor was created with, in seconds
+        """
+        self._prune()
+        if len(self._cursors) >= self.max_cursors:
+            return False
+        ttl = ttl or DEFAULT_CURSOR_TTL
+        self._cursors[cursor_id] = _OpenCursor(
+            identity=identity,
+            ttl=ttl,
+            expires=time.monotonic() + ttl
+        )
+        return True
+
+    def fetch_ahead(
+            self,
+            cursor_id:str,
+            fetch:Callable[[], Awaitable[httpx.Response]]
+    ) -> bool:
+        """
+        Start fetching the next batch of a cursor in the background, if there is room
+        in the buffer. Returns True if it was started.
+
+        Args:
+            cursor_id [str] : The ArangoDB cursor id
+            fetch [Callable] : An async function that advances the cursor
+        """
+        cursor = self._cursors.get(cursor_id)
+        if cursor is None or cursor.batch is not None or self.nbytes >= self.max_bytes:
+            return False
+
+        async def run():
+            response = await fetch()
+            cursor.nbytes = len(response.content)
+            # ArangoDB restarts the clock of a cursor every time it is used
+            cursor.expires = time.monotonic() + cursor.ttl
+            return response
+
+        cursor.batch = asyncio.ensure_future(run())
+        cursor.batch.add_done_callback(_retrieve)
+        return True
+
+    def get(self, cursor_id:str) -> Optional[_OpenCursor]:
+        """
+        The cursor with this ArangoDB id, or None if it is not tracked or has expired
+        """
+        self._prune()
+        return self._cursors.get(cursor_id)
+
+    def take(self, cursor_id:str) -> Optional[asyncio.Task]:
+        """
+        Take the batch fetched ahead for a cursor, or None if there is not one and
+        the cursor has to be advanced through ArangoDB. Either way the cursor stops
+        being tracked until it is opened again.
+        """
+        cursor = self._cursors.pop(cursor_id, None)
+        if cursor is None or cursor.batch is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cursor.batch
+
+    def close(self, cursor_id:str) -> None:
+        """
+        Stop tracking a cursor and throw away its batch
+        """
+        cursor = self._cursors.pop(cursor_id, None)
+        if cursor is not None and cursor.batch is not None:
+            cursor.batch.cancel()
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        stale = [
+            cursor_id for cursor_id, cursor in self._cursors.items()
+            if cursor.expires < now and (cursor.batch is None or cursor.batch.done())
+        ]
+        for cursor_id in stale:
+            self.expired += 1
+            self.close(cursor_id)
+
+def _retrieve(task:asyncio.Task) -> None:
+    # a batch nobody comes back for should not log an unretrieved exception
+    if not task.cancelled():
+        task.exception()
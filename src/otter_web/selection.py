@@ -0,0 +1,252 @@
+"""
+Build the AQL for a selection of transients from the filters of the search page,
+the same ones otter.Otter.query takes. Unlike otter.Otter.query every value is
+passed as a bind parameter, so the filters can come straight from an HTTP request.
+"""
+from typing import Optional, Union
+
+from astropy.coordinates import SkyCoord
+
+# the keyword arguments of transient_query, with the type their values are parsed to
+# when they come from a query string
+FILTERS = {
+    "names": str,
+    "ra": str,
+    "dec": str,
+    "ra_unit": str,
+    "radius": float,
+    "minz": float,
+    "maxz": float,
+    "mindec": float,
+    "maxdec": float,
+    "refs": str,
+    "hasphot": bool,
+    "has_radio_phot": bool,
+    "has_uvoir_phot": bool,
+    "has_xray_phot": bool,
+    "hasspec": bool,
+    "spec_classed": bool,
+    "unambiguous": bool,
+    "classification": str,
+    "class_confidence_threshold": float,
+    "has_det": bool,
+    "wave_det": str
+}
+
+# filters that can be given more than once to match any of the values
+LIST_FILTERS = {"names", "refs"}
+
+WAVE_DETS = {"radio", "uvoir", "xray"}
+
+# the keys otter.Otter.get_meta keeps, which is all the search page needs
+META_KEYS = [
+    "name",
+    "coordinate",
+    "date_reference",
+    "distance",
+    "classification",
+    "reference_alias",
+]
+
+def _parse_bool(value:str) -> bool:
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off", ""):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+def parse_filters(params:list[tuple[str, str]]) -> dict:
+    """
+    The keyword arguments for transient_query from the (key, value) pairs of a query
+    string. Raises ValueError for unknown keys or values that can not be parsed.
+
+    Args:
+        params [list[tuple[str, str]]] : The query parameters, in order
+    """
+    filters = {}
+    for key, value in params:
+        if key not in FILTERS:
+            raise ValueError(f"Unknown filter {key!r}")
+        kind = FILTERS[key]
+        try:
+            parsed = _parse_bool(value) if kind is bool else kind(value)
+        except ValueError as e:
+            raise ValueError(f"Invalid value for {key}: {e}") from e
+
+        if key in LIST_FILTERS and key in filters:
+            previous = filters[key]
+            if not isinstance(previous, list):
+                previous = [previous]
+            filters[key] = previous + [parsed]
+        else:
+            filters[key] = parsed
+    return filters
+
+def search_coords(ra:str, dec:str, ra_unit:str="deg") -> SkyCoord:
+    """
+    The position to cone search around, read the same way as on the search page
+    where the declination is always in degrees
+
+    Args:
+        ra [str] : The right ascension
+        dec [str] : The declination, in degrees
+        ra_unit [str] : The unit of the right ascension, deg or hourangle
+    """
+    return SkyCoord(ra, dec, unit=(ra_unit, "deg"))
+
+def transient_query(
+        names:Union[str, list[str]]=None,
+        coords:SkyCoord=None,
+        radius:float=5,
+        minz:float=None,
+        maxz:float=None,
+        mindec:float=-90,
+        maxdec:float=90,
+        refs:Union[str, list[str]]=None,
+        hasphot:bool=False,
+        has_radio_phot:bool=False,
+        has_uvoir_phot:bool=False,
+        has_xray_phot:bool=False,
+        hasspec:bool=False,
+        spec_classed:bool=False,
+        unambiguous:bool=False,
+        classification:str=None,
+        class_confidence_threshold:float=0,
+        has_det:bool=False,
+        wave_det:Optional[str]=None,
+        ra:str=None,
+        dec:str=None,
+        ra_unit:str="deg",
+        returns:str="transient"
+) -> tuple[str, dict]:
+    """
+    The AQL query and bind parameters that select the transients matching the
+    filters. See otter.Otter.query for what each filter does, the only difference is
+    that a transient matching a classification or list of names more than once is
+    still only returned once. The position of a cone search can be given either as
+    coords or as ra, dec and ra_unit like the search page does. returns is the AQL
+    expression returned for each transient, e.g. "transient._key" for only the keys.
+    """
+    filters = []
+    bind_vars = {}
+
+    if hasphot or has_radio_phot or has_xray_phot or has_uvoir_phot:
+        filters.append("FILTER 'photometry' IN ATTRIBUTES(transient)")
+    for obs_type, wanted in (
+            ("radio", has_radio_phot),
+            ("uvoir", has_uvoir_phot),
+            ("xray", has_xray_phot)
+    ):
+        if wanted:
+            filters.append(f"FILTER '{obs_type}' IN transient.photometry[*].obs_type")
+
+    if coords is None and ra is not None and dec is not None:
+        coords = search_coords(ra, dec, ra_unit)
+    if coords is not None:
+        bind_vars |= {
+            "ra": float(coords.ra.deg),
+            "dec": float(coords.dec.deg),
+            "sep": radius/3600
+        }
+        filters.append(
+            """FILTER (
+              ABS(((transient._ra - @ra + 180) % 360) - 180) *
+              COS(RADIANS(@dec)) <= @sep AND
+              ABS(transient._dec - @dec) <= @sep
+            )
+            FILTER ASTRO::CONE_SEARCH(transient._ra, transient._dec, @ra, @dec, @sep)"""
+        )
+
+    if mindec > -90:
+        bind_vars["mindec"] = mindec
+        filters.append("FILTER transient._dec >= @mindec")
+    if maxdec < 90:
+        bind_vars["maxdec"] = maxdec
+        filters.append("FILTER transient._dec <= @maxdec")
+
+    if has_det:
+        if wave_det is None:
+            filters.append(
+                "FILTER FLATTEN(transient.photometry[*].upperlimit) ANY == false"
+            )
+        else:
+            if wave_det not in WAVE_DETS:
+                raise ValueError(f"wave_det must be one of {sorted(WAVE_DETS)}")
+            bind_vars["wave_det"] = wave_det
+            filters.append(
+                """FILTER "photometry" IN ATTRIBUTES(transient)
+            LET phot = (
+              FOR p IN transient.photometry
+              FILTER p.obs_type == @wave_det
+              RETURN p
+            )
+            FILTER FLATTEN(phot[*].upperlimit) ANY == false"""
+            )
+
+    if hasspec:
+        filters.append("FILTER 'spectra' IN ATTRIBUTES(transient)")
+    if spec_classed:
+        filters.append("FILTER transient.classification.spec_classed >= 1")
+    if unambiguous:
+        filters.append("FILTER transient.classification.unambiguous")
+
+    if classification is not None:
+        bind_vars |= {
+            "classification": f"%{classification}%",
+            "class_confidence_threshold": class_confidence_threshold
+        }
+        filters.append(
+            """FILTER HAS(transient, 'classification')
+            FILTER LENGTH(
+              FOR subdoc IN transient.classification.value
+                FILTER subdoc.confidence > TO_NUMBER(@class_confidence_threshold)
+                FILTER subdoc.object_class LIKE @classification
+                LIMIT 1
+                RETURN 1
+            ) > 0"""
+        )
+
+    for key, bound, name, comparison in (
+            ("minz", minz, "redshifts1", ">="),
+            ("maxz", maxz, "redshifts2", "<=")
+    ):
+        if bound is None:
+            continue
+        bind_vars[key] = bound
+        filters.append(
+            f"""FILTER 'redshift' IN transient.distance[*].distance_type
+            LET {name} = (
+                FOR val IN transient.distance
+                FILTER val.distance_type == 'redshift'
+                FILTER TO_NUMBER(val.value) {comparison} @{key}
+                RETURN val
+            )
+            FILTER COUNT({name}) > 0"""
+        )
+
+    if names is not None:
+        if isinstance(names, str):
+            bind_vars["name"] = f"%{names}%"
+            filters.append("FILTER UPPER(transient.name) LIKE UPPER(@name)")
+        elif isinstance(names, list):
+            bind_vars["names"] = names
+            filters.append(
+                "FILTER LENGTH(INTERSECTION(@names, transient.name.alias[*].value)) > 0"
+            )
+        else:
+            raise ValueError("Names must be either a string or list")
+
+    if refs is not None:
+        bind_vars["refs"] = [refs] if isinstance(refs, str) else list(refs)
+        filters.append(
+            "FILTER LENGTH(INTERSECTION(@refs, transient.reference_alias[*].name)) > 0"
+        )
+
+    query_filters = "\n            ".join(filters)
+    query = f"""
+        FOR transient IN transients
+            {query_filters}
+            RETURN {returns}
+        """
+    return query, bind_vars
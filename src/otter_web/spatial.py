@@ -0,0 +1,220 @@
+"""
+A spatial index of sky positions for cone searches and cross matches, using the
+zones algorithm (Gray et al. 2006, "There Goes the Neighborhood"). The sky is cut
+into declination zones, and the positions are sorted by zone and then by right
+ascension, so the candidates for a cone are found with a binary search in each zone
+it overlaps. The candidates are then checked exactly with the dot product of unit
+vectors.
+
+Positions added after the index is built are kept in a small buffer that is
+searched alongside it, and merged into the sorted arrays once it grows.
+"""
+import threading
+from typing import Iterable
+
+import numpy as np
+
+# the height of the declination zones, in degrees. Cones much smaller than this (like
+# the 5" the duplicate check uses) only ever touch one or two zones
+ZONE_HEIGHT = 0.25
+
+# the most positions that are added before they are merged into the sorted arrays
+MAX_PENDING = 1024
+
+def unit_vectors(ra:np.ndarray, dec:np.ndarray) -> np.ndarray:
+    """
+    The unit vectors, as a (3, n) array, of positions in degrees
+    """
+    ra, dec = np.radians(ra), np.radians(dec)
+    return np.stack([np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec)])
+
+def ra_half_width(dec:float, radius:float) -> float:
+    """
+    Half the range of right ascension, in degrees, covered by a cone, or 180 if the
+    cone contains a pole
+
+    Args:
+        dec [float] : The declination of the centre of the cone, in degrees
+        radius [float] : The radius of the cone, in degrees
+    """
+    if abs(dec) + radius >= 90:
+        return 180.0
+    d, r = np.radians(dec), np.radians(radius)
+    return float(np.degrees(np.arctan(
+        np.sin(r)/np.sqrt(abs(np.cos(d - r)*np.cos(d + r)))
+    )))
+
+class _Zones:
+    """
+    Positions sorted by zone and right ascension. Never changed once built.
+    """
+
+    def __init__(
+            self,
+            ids:np.ndarray,
+            ra:np.ndarray,
+            dec:np.ndarray,
+            zone_height:float
+    ):
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+        ids = np.asarray(ids)
+
+        # positions that are missing can never be inside a cone
+        valid = np.isfinite(ra) & np.isfinite(dec)
+        ids, ra, dec = ids[valid], ra[valid] % 360, dec[valid]
+
+        self.zone_height = zone_height
+        self.n_zones = int(np.ceil(180/zone_height))
+        zones = self._zone(dec)
+        order = np.lexsort((ra, zones))
+
+        self.ids = ids[order]
+        self.ra = ra[order]
+        self.dec = dec[order]
+        self.xyz = unit_vectors(self.ra, self.dec)
+        self.zone_starts = np.searchsorted(zones[order], np.arange(self.n_zones + 1))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _zone(self, dec):
+        zone = np.floor((np.asarray(dec) + 90)/self.zone_height).astype(np.int64)
+        return np.clip(zone, 0, self.n_zones - 1)
+
+    def query(self, ra:float, dec:float, radius:float) -> np.ndarray:
+        """
+        The positions in the sorted arrays inside a cone, all in degrees
+        """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+
+        ra = ra % 360
+        width = ra_half_width(dec, radius)
+        if width >= 180:
+            ranges = [(0.0, 360.0)]
+        elif ra - width < 0:
+            ranges = [(0.0, ra + width), (ra - width + 360, 360.0)]
+        elif ra + width > 360:
+            ranges = [(ra - width, 360.0), (0.0, ra + width - 360)]
+        else:
+            ranges = [(ra - width, ra + width)]
+
+        candidates = []
+        for zone in range(self._zone(dec - radius), self._zone(dec + radius) + 1):
+            start, end = self.zone_starts[zone], self.zone_starts[zone + 1]
+            if start == end:
+                continue
+            zone_ra = self.ra[start:end]
+            for low, high in ranges:
+                first = start + np.searchsorted(zone_ra, low, side="left")
+                last = start + np.searchsorted(zone_ra, high, side="right")
+                if first < last:
+                    candidates.append(np.arange(first, last))
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+
+        candidates = np.concatenate(candidates)
+        centre = unit_vectors(np.array([ra]), np.array([dec]))[:, 0]
+        inside = centre @ self.xyz[:, candidates] >= np.cos(np.radians(radius))
+        return candidates[inside]
+
+class SkyIndex:
+    """
+    A spatial index of positions, each with an id, answering which ids are within a
+    radius of a position. Adding a position for an id already in the index moves it.
+
+    Args:
+        ids [Iterable] : The id of each position, e.g. the _key of the transient
+        ra [Iterable[float]] : The right ascension of each position, in degrees
+        dec [Iterable[float]] : The declination of each position, in degrees
+        zone_height [float] : The height of the declination zones, in degrees
+    """
+
+    def __init__(
+            self,
+            ids:Iterable=(),
+            ra:Iterable[float]=(),
+            dec:Iterable[float]=(),
+            zone_height:float=ZONE_HEIGHT
+    ):
+        self.zone_height = zone_height
+        self._lock = threading.Lock()
+        self._zones = _Zones(np.asarray(list(ids)), ra, dec, zone_height)
+        self._pending = {}
+        self._state = (self._zones, None, frozenset())
+
+    def add(self, ids:Iterable, ra:Iterable[float], dec:Iterable[float]) -> None:
+        """
+        Add positions to the index, replacing the positions of ids that are already
+        in it
+
+        Args:
+            ids [Iterable] : The id of each position
+            ra [Iterable[float]] : The right ascension of each position, in degrees
+            dec [Iterable[float]] : The declination of each position, in degrees
+        """
+        with self._lock:
+            for i, one_ra, one_dec in zip(ids, ra, dec):
+                self._pending[i] = (float(one_ra), float(one_dec))
+
+            if len(self._pending) > MAX_PENDING:
+                self._merge()
+                return
+
+            ids = list(self._pending)
+            ra, dec = np.array(list(self._pending.values())).reshape(-1, 2).T
+            pending = _Zones(np.asarray(ids), ra, dec, self.zone_height)
+            self._state = (self._zones, pending, frozenset(ids))
+
+    def _merge(self) -> None:
+        zones = self._zones
+        keep = ~np.isin(zones.ids, list(self._pending))
+        ra, dec = np.array(list(self._pending.values())).reshape(-1, 2).T
+        self._zones = _Zones(
+            np.concatenate([zones.ids[keep], np.asarray(list(self._pending))]),
+            np.concatenate([zones.ra[keep], ra]),
+            np.concatenate([zones.dec[keep], dec]),
+            self.zone_height
+        )
+        self._pending = {}
+        self._state = (self._zones, None, frozenset())
+
+    def query(self, ra:float, dec:float, radius:float) -> np.ndarray:
+        """
+        The ids of the positions inside a cone
+
+        Args:
+            ra [float] : The right ascension of the centre, in degrees
+            dec [float] : The declination of the centre, in degrees
+            radius [float] : The radius of the cone, in arcseconds
+        """
+        zones, pending, moved = self._state
+        radius = radius/3600
+        ids = zones.ids[zones.query(ra, dec, radius)]
+        if pending is None:
+            return ids
+        if moved:
+            ids = ids[[i not in moved for i in ids.tolist()]]
+        return np.concatenate([ids, pending.ids[pending.query(ra, dec, radius)]])
+
+    def crossmatch(
+            self,
+            ra:Iterable[float],
+            dec:Iterable[float],
+            radius:float
+    ) -> list[np.ndarray]:
+        """
+        The ids of the positions inside a cone around each of a list of positions
+
+        Args:
+            ra [Iterable[float]] : The right ascensions of the centres, in degrees
+            dec [Iterable[float]] : The declinations of the centres, in degrees
+            radius [float] : The radius of the cones, in arcseconds
+        """
+        ra = np.asarray(ra, dtype=float)
+        dec = np.asarray(dec, dtype=float)
+        return [
+            self.query(one_ra, one_dec, radius)
+            for one_ra, one_dec in zip(ra, dec)
+        ]
@@ -0,0 +1,372 @@
+"""
+Build the rows of the search results table for a whole list of transients at once.
+Every document is read once, the positions of all of them are converted in one
+SkyCoord and formatted as arrays, and the discovery dates are parsed in one Time per
+date format, rather than building a TransientRead, two Transients and a SkyCoord for
+each row.
+"""
+import datetime
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import numpy as np
+from astropy.time import Time
+from astropy.coordinates import SkyCoord
+
+NO_DATE = datetime.datetime(1, 1, 1)
+UNKNOWN_CLASS = "Unknown Class"
+MISSING_NAME = "Missing Default Name"
+
+def _default(entries:Iterable[dict], **match) -> Optional[dict]:
+    """
+    The entry otter.Transient._get_default would pick: the first of the entries
+    matching every key in match that is flagged as the default, or the first
+    matching entry if none of them are
+
+    Args:
+        entries [Iterable[dict]] : The list from the document, e.g. date_reference
+        **match : Values the entries must have to be considered
+    """
+    matching = [
+        entry for entry in entries
+        if isinstance(entry, dict)
+        and all(entry.get(key) == value for key, value in match.items())
+    ]
+    for entry in matching:
+        if entry.get("default") in (True, 1):
+            return entry
+    return matching[0] if matching else None
+
+def sexagesimal(
+        values:np.ndarray,
+        precision:int=2,
+        always_sign:bool=False
+) -> list[str]:
+    """
+    Format an array of angles in hours or degrees as zero padded "dd:mm:ss.ss"
+    strings, the same as astropy's Angle.to_string(sep=":", pad=True) gives but for
+    the whole array at once
+
+    Args:
+        values [np.ndarray] : The angles, in the unit of the first field
+        precision [int] : The number of decimal places of the seconds
+        always_sign [bool] : If True positive angles start with a +
+    """
+    values = np.asarray(values, dtype=float)
+    negative = np.signbit(values)
+    fraction, units = np.modf(np.abs(values))
+    fraction, minutes = np.modf(fraction*60)
+    seconds = fraction*60
+
+    # carry seconds that would be shown as 60 into the minutes, and so on, the way
+    # astropy does
+    carry = seconds >= 60 - 10.0**-precision
+    seconds[carry] = 0
+    minutes += carry
+    carry = minutes >= 60
+    minutes[carry] = 0
+    units += carry
+
+    plus = "+" if always_sign else ""
+    seconds_format = f"0{precision + 3}.{precision}f"
+    return [
+        f"{'-' if minus else plus}{u:02d}:{m:02d}:{format(s, seconds_format)}"
+        for minus, u, m, s in zip(
+            negative.tolist(),
+            units.astype(np.int64).tolist(),
+            minutes.astype(np.int64).tolist(),
+            seconds.tolist()
+        )
+    ]
+
+def coordinate_degrees(
+        coordinates:list[Optional[dict]]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The RA and Dec of each coordinate in degrees, converted with one SkyCoord for
+    each combination of units. Coordinates that are missing or can not be read give
+    NaN.
+
+    Args:
+        coordinates [list[Optional[dict]]] : Entries of the coordinate lists of the
+                                             documents, with ra, dec, ra_units and
+                                             dec_units
+    """
+    ra_degrees = np.full(len(coordinates), np.nan)
+    dec_degrees = np.full(len(coordinates), np.nan)
+
+    groups = defaultdict(list)
+    for i, coordinate in enumerate(coordinates):
+        if coordinate is not None and "ra" in coordinate and "dec" in coordinate:
+            units = (coordinate.get("ra_units"), coordinate.get("dec_units"))
+            groups[units].append(i)
+
+    for units, indexes in groups.items():
+        ra = [coordinates[i]["ra"] for i in indexes]
+        dec = [coordinates[i]["dec"] for i in indexes]
+        try:
+            # plain numbers are much faster to convert as a float array, astropy
+            # converts a list one element at a time
+            ra, dec = np.asarray(ra, dtype=float), np.asarray(dec, dtype=float)
+        except (TypeError, ValueError):
+            pass
+        try:
+            coords = SkyCoord(ra, dec, unit=units)
+        except Exception:
+            # one bad value spoils the whole array, so fall back to one at a time
+            for i, one_ra, one_dec in zip(indexes, ra, dec):
+                try:
+                    coord = SkyCoord(one_ra, one_dec, unit=units)
+                except Exception:
+                    continue
+                ra_degrees[i] = coord.ra.deg
+                dec_degrees[i] = coord.dec.deg
+            continue
+        ra_degrees[indexes] = coords.ra.deg
+        dec_degrees[indexes] = coords.dec.deg
+    return ra_degrees, dec_degrees
+
+def coordinate_strings(coordinates:list[Optional[dict]]) -> tuple[list[str], list[str]]:
+    """
+    The RA and Dec of each coordinate in hms/dms. Coordinates that are missing or can
+    not be read give empty strings.
+
+    Args:
+        coordinates [list[Optional[dict]]] : Entries of the coordinate lists of the
+                                             documents, with ra, dec, ra_units and
+                                             dec_units
+    """
+    ra_degrees, degrees = coordinate_degrees(coordinates)
+    hours = ra_degrees/15
+
+    valid = ~(np.isnan(hours) | np.isnan(degrees))
+    ra_strings = np.full(len(coordinates), "", dtype=object)
+    dec_strings = np.full(len(coordinates), "", dtype=object)
+    ra_strings[valid] = sexagesimal(hours[valid])
+    dec_strings[valid] = sexagesimal(degrees[valid], always_sign=True)
+    return ra_strings.tolist(), dec_strings.tolist()
+
+def _by_format(dates:list[Optional[dict]]) -> dict[str, list[int]]:
+    """
+    The positions of the date_reference entries with each date format
+    """
+    groups = defaultdict(list)
+    for i, date in enumerate(dates):
+        if date is not None and "value" in date:
+            groups[date.get("date_format") or "mjd"].append(i)
+    return groups
+
+def discovery_dates(dates:list[Optional[dict]]) -> list[datetime.datetime]:
+    """
+    The datetime of each date_reference entry, parsed with one Time for each date
+    format. Dates that are missing or can not be read give NO_DATE.
+
+    Args:
+        dates [list[Optional[dict]]] : Entries of the date_reference lists of the
+                                       documents
+    """
+    parsed = [NO_DATE]*len(dates)
+    for date_format, indexes in _by_format(dates).items():
+        values = [str(dates[i]["value"]).strip() for i in indexes]
+        try:
+            datetimes = Time(values, format=date_format).datetime
+        except Exception:
+            datetimes = []
+            for value in values:
+                try:
+                    datetimes.append(Time(value, format=date_format).datetime)
+                except Exception:
+                    datetimes.append(NO_DATE)
+        for i, value in zip(indexes, datetimes):
+            parsed[i] = value
+    return parsed
+
+def discovery_jds(dates:list[Optional[dict]]) -> np.ndarray:
+    """
+    The Julian date of each date_reference entry, for sorting by. This is much
+    faster than discovery_dates when the dates are numbers since they are not turned
+    into strings first. Dates that are missing or can not be read give -inf, so they
+    sort with NO_DATE.
+
+    Args:
+        dates [list[Optional[dict]]] : Entries of the date_reference lists of the
+                                       documents
+    """
+    jds = np.full(len(dates), -np.inf)
+    for date_format, indexes in _by_format(dates).items():
+        values = [dates[i]["value"] for i in indexes]
+        try:
+            values = np.asarray(values, dtype=float)
+        except (TypeError, ValueError):
+            values = [str(value).strip() for value in values]
+        try:
+            jds[indexes] = Time(values, format=date_format).jd
+        except Exception:
+            for i, value in zip(indexes, values):
+                try:
+                    jds[i] = Time(value, format=date_format).jd
+                except Exception:
+                    continue
+    return jds
+
+def default_name(event:dict) -> str:
+    """
+    The default name of a transient
+
+    Args:
+        event [dict] : The transient document
+    """
+    return (event.get("name") or {}).get("default_name", MISSING_NAME)
+
+def default_classification(event:dict) -> Optional[str]:
+    """
+    The default object class of a transient, or None if it does not have one
+
+    Args:
+        event [dict] : The transient document
+    """
+    classification = event.get("classification")
+    if not isinstance(classification, dict):
+        return None
+    default = _default(classification.get("value") or [])
+    return None if default is None else default.get("object_class")
+
+def default_redshift(event:dict) -> float:
+    """
+    The default redshift of a transient, or NaN if it does not have one
+
+    Args:
+        event [dict] : The transient document
+    """
+    redshift = _default(event.get("distance") or [], distance_type="redshift")
+    try:
+        return float(redshift["value"])
+    except (TypeError, KeyError, ValueError):
+        return np.nan
+
+def discovery_date(event:dict) -> Optional[dict]:
+    """
+    The date_reference entry of the discovery date of a transient, or None if it
+    does not have one
+
+    Args:
+        event [dict] : The transient document
+    """
+    return _default(event.get("date_reference") or [], date_type="discovery")
+
+def transient_rows(events:list[dict], ids:Iterable[int]=None) -> list[dict]:
+    """
+    The rows of the search results table, with the id, name, class, ra, dec and
+    discovery date of each transient
+
+    Args:
+        events [list[dict]] : The transient documents, or otter.Transient objects
+        ids [Iterable[int]] : The id of each row, default is its position in events
+    """
+    names = []
+    coordinates = []
+    dates = []
+    classes = []
+    for event in events:
+        names.append(default_name(event))
+        coordinate = event.get("coordinate") or [None]
+        coordinates.append(coordinate[0] if isinstance(coordinate[0], dict) else None)
+        dates.append(discovery_date(event))
+        classes.append(default_classification(event))
+
+    ra, dec = coordinate_strings(coordinates)
+    return [
+        {
+            "id": f"{i}",
+            "name": name,
+            "class": default_class if default_class is not None else UNKNOWN_CLASS,
+            "ra": ra_string,
+            "dec": dec_string,
+            "date": date
+        }
+        for i, name, default_class, ra_string, dec_string, date in zip(
+            range(len(names)) if ids is None else ids,
+            names,
+            classes,
+            ra,
+            dec,
+            discovery_dates(dates)
+        )
+    ]
+
+class ResultIndex:
+    """
+    Search results for a table that is paginated on the server. Only the columns
+    the table can be sorted by are pulled out of the documents, into arrays that are
+    argsorted the first time they are asked for, and full rows are only built for
+    the page being shown.
+
+    Args:
+        events [list[dict]] : The transient documents, or otter.Transient objects
+    """
+
+    SORTABLE = ("id", "name", "class", "date")
+
+    def __init__(self, events:list[dict]):
+        self.events = events
+        self._keys = {}
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.events)
+
+    def _key(self, column:str) -> np.ndarray:
+        if column not in self._keys:
+            events = self.events
+            if column == "name":
+                key = np.array([default_name(event) for event in events], dtype=str)
+            elif column == "class":
+                classes = [default_classification(event) for event in events]
+                key = np.array(
+                    [UNKNOWN_CLASS if c is None else c for c in classes],
+                    dtype=str
+                )
+            elif column == "date":
+                key = discovery_jds([discovery_date(event) for event in events])
+            else:
+                key = np.arange(len(events))
+            self._keys[column] = key
+        return self._keys[column]
+
+    def order(self, sort_by:str=None, descending:bool=False) -> np.ndarray:
+        """
+        The positions of the events sorted by a column
+
+        Args:
+            sort_by [str] : One of SORTABLE, default is the order they came in
+            descending [bool] : If True, sort from the largest to the smallest
+        """
+        if sort_by not in self.SORTABLE:
+            sort_by = "id"
+        if sort_by not in self._orders:
+            self._orders[sort_by] = np.argsort(self._key(sort_by), kind="stable")
+        order = self._orders[sort_by]
+        return order[::-1] if descending else order
+
+    def page(
+            self,
+            page:int,
+            rows_per_page:int,
+            sort_by:str=None,
+            descending:bool=False
+    ) -> list[dict]:
+        """
+        The rows of one page of the table
+
+        Args:
+            page [int] : The page number, starting at 1
+            rows_per_page [int] : The number of rows on a page, 0 for all of them
+            sort_by [str] : The column to sort by, see order
+            descending [bool] : If True, sort from the largest to the smallest
+        """
+        order = self.order(sort_by, descending)
+        if rows_per_page > 0:
+            start = (max(page, 1) - 1)*rows_per_page
+            order = order[start:start + rows_per_page]
+        indexes = order.tolist()
+        return transient_rows([self.events[i] for i in indexes], ids=indexes)
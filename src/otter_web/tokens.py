@@ -0,0 +1,181 @@
+"""
+A cache of the JWTs ArangoDB hands out through /_open/auth, so that clients logging
+in again and again with the same credentials do not each cost a round trip and a
+password hash on the database
+"""
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+def jwt_expiry(token:str) -> Optional[float]:
+    """
+    The exp claim of a JWT, as a unix timestamp, or None if there is not one. The
+    signature is not checked, ArangoDB does that when the token is used.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload))["exp"]
+        return float(exp)
+    except (IndexError, ValueError, KeyError, TypeError):
+        return None
+
+@dataclass
+class _Login:
+    credentials: bytes
+    token: str
+    content: bytes
+    headers: dict
+    expires: float
+    created: float
+
+class TokenCache:
+    """
+    The last token issued for each set of credentials, keyed by a keyed hash of the
+    username and password so the cache can not be used to check a guess offline.
+    The credentials themselves are kept in memory so that a client whose token is
+    about to run out can be logged in again for it.
+
+    Args:
+        margin [float] : Stop handing a token out this many seconds before it
+                         expires
+        max_age [float] : Forget the credentials this many seconds after the client
+                          last logged in itself
+        max_entries [int] : The number of credentials to remember
+    """
+
+    def __init__(self, margin:float, max_age:float, max_entries:int=10_000):
+        self.margin = margin
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._secret = secrets.token_bytes(32)
+        self._logins = OrderedDict()
+        # a hash of every token handed out, to the credentials it was issued for
+        self._issued = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self._logins)
+
+    def _hash(self, value:bytes) -> str:
+        return hmac.new(self._secret, value, hashlib.sha256).hexdigest()
+
+    def key(self, payload:dict) -> Optional[str]:
+        """
+        The cache key for the body of a login request, or None if it is not a
+        username and password login
+        """
+        if not isinstance(payload, dict):
+            return None
+        username, password = payload.get("username"), payload.get("password")
+        if not isinstance(username, str) or not isinstance(password, str):
+            return None
+        return self._hash(json.dumps([username, password]).encode())
+
+    def get(self, key:str) -> Optional[_Login]:
+        """
+        The last login for key, if its token is not about to expire
+        """
+        with self._lock:
+            login = self._logins.get(key)
+            if login is None or login.expires - self.margin < time.time():
+                self.misses += 1
+                return None
+            self._logins.move_to_end(key)
+            self.hits += 1
+            return login
+
+    def put(
+            self,
+            key:str,
+            credentials:bytes,
+            content:bytes,
+            headers:dict=None,
+            refresh:bool=False
+    ) -> Optional[str]:
+        """
+        Remember the response to a login. Returns the token, or None if the response
+        did not have a token with an expiry in it.
+
+        Args:
+            key [str] : The key from self.key
+            credentials [bytes] : The body of the login request
+            content [bytes] : The body of ArangoDB's response
+            headers [dict] : The headers of ArangoDB's response
+            refresh [bool] : True if the proxy logged in for the client, which does
+                             not extend how long the credentials are kept
+        """
+        try:
+            token = json.loads(content)["jwt"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        expires = jwt_expiry(token)
+        if expires is None:
+            return None
+
+        with self._lock:
+            previous = self._logins.pop(key, None)
+            created = previous.created if refresh and previous else time.time()
+            self._logins[key] = _Login(
+                credentials=credentials,
+                token=token,
+                content=content,
+                headers=headers or {},
+                expires=expires,
+                created=created
+            )
+            self._issued[self._hash(token.encode())] = key
+            if refresh:
+                self.refreshes += 1
+
+            while len(self._logins) > self.max_entries:
+                self._logins.popitem(last=False)
+            while len(self._issued) > 4*self.max_entries:
+                self._issued.popitem(last=False)
+        return token
+
+    def issued(self, token:str) -> Optional[str]:
+        """
+        The key of the credentials token was issued for, if it was handed out
+        through the cache and has not expired. None for any other token, which
+        includes made up ones since the cache only knows tokens ArangoDB issued.
+        """
+        expires = jwt_expiry(token)
+        if expires is None or expires < time.time():
+            return None
+        with self._lock:
+            return self._issued.get(self._hash(token.encode()))
+
+    def stale(self, token:str) -> Optional[tuple[str, bytes]]:
+        """
+        If token was issued through the cache and is about to expire, the key and
+        credentials to log in again with. None if the token is fine as it is, not
+        one the cache knows about or has already expired, since a token that has
+        run out must not keep working through the proxy.
+        """
+        expires = jwt_expiry(token)
+        now = time.time()
+        if expires is None or expires <= now or expires - self.margin >= now:
+            return None
+
+        with self._lock:
+            key = self._issued.get(self._hash(token.encode()))
+            login = self._logins.get(key) if key is not None else None
+            if login is None or login.created + self.max_age < time.time():
+                return None
+            return key, login.credentials
+
+    def clear(self) -> None:
+        with self._lock:
+            self._logins.clear()
+            self._issued.clear()
@@ -0,0 +1,322 @@
+"""
+A shared, pooled async HTTP client for talking to the ArangoDB server
+"""
+import math
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Hashable, Optional
+
+import httpx
+import requests
+
+from .config import (
+    API_POOL_SIZE,
+    API_KEEPALIVE_POOL_SIZE,
+    API_KEEPALIVE_EXPIRY,
+    API_CONNECT_TIMEOUT,
+    API_TIMEOUT,
+    API_RETRIES,
+    API_RETRY_BACKOFF,
+    API_RETRY_BACKOFF_MAX,
+    API_BREAKER_THRESHOLD,
+    API_BREAKER_RESET
+)
+
+log = logging.getLogger("otter-log")
+
+_client: Optional[httpx.AsyncClient] = None
+
+def start_client(**kwargs) -> httpx.AsyncClient:
+    """
+    Create the app wide client used to proxy requests to ArangoDB. This is meant to
+    be registered with app.on_startup so there is exactly one connection pool for
+    the lifetime of the app.
+
+    Args:
+        **kwargs : Passed on to httpx.AsyncClient, e.g. a transport for testing
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        return _client
+
+    limits = httpx.Limits(
+        max_connections=API_POOL_SIZE,
+        max_keepalive_connections=API_KEEPALIVE_POOL_SIZE,
+        keepalive_expiry=API_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(API_TIMEOUT, connect=API_CONNECT_TIMEOUT)
+
+    kwargs.setdefault("limits", limits)
+    kwargs.setdefault("timeout", timeout)
+    _client = httpx.AsyncClient(**kwargs)
+    log.info(
+        f"Started the ArangoDB client pool with up to {API_POOL_SIZE} connections"
+    )
+    return _client
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get the shared ArangoDB client, creating it if the startup hook has not run yet
+    (e.g. when API_ROUTER is mounted in an app other than the NiceGUI one).
+    """
+    if _client is None or _client.is_closed:
+        return start_client()
+    return _client
+
+async def close_client() -> None:
+    """
+    Close the shared client and all of its pooled connections
+    """
+    global _client
+    if _client is None:
+        return
+    await _client.aclose()
+    _client = None
+    log.info("Closed the ArangoDB client pool")
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls so that only one of them actually runs and
+    everyone waiting on it gets its result. The shared call runs in its own task so
+    a waiter going away does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(
+            self,
+            key:Hashable,
+            fn:Callable[[], Awaitable],
+            share:Callable=None,
+            discard:Callable[..., Awaitable]=None
+    ):
+        """
+        Run fn, or wait for the result of the call already running under key
+
+        Args:
+            key [Hashable] : Identifies calls that are interchangeable
+            fn [Callable] : An async function with no arguments that does the call
+            share [Callable] : Optional check of the result, if it returns False the
+                               result can only be used by the caller that made it and
+                               the other waiters run fn themselves
+            discard [Callable] : Optional async clean up of a result that is not
+                                 shared, run if the caller that made it goes away
+                                 before it is ready, e.g. to close an unread response
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            result, shareable = await asyncio.shield(task)
+            if shareable:
+                return result
+            return await fn()
+
+        async def run():
+            result = await fn()
+            return result, share is None or share(result)
+
+        self.leaders += 1
+        task = asyncio.ensure_future(run())
+        self._calls[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+
+        try:
+            result, _ = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if discard is not None:
+                task.add_done_callback(lambda t: _discard(t, discard))
+            raise
+        return result
+
+    def _forget(self, key:Hashable, task:asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception() # mark it retrieved in case every waiter went away
+
+def _discard(task:asyncio.Task, discard:Callable[..., Awaitable]) -> None:
+    # nobody else will use a result that was not shared, so it is cleaned up here
+    if task.cancelled() or task.exception() is not None:
+        return
+    result, shareable = task.result()
+    if not shareable:
+        asyncio.ensure_future(discard(result))
+
+# ArangoDB is up but can not answer right now, e.g. it is still starting
+RETRYABLE_STATUS = {502, 503, 504}
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling ArangoDB while it is known to be down
+
+    Args:
+        msg [str] : Why the call was not made
+        retry_after [float] : The number of seconds until the next probe
+    """
+    def __init__(self, msg, retry_after:float=1):
+        super().__init__(msg)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class CircuitBreaker:
+    """
+    Track whether ArangoDB is answering. After failure_threshold failures in a row
+    the circuit opens and every call fails straight away with CircuitOpen. Once
+    reset_timeout seconds have passed it is half open, one call is let through as a
+    probe and the circuit closes again if that succeeds. This is shared by the API
+    proxy and the pages, which call ArangoDB from threads, so it is thread safe.
+
+    Args:
+        failure_threshold [int] : The number of failures in a row that open the
+                                  circuit, 0 turns the breaker off
+        reset_timeout [float] : The number of seconds to wait before probing
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold:int, reset_timeout:float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Check whether a call can go to ArangoDB, raising CircuitOpen if not. Returns
+        True if the call is the probe of a half open circuit, in which case it must
+        end with record_success, record_failure or release.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+
+            waited = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and waited >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+
+            self.rejected += 1
+            raise CircuitOpen(
+                "The database is not responding, try again shortly",
+                retry_after=self.reset_timeout - waited
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                log.info("ArangoDB is answering again, closing the circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failure_threshold <= 0:
+                return
+            tripped = (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            )
+            if self.state == self.HALF_OPEN or tripped:
+                if self.state == self.CLOSED:
+                    self.trips += 1
+                    log.warning(
+                        f"ArangoDB failed {self.failures} times in a row, failing fast "
+                        f"for {self.reset_timeout:g}s"
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self, probe:bool) -> None:
+        """
+        End a call that did not tell us whether ArangoDB is up, e.g. it was cancelled
+        """
+        if probe:
+            with self._lock:
+                self._probing = False
+
+UPSTREAM_HEALTH = CircuitBreaker(
+    failure_threshold=API_BREAKER_THRESHOLD,
+    reset_timeout=API_BREAKER_RESET
+)
+
+def is_connection_error(e:Exception) -> bool:
+    """
+    True if e means ArangoDB could not be reached, from either httpx (the proxy) or
+    requests (pyArango, used by the pages). Timeouts waiting for an answer do not
+    count, since they are usually a slow query rather than the database being down
+    and retrying would run the query all over again.
+    """
+    return isinstance(
+        e,
+        (httpx.ConnectError, httpx.ConnectTimeout, requests.ConnectionError)
+    )
+
+def is_timeout(e:Exception) -> bool:
+    """
+    True if e means ArangoDB took too long to answer
+    """
+    return isinstance(e, (httpx.TimeoutException, requests.Timeout))
+
+def backoff(attempt:int) -> float:
+    """
+    The number of seconds to wait before retry number attempt (counting from 0), with
+    full jitter so that clients that failed together do not retry together
+    """
+    return random.uniform(0, min(API_RETRY_BACKOFF_MAX, API_RETRY_BACKOFF*2**attempt))
+
+def call_upstream(fn:Callable, *args, idempotent:bool=True, **kwargs):
+    """
+    Call ArangoDB from a page, e.g. call_upstream(db.get_meta, names="2018hyz").
+    Fails fast with CircuitOpen while the database is down, and retries connection
+    failures of idempotent calls.
+
+    Args:
+        fn [Callable] : The function that calls ArangoDB
+        *args : Passed on to fn
+        idempotent [bool] : Set to False if fn must not be run twice
+        **kwargs : Passed on to fn
+    """
+    attempt = 0
+    while True:
+        probe = UPSTREAM_HEALTH.allow()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if not is_connection_error(e):
+                if is_timeout(e):
+                    # too slow to tell whether the database is up
+                    UPSTREAM_HEALTH.release(probe)
+                else:
+                    # the database answered, just not with what was wanted
+                    UPSTREAM_HEALTH.record_success()
+                raise
+            UPSTREAM_HEALTH.record_failure()
+            if not idempotent or attempt >= API_RETRIES:
+                raise
+        except BaseException:
+            UPSTREAM_HEALTH.release(probe)
+            raise
+        else:
+            UPSTREAM_HEALTH.record_success()
+            return result
+
+        time.sleep(backoff(attempt))
+        attempt += 1
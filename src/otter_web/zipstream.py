@@ -0,0 +1,112 @@
+"""
+Write a zip archive a file (or a piece of a file) at a time as it is being sent,
+instead of building the whole archive in memory first. zipfile can write to a stream
+it can not seek in (it puts the sizes of each file after its data instead of in its
+header), so the archive is written into a buffer that is emptied after every call.
+"""
+import zipfile
+
+class Sink:
+    """
+    A write only file that holds what was written until it is taken
+    """
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data:bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class ZipStream:
+    """
+    A zip archive written a file at a time. Each call returns the bytes of the
+    archive written since the last one, to be sent on straight away.
+
+    Args:
+        compression [int] : The zipfile compression method
+        compresslevel [int] : The compression level, see zipfile.ZipFile
+    """
+
+    def __init__(self, compression:int=zipfile.ZIP_DEFLATED, compresslevel:int=None):
+        self._sink = Sink()
+        self._zip = zipfile.ZipFile(
+            self._sink, "w", compression=compression, compresslevel=compresslevel
+        )
+        self._names = set()
+        self._name = None
+        self._file = None
+
+    def _unique(self, name:str) -> str:
+        """
+        name with any path separators replaced, and a number added before the
+        extension if an earlier file already has that name
+        """
+        name = name.replace("/", "_").replace("\\", "_") or "unnamed"
+        stem, dot, extension = name.rpartition(".")
+        if not dot:
+            stem, extension = name, ""
+        unique = name
+        n = 1
+        while unique in self._names:
+            n += 1
+            unique = f"{stem} ({n}){dot}{extension}"
+        self._names.add(unique)
+        return unique
+
+    def add(self, name:str, data:bytes) -> bytes:
+        """
+        Add a file to the archive
+
+        Args:
+            name [str] : The name of the file, made unique if it is already taken
+            data [bytes] : The contents of the file
+        """
+        self._finish()
+        self._zip.writestr(self._unique(name), data)
+        return self._sink.take()
+
+    def write(self, name:str, data:bytes) -> bytes:
+        """
+        Add data to the end of a file that is written a piece at a time. The file is
+        started, and the one before it finished, if it is not the file being written.
+
+        Args:
+            name [str] : The name of the file, made unique when it is started
+            data [bytes] : The next piece of the file
+        """
+        if self._file is None or name != self._name:
+            self._finish()
+            # the size is not known up front, so leave room for a big one
+            self._file = self._zip.open(self._unique(name), "w", force_zip64=True)
+            self._name = name
+        self._file.write(data)
+        return self._sink.take()
+
+    def _finish(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._name = None
+
+    def close(self) -> bytes:
+        """
+        Finish the archive by writing its table of contents
+        """
+        self._finish()
+        self._zip.close()
+        return self._sink.take()
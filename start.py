@@ -38,7 +38,7 @@ def main():
         on_air = args.on_air,
         reconnect_timeout = 120,     # this makes nicegui keep trying
         proxy_headers=True,          # this tells uvicorn to trust headers like X-Forwarded-Proto
-        forwarded_allow_ips='*',     # trust all proxy IPs
+        forwarded_allow_ips=TRUSTED_PROXIES, # only trust our own proxies
     )
 
 if __name__ in {"__main__", "__mp_main__"}:
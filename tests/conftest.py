@@ -1,10 +1,143 @@
 """
-    Dummy conftest.py for otter_web.
-
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    - https://docs.pytest.org/en/stable/fixture.html
-    - https://docs.pytest.org/en/stable/writing_plugins.html
+Shared fixtures for the otter_web tests. The API proxy is tested against the in
+memory ArangoDB stand in from otter_web.bench.fake_arango, so no database is needed.
 """
+import os
+import sys
+import time
+import types
+import socket
+import threading
+from pathlib import Path
+
+import httpx
+import pytest
+
+import otter_web
+
+# otter_web.client imports every page of the website, and some of them connect to
+# the database as they are imported. The API proxy does not need them, so the
+# package is registered without running its __init__
+_client_package = types.ModuleType("otter_web.client")
+_client_package.__path__ = [str(Path(otter_web.__file__).parent / "client")]
+sys.modules.setdefault("otter_web.client", _client_package)
+
+# the pages talk to ArangoDB through pyArango, which needs a real server, so the
+# stand in is served over HTTP on a free port (see arango_server). This has to be
+# set before otter_web.config is first imported
+with socket.socket() as _socket:
+    _socket.bind(("127.0.0.1", 0))
+    _ARANGO_PORT = _socket.getsockname()[1]
+os.environ["ARANGO_URL"] = f"http://127.0.0.1:{_ARANGO_PORT}"
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def fake():
+    """
+    The ArangoDB stand in, seeded with 300 synthetic transients
+    """
+    from otter_web.bench.fake_arango import FakeArango, synthetic_transients
+
+    fake = FakeArango()
+    fake.seed(synthetic_transients(300))
+    return fake
+
+@pytest.fixture
+def api(fake, monkeypatch):
+    """
+    otter_web.client.api sending its calls to fake, with empty caches, a closed
+    circuit and no rate limit. Tests turn features on and off by setting the config
+    values the module imported, e.g.
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    """
+    from otter_web import upstream
+    from otter_web.admission import ConcurrencyLimiter, RateLimiter
+    from otter_web.bench.fake_arango import create_app
+    from otter_web.cache import ResponseCache
+    from otter_web.client import api
+    from otter_web.readahead import CursorReadAhead
+    from otter_web.tokens import TokenCache
+
+    monkeypatch.setattr(upstream, "_client", None)
+    upstream.start_client(transport=httpx.ASGITransport(app=create_app(fake)))
+
+    monkeypatch.setattr(api, "RATE_LIMITER", RateLimiter(rate=0, burst=0))
+    monkeypatch.setattr(api, "UPSTREAM_LIMITER", ConcurrencyLimiter(8, 64, 10))
+    monkeypatch.setattr(api, "UPSTREAM_HEALTH", upstream.CircuitBreaker(5, 10))
+    monkeypatch.setattr(api, "CURSOR_CACHE", ResponseCache(ttl=300, max_bytes=1024**2))
+    monkeypatch.setattr(api, "METADATA_CACHE", ResponseCache(ttl=30, max_bytes=1024**2))
+    monkeypatch.setattr(api, "EXPLAIN_CACHE", ResponseCache(ttl=300, max_bytes=1024**2))
+    monkeypatch.setattr(api, "TOKENS", TokenCache(margin=300, max_age=3600))
+    monkeypatch.setattr(api, "READ_AHEAD", CursorReadAhead("w1", 1024**2, 100))
+    monkeypatch.setattr(api, "IN_FLIGHT", upstream.SingleFlight())
+    monkeypatch.setattr(api, "API_AQL_GUARD", False)
+    return api
+
+class _Served:
+    """
+    The app served by arango_server, which each test swaps for its own
+    """
+    app = None
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+@pytest.fixture(scope="session")
+def arango_server():
+    """
+    The ArangoDB stand in served at ARANGO_URL, for code that talks to ArangoDB
+    through pyArango. Set its app to the one to serve, e.g. create_app(fake)
+    """
+    import uvicorn
+
+    served = _Served()
+    server = uvicorn.Server(uvicorn.Config(
+        served,
+        host="127.0.0.1",
+        port=_ARANGO_PORT,
+        lifespan="off",
+        log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield served
+    server.should_exit = True
+    thread.join()
+
+@pytest.fixture
+def search_util(fake, arango_server, monkeypatch):
+    """
+    otter_web.client.search_util talking to fake, with a closed circuit and an empty
+    catalog snapshot. Tests that need the snapshot call search_util.CATALOG.refresh()
+    """
+    from otter_web import upstream
+    from otter_web.bench.fake_arango import create_app
+    from otter_web.catalog import CatalogSnapshot
+
+    arango_server.app = create_app(fake)
+    from otter_web.client import search_util
+
+    monkeypatch.setattr(upstream, "UPSTREAM_HEALTH", upstream.CircuitBreaker(5, 10))
+    monkeypatch.setattr(
+        search_util, "CATALOG", CatalogSnapshot(search_util._snapshot_query)
+    )
+    monkeypatch.setattr(search_util, "CATALOG_SNAPSHOT", True)
+    return search_util
+
+@pytest.fixture
+def client(api):
+    """
+    A test client for an app with just the API router
+    """
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
 
-# import pytest
+    app = FastAPI()
+    app.include_router(api.API_ROUTER)
+    with TestClient(app) as client:
+        yield client
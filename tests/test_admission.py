@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+from otter_web.admission import ConcurrencyLimiter, Overloaded, RateLimiter, TokenBucket
+
+def test_token_bucket_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    now[0] += 0.5
+    assert bucket.take() == 0
+    assert not bucket.idle
+    now[0] += 10
+    assert bucket.idle
+
+def test_rate_limiter_keeps_clients_apart():
+    limiter = RateLimiter(rate=1, burst=2)
+    limiter.check("a")
+    limiter.check("a")
+    with pytest.raises(Overloaded) as e:
+        limiter.check("a")
+    assert e.value.retry_after >= 1
+    limiter.check("b")
+    assert limiter.rejected == 1
+
+def test_rate_limit_can_be_turned_off():
+    limiter = RateLimiter(rate=0, burst=0)
+    for _ in range(100):
+        limiter.check("a")
+
+def test_rate_limiter_forgets_clients():
+    limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+    for client in "abc":
+        limiter.check(client)
+    assert len(limiter._buckets) == 2
+
+@pytest.mark.anyio
+async def test_concurrency_limiter_queues_and_rejects():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limiter.slot():
+            await release.wait()
+
+    holder = asyncio.ensure_future(hold())
+    waiter = asyncio.ensure_future(hold())
+    try:
+        await asyncio.sleep(0.01)
+        assert (limiter.active, limiter.waiting) == (1, 1)
+        with pytest.raises(Overloaded):
+            async with limiter.slot():
+                pass
+    finally:
+        release.set()
+        await asyncio.gather(holder, waiter)
+    assert (limiter.active, limiter.waiting, limiter.rejected) == (0, 0, 1)
+
+@pytest.mark.anyio
+async def test_concurrency_limiter_times_out():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=5, queue_timeout=0.01)
+    async with limiter.slot():
+        with pytest.raises(Overloaded):
+            async with limiter.slot():
+                pass
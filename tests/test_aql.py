@@ -0,0 +1,117 @@
+import pytest
+
+from otter_web.aql import (
+    add_limit,
+    check_plan,
+    collections_read,
+    collections_written,
+    is_cacheable,
+    is_read_only,
+    normalize_query,
+    strip_literals,
+    with_limits
+)
+
+def test_strip_literals():
+    query = (
+        'FOR t IN transients /* UPDATE */ FILTER t.name == "REMOVE" // INSERT\n'
+        "RETURN t"
+    )
+    stripped = strip_literals(query)
+    assert "REMOVE" not in stripped and "UPDATE" not in stripped
+    assert "INSERT" not in stripped
+    assert strip_literals("RETURN `UPDATE`") == "RETURN UPDATE"
+
+def test_normalize_query():
+    assert normalize_query("FOR t  IN\n transients // all\n RETURN t") == (
+        normalize_query("FOR t IN transients RETURN t")
+    )
+    assert normalize_query('RETURN "a  b"') == 'RETURN "a  b"'
+
+@pytest.mark.parametrize("query, read_only", [
+    ("FOR t IN transients RETURN t", True),
+    ("FOR t IN transients FILTER t.x == 'UPDATE' RETURN t", True),
+    ("FOR t IN transients UPDATE t WITH {x: 1} IN transients", False),
+    ("insert {a: 1} into vetting", False),
+    ("UPSERT {a: 1} INSERT {a: 1} UPDATE {} IN vetting", False),
+])
+def test_is_read_only(query, read_only):
+    assert is_read_only(query) is read_only
+
+def test_is_cacheable():
+    assert is_cacheable("FOR t IN transients LIMIT 10 RETURN t")
+    assert not is_cacheable("FOR t IN transients SORT RAND() LIMIT 1 RETURN t")
+    assert not is_cacheable("RETURN DOCUMENT('transients/1')")
+    assert not is_cacheable("REMOVE 'a' IN transients")
+
+def test_collections_read():
+    assert collections_read(
+        "FOR t IN transients FOR v IN vetting FILTER v.x IN t.aliases RETURN t"
+    ) == {"transients", "vetting"}
+    assert collections_read("FOR t IN @@c RETURN t", {"@c": "vetting"}) == {"vetting"}
+    assert collections_read("FOR t IN @@c RETURN t") is None
+    assert collections_read("FOR v IN 1..2 OUTBOUND 'a/b' edges RETURN v") is None
+    assert collections_read("FOR x IN [1, 2] RETURN x") == set()
+
+def test_collections_written():
+    assert collections_written("FOR t IN transients RETURN t") == set()
+    assert "vetting" in collections_written(
+        "FOR t IN transients UPDATE t WITH {x: 1} IN vetting"
+    )
+    assert collections_written(
+        "INSERT {a: 'UPDATE x IN y'} INTO vetting"
+    ) == {"vetting"}
+    assert collections_written("REMOVE 'k' IN @@c", {"@c": "logs"}) == {"logs"}
+    assert collections_written("REMOVE 'k' IN @@c") is None
+
+@pytest.mark.parametrize("query, limited", [
+    ("FOR t IN transients RETURN t", "FOR t IN transients LIMIT 10\nRETURN t"),
+    ("FOR t IN transients LIMIT 5 RETURN t", None),
+    ("RETURN LENGTH(transients)", None),
+    (
+        "FOR t IN transients RETURN (FOR r IN refs LIMIT 1 RETURN r)",
+        "FOR t IN transients LIMIT 10\nRETURN (FOR r IN refs LIMIT 1 RETURN r)"
+    ),
+    (
+        "FOR t IN transients FILTER t.name == 'RETURN' RETURN t",
+        "FOR t IN transients FILTER t.name == 'RETURN' LIMIT 10\nRETURN t"
+    ),
+    (
+        "FOR t IN transients LET r = (FOR r IN refs RETURN r) RETURN r",
+        "FOR t IN transients LET r = (FOR r IN refs RETURN r) LIMIT 10\nRETURN r"
+    ),
+])
+def test_add_limit(query, limited):
+    assert add_limit(query, 10) == (query if limited is None else limited)
+
+def test_check_plan():
+    plan = {"estimatedCost": 1e8, "estimatedNrItems": 5000}
+    assert check_plan(plan) is None
+    assert "cost" in check_plan(plan, max_cost=1e7)
+    assert "5,000 results" in check_plan(plan, max_items=1000)
+    assert check_plan(plan, max_cost=1e9, max_items=1e4) is None
+    assert check_plan({}, max_cost=1) is None
+
+def test_with_limits():
+    payload = {"query": "RETURN 1"}
+    limited = with_limits(payload, max_runtime=60, memory_limit=1000)
+    assert limited == {
+        "query": "RETURN 1", "options": {"maxRuntime": 60}, "memoryLimit": 1000
+    }
+    assert payload == {"query": "RETURN 1"}
+
+    # stricter limits from the client are kept
+    payload = {"query": "RETURN 1", "options": {"maxRuntime": 5}, "memoryLimit": 10}
+    assert with_limits(payload, 60, 1000) == payload
+    payload = {"query": "RETURN 1", "options": {"maxRuntime": 0}}
+    assert with_limits(payload, 60)["options"]["maxRuntime"] == 60
+
+@pytest.mark.parametrize("payload", [
+    {"options": {"maxRuntime": "forever"}},
+    {"options": {"maxRuntime": True}},
+    {"memoryLimit": [1]},
+    {"options": "fast"},
+])
+def test_with_limits_rejects_limits_that_are_not_numbers(payload):
+    with pytest.raises(ValueError):
+        with_limits({"query": "RETURN 1"} | payload, 60, 1000)
@@ -0,0 +1,55 @@
+import time
+
+from otter_web.cache import ResponseCache
+
+def test_get_and_put():
+    cache = ResponseCache(ttl=60, max_bytes=1000)
+    assert cache.get("a") is None
+    assert cache.put("a", b"hello", status_code=201, headers={"x": "1"})
+    entry = cache.get("a")
+    assert entry.content == b"hello"
+    assert (entry.status_code, entry.headers) == (201, {"x": "1"})
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_expire(monkeypatch):
+    cache = ResponseCache(ttl=10, max_bytes=1000)
+    cache.put("a", b"hello")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert len(cache) == 0 and cache.nbytes == 0
+
+def test_least_recently_used_are_evicted():
+    cache = ResponseCache(ttl=60, max_bytes=10, max_entry_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.nbytes == 8
+
+def test_big_bodies_are_not_cached():
+    cache = ResponseCache(ttl=60, max_bytes=100)
+    assert not cache.put("a", b"x"*26)
+    assert cache.get("a") is None
+
+def test_invalidate_by_tag():
+    cache = ResponseCache(ttl=60, max_bytes=1000)
+    cache.put("transients", b"1", tags={"otter/transients"})
+    cache.put("vetting", b"2", tags={"otter/vetting"})
+    cache.put("unknown", b"3", tags=None)
+    assert cache.invalidate("otter/transients") == 2
+    assert cache.get("vetting") is not None
+    assert cache.get("transients") is None and cache.get("unknown") is None
+
+def test_responses_from_before_an_invalidation_are_not_cached():
+    cache = ResponseCache(ttl=60, max_bytes=1000)
+    generation = cache.generation
+    cache.invalidate("otter/transients")
+    assert not cache.put("a", b"stale", generation=generation)
+
+    generation = cache.generation
+    cache.clear()
+    assert not cache.put("a", b"stale", generation=generation)
+    assert cache.put("a", b"fresh", generation=cache.generation)
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+from astropy.coordinates import SkyCoord
+
+from otter_web.bench.fake_arango import synthetic_transients
+from otter_web.catalog import LIST_QUERY, CatalogSnapshot, summarize
+
+class Database:
+    """
+    Answers the two queries CatalogSnapshot.refresh runs from a dict of documents
+    """
+
+    def __init__(self, docs):
+        self.docs = {doc["_key"]: dict(doc, _rev="1") for doc in docs}
+        self.fetched = []
+
+    def __call__(self, query, bind_vars):
+        if query == LIST_QUERY:
+            return [{"_key": k, "_rev": d["_rev"]} for k, d in self.docs.items()]
+        self.fetched += bind_vars["keys"]
+        return [self.docs[key] for key in bind_vars["keys"] if key in self.docs]
+
+@pytest.fixture
+def db():
+    return Database(synthetic_transients(500))
+
+@pytest.fixture
+def snapshot(db):
+    snapshot = CatalogSnapshot(db)
+    snapshot.refresh()
+    return snapshot
+
+def _keys(db, keep):
+    return sorted(key for key, doc in db.docs.items() if keep(doc))
+
+def _classes(doc):
+    return (doc.get("classification") or {}).get("value") or []
+
+def test_not_ready_until_refreshed(db):
+    snapshot = CatalogSnapshot(db)
+    assert not snapshot.ready and len(snapshot) == 0
+    assert snapshot.search(minz=0.1) is None
+    assert snapshot.suggest("FAKE") == []
+    assert snapshot.refresh() == 500
+    assert snapshot.ready and len(snapshot) == 500
+
+def test_refresh_only_fetches_what_changed(db, snapshot):
+    db.fetched.clear()
+    assert snapshot.refresh() == 0
+    assert db.fetched == []
+
+    changed = next(iter(db.docs))
+    db.docs[changed] = dict(db.docs[changed], _rev="2", _dec=89.5)
+    del db.docs["fake0000001"]
+    assert snapshot.refresh() == 2
+    assert db.fetched == [changed]
+    assert len(snapshot) == 499
+    assert changed in snapshot.search(mindec=89).tolist()
+    assert "fake0000001" not in snapshot.search().tolist()
+
+def test_no_filters_matches_everything(db, snapshot):
+    assert sorted(snapshot.search().tolist()) == sorted(db.docs)
+
+@pytest.mark.parametrize("filters, keep", [
+    (
+        {"minz": 1, "maxz": 1.5},
+        lambda doc: any(1 <= d["value"] <= 1.5 for d in doc.get("distance", []))
+    ),
+    ({"mindec": 30}, lambda doc: doc["_dec"] >= 30),
+    ({"hasphot": True}, lambda doc: "photometry" in doc),
+    (
+        {"has_radio_phot": True},
+        lambda doc: any(p["obs_type"] == "radio" for p in doc.get("photometry", []))
+    ),
+    (
+        {"has_det": True, "wave_det": "xray"},
+        lambda doc: any(
+            p["obs_type"] == "xray" and not all(p["upperlimit"])
+            for p in doc.get("photometry", [])
+        )
+    ),
+    (
+        {"classification": "SN", "class_confidence_threshold": 0.5},
+        lambda doc: any(
+            "SN" in c["object_class"] and c["confidence"] > 0.5
+            for c in _classes(doc)
+        )
+    ),
+    (
+        {"spec_classed": True, "unambiguous": True},
+        lambda doc: (doc.get("classification") or {}).get("spec_classed", 0) >= 1
+        and doc["classification"]["unambiguous"]
+    ),
+])
+def test_filters_match_the_documents(db, snapshot, filters, keep):
+    expected = _keys(db, keep)
+    assert expected, "the filter should match some of the synthetic transients"
+    assert sorted(snapshot.search(**filters).tolist()) == expected
+
+def test_names_and_refs(db, snapshot):
+    doc = db.docs["fake0000042"]
+    alias = doc["name"]["alias"][1]["value"]
+    assert "fake0000042" in snapshot.search(names=[alias]).tolist()
+    assert snapshot.search(names="FAKE 0000042").tolist() == ["fake0000042"]
+    ref = doc["reference_alias"][0]["name"]
+    assert snapshot.search(refs=ref).tolist() == ["fake0000042"]
+    assert snapshot.search(refs=["nope"]).tolist() == []
+
+def test_cone_search(db, snapshot):
+    doc = db.docs["fake0000007"]
+    coords = SkyCoord(doc["_ra"], doc["_dec"], unit="deg")
+    assert snapshot.search(coords=coords, radius=1).tolist() == ["fake0000007"]
+    assert snapshot.cone(doc["_ra"], doc["_dec"], 1).tolist() == ["fake0000007"]
+
+def test_summaries_read_aql_the_way_it_does():
+    summary = summarize({
+        "_key": "a",
+        "distance": [{"distance_type": "redshift", "value": "nonsense"}],
+        "classification": {"spec_classed": None, "value": [{"object_class": "TDE"}]},
+        "photometry": [{"obs_type": "radio", "upperlimit": [True, False]}]
+    })
+    assert summary.redshifts == [0]
+    assert summary.classes == [("TDE", -np.inf)]
+    assert summary.spec_classed == -np.inf
+    assert summary.detected and summary.det_types == {"radio"}
+    assert np.isnan(summary.ra)
+
+def _approved(key="new", dec=-45.0):
+    return {
+        "_key": key,
+        "_rev": "9",
+        "name": {"default_name": "2030abc", "alias": [{"value": "AT2030abc"}]},
+        "_ra": 10.0,
+        "_dec": dec,
+        "distance": [{"distance_type": "redshift", "value": 0.05}],
+        "classification": {"value": [{"object_class": "Brand New", "confidence": 1}]},
+        "reference_alias": [{"name": "2030Sci"}]
+    }
+
+def test_approved_transients_are_found_straight_away(db, snapshot):
+    snapshot.add_transient(_approved())
+    assert len(snapshot) == 501
+    assert snapshot.suggest("2030") == ["2030abc", "AT2030abc"]
+    assert snapshot.cone(10, -45, 1).tolist() == ["new"]
+    assert snapshot.search(names="2030abc").tolist() == ["new"]
+    assert snapshot.search(names=["AT2030abc"]).tolist() == ["new"]
+    assert snapshot.search(refs="2030Sci").tolist() == ["new"]
+    assert snapshot.search(classification="Brand").tolist() == ["new"]
+    assert "new" in snapshot.search(maxz=0.05, maxdec=-44).tolist()
+    assert sorted(snapshot.search().tolist()) == sorted([*db.docs, "new"])
+
+def test_approved_transients_outlive_refreshes_that_miss_them(db, snapshot):
+    snapshot.add_transient(_approved())
+    changed = next(iter(db.docs))
+    db.docs[changed] = dict(db.docs[changed], _rev="2")
+    snapshot.refresh()
+    assert snapshot.search(names=["AT2030abc"]).tolist() == ["new"]
+
+    # once the database has it the snapshot's own copy is used
+    db.docs["new"] = _approved()
+    snapshot.refresh()
+    assert len(snapshot) == 501
+    assert snapshot.search(names=["AT2030abc"]).tolist() == ["new"]
+
+def test_approved_merges_update_the_existing_row(db, snapshot):
+    key = "fake0000003"
+    snapshot.add_transient(_approved(key, dec=-89.9))
+    assert len(snapshot) == 500
+    assert snapshot.cone(10, -89.9, 1).tolist() == [key]
+    assert key not in snapshot.cone(db.docs[key]["_ra"], db.docs[key]["_dec"], 1)
@@ -0,0 +1,107 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from astropy.table import Table
+
+from otter_web.bench.fake_arango import synthetic_transients
+from otter_web.columnar import (
+    METADATA_UNITS,
+    TableWriter,
+    available,
+    metadata_frame,
+    write
+)
+
+@pytest.fixture
+def events():
+    return list(synthetic_transients(30))
+
+def _read(data:bytes, fmt:str) -> Table:
+    if fmt in ("parquet", "arrow"):
+        pyarrow = pytest.importorskip("pyarrow")
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if fmt == "parquet":
+            table = pyarrow.parquet.read_table(pyarrow.BufferReader(data))
+        else:
+            table = pyarrow.ipc.open_file(pyarrow.BufferReader(data)).read_all()
+        metadata = table.schema.metadata or {}
+        result = Table.from_pandas(table.to_pandas())
+        for column in result.colnames:
+            unit = metadata.get(f"unit.{column}".encode())
+            if unit is not None:
+                result[column].unit = unit.decode()
+        return result
+    return Table.read(io.BytesIO(data), format="ascii.ecsv" if fmt == "ecsv" else fmt)
+
+def _strings(column) -> list[str]:
+    # ECSV reads empty strings back as masked values
+    return ["" if value is np.ma.masked else str(value) for value in column]
+
+def test_metadata_frame(events):
+    frame = metadata_frame(events)
+    first = frame.iloc[0]
+    assert len(frame) == 30
+    assert first["key"] == events[0]["_key"]
+    assert first["name"] == events[0]["name"]["default_name"]
+    assert first["aliases"] == ", ".join(
+        alias["value"] for alias in events[0]["name"]["alias"]
+    )
+    assert first["ra"] == pytest.approx(events[0]["_ra"])
+    mjd = events[0]["date_reference"][0]["value"]
+    assert first["discovery_mjd"] == pytest.approx(mjd)
+
+    frame = metadata_frame([{"_key": "empty"}])
+    assert np.isnan(frame.iloc[0]["ra"]) and np.isnan(frame.iloc[0]["discovery_mjd"])
+    assert frame.iloc[0]["ra_hms"] == ""
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow", "ecsv", "votable"])
+def test_tables_written_in_batches(events, fmt):
+    if not available(fmt):
+        pytest.skip(f"{fmt} needs pyarrow")
+    writer = TableWriter(fmt, METADATA_UNITS)
+    parts = []
+    for start in range(0, 30, 10):
+        parts.append(writer.write(metadata_frame(events[start:start + 10])))
+    parts.append(writer.close())
+    if fmt != "votable":
+        assert all(parts[:3]) # sent as each batch comes in
+
+    table = _read(b"".join(parts), fmt)
+    expected = metadata_frame(events)
+    assert list(table["key"]) == list(expected["key"])
+    assert np.allclose(table["ra"], expected["ra"])
+    assert _strings(table["classification"]) == list(expected["classification"])
+    assert table["ra"].unit == "deg"
+    assert table["discovery_mjd"].unit == "d"
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow", "ecsv", "votable"])
+def test_empty_tables(events, fmt):
+    if not available(fmt):
+        pytest.skip(f"{fmt} needs pyarrow")
+    writer = TableWriter(fmt, METADATA_UNITS)
+    assert writer.write(metadata_frame([])) == b""
+    data = writer.close()
+    assert data == write([metadata_frame([])], fmt, METADATA_UNITS)
+    assert len(_read(data, fmt)) == 0
+
+def test_empty_batches_are_skipped(events):
+    writer = TableWriter("ecsv")
+    data = writer.write(metadata_frame([])) + writer.write(metadata_frame(events))
+    data += writer.write(metadata_frame([])) + writer.close()
+    assert len(_read(data, "ecsv")) == 30
+
+def test_columns_of_mixed_types_are_written_as_text():
+    frame = pd.DataFrame({"a": [1, "two", None, [3]], "b": [1.0, 2.0, 3.0, 4.0]})
+    table = _read(write([frame], "ecsv"), "ecsv")
+    assert _strings(table["a"]) == ["1", "two", "", "[3]"]
+
+def test_unknown_formats():
+    assert not available("xlsx")
+    with pytest.raises(ValueError):
+        TableWriter("xlsx")
+    with pytest.raises(ValueError):
+        write([], "xlsx")
@@ -0,0 +1,61 @@
+import gzip
+
+import pytest
+
+from otter_web import compression
+from otter_web.compression import compress, compress_stream, negotiate
+
+@pytest.fixture
+def no_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+def test_nothing_accepted():
+    assert negotiate(None) is None
+    assert negotiate("") is None
+    assert negotiate("identity") is None
+    assert negotiate("gzip;q=0, br;q=0") is None
+
+def test_gzip_without_brotli(no_brotli):
+    assert negotiate("gzip, deflate, br") == "gzip"
+    assert negotiate("br") is None
+    assert negotiate("*") == "gzip"
+
+def test_highest_q_value_wins():
+    pytest.importorskip("brotli")
+    assert negotiate("gzip, br") == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate("GZIP;q=0.5, *;q=0.8") == "br"
+    assert negotiate("br;q=nonsense, gzip;q=0.1") == "gzip"
+
+def test_gzip_round_trip():
+    content = b"transient " * 1000
+    compressed = compress(content, "gzip")
+    assert len(compressed) < len(content)
+    assert gzip.decompress(compressed) == content
+
+def test_brotli_round_trip():
+    brotli = pytest.importorskip("brotli")
+    content = b"transient " * 1000
+    assert brotli.decompress(compress(content, "br")) == content
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+async def test_streamed_round_trip(encoding):
+    if encoding == "br":
+        brotli = pytest.importorskip("brotli")
+        decompress = brotli.decompress
+    else:
+        decompress = gzip.decompress
+
+    closed = []
+
+    async def chunks():
+        try:
+            for i in range(100):
+                yield f"chunk {i}\n".encode()
+        finally:
+            closed.append(True)
+
+    body = b"".join([chunk async for chunk in compress_stream(chunks(), encoding)])
+    assert decompress(body) == b"".join(f"chunk {i}\n".encode() for i in range(100))
+    assert closed == [True]
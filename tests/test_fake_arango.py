@@ -0,0 +1,111 @@
+"""
+The ArangoDB stand in the proxy tests and benchmarks run against
+"""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from otter_web.bench.fake_arango import (
+    FakeArango,
+    create_app,
+    synthetic_transients
+)
+from otter_web.tokens import jwt_expiry
+
+def test_synthetic_transients_are_reproducible():
+    first = list(synthetic_transients(10, seed=1))
+    assert first == list(synthetic_transients(10, seed=1))
+    assert first != list(synthetic_transients(10, seed=2))
+    assert len({doc["_key"] for doc in first}) == 10
+    assert all(-90 <= doc["coordinate"][0]["dec"] <= 90 for doc in first)
+
+def test_insert_and_seed():
+    fake = FakeArango()
+    assert fake.insert("transients", {"_key": "a"})["_id"] == "transients/a"
+    with pytest.raises(KeyError):
+        fake.insert("transients", {"_key": "a"})
+    assert fake.insert("transients", {})["_key"] not in ("", "a")
+    assert fake.seed([{"_key": "a", "x": 1}, {"_key": "b"}]) == 2
+    assert fake.collections["transients"]["a"]["x"] == 1
+
+def test_queries_read_the_first_collection_and_limit():
+    fake = FakeArango()
+    fake.seed(synthetic_transients(20))
+    assert len(fake.run_query("FOR t IN transients RETURN t")) == 20
+    assert len(fake.run_query("FOR t IN transients LIMIT 5 RETURN t")) == 5
+    assert len(fake.run_query("FOR t IN transients LIMIT 18, 5 RETURN t")) == 2
+    query = "FOR t IN @@c LIMIT @n RETURN t"
+    assert len(fake.run_query(query, {"@c": "transients", "n": 3})) == 3
+    with pytest.raises(LookupError):
+        fake.run_query("FOR t IN nope RETURN t")
+
+def test_queries_can_filter_on_keys():
+    fake = FakeArango()
+    fake.seed([{"_key": key} for key in "abcd"])
+    query = "FOR t IN transients FILTER t._key IN @keys RETURN t"
+    found = fake.run_query(query, {"keys": ["c", "a", "x"]})
+    assert [doc["_key"] for doc in found] == ["a", "c"]
+
+def test_explain_costs_a_scan():
+    fake = FakeArango()
+    fake.seed(synthetic_transients(20))
+    plan = fake.explain("FOR t IN transients RETURN t")
+    assert (plan["estimatedCost"], plan["estimatedNrItems"]) == (41, 20)
+    plan = fake.explain("FOR t IN transients LIMIT 5 RETURN t")
+    assert plan["estimatedCost"] == 11
+
+@pytest.fixture
+def fake_client():
+    fake = FakeArango()
+    fake.seed(synthetic_transients(25))
+    with TestClient(create_app(fake)) as client:
+        yield fake, client
+
+def test_cursors_are_batched(fake_client):
+    fake, client = fake_client
+    response = client.post(
+        "/_db/otter/_api/cursor",
+        json={"query": "FOR t IN transients RETURN t", "batchSize": 10, "count": True}
+    )
+    assert response.status_code == 201
+    body = response.json()
+    assert (len(body["result"]), body["hasMore"], body["count"]) == (10, True, 25)
+
+    sizes = []
+    while body["hasMore"]:
+        body = client.put(f"/_db/otter/_api/cursor/{body['id']}").json()
+        sizes.append(len(body["result"]))
+    assert sizes == [10, 5]
+    assert fake.cursors == {}
+    assert fake.requests == 3
+
+def test_errors_look_like_arangodb(fake_client):
+    _, client = fake_client
+    response = client.get("/_db/nope/_api/collection")
+    assert response.status_code == 404
+    assert response.json()["errorNum"] == 1228
+
+    response = client.post(
+        "/_db/otter/_api/cursor", json={"query": "INSERT {} INTO transients"}
+    )
+    assert response.status_code == 501
+    assert client.put("/_db/otter/_api/cursor/nope").json()["errorNum"] == 1600
+
+def test_documents(fake_client):
+    _, client = fake_client
+    inserted = client.post("/_db/otter/_api/document/transients", json={"x": 1})
+    key = inserted.json()["_key"]
+    client.patch(f"/_db/otter/_api/document/transients/{key}", json={"x": 2})
+    assert client.get(f"/_db/otter/_api/document/transients/{key}").json()["x"] == 2
+    client.delete(f"/_db/otter/_api/document/transients/{key}")
+    response = client.get(f"/_db/otter/_api/document/transients/{key}")
+    assert response.status_code == 404
+
+def test_logins_hand_out_tokens(fake_client):
+    _, client = fake_client
+    token = client.post(
+        "/_open/auth", json={"username": "user", "password": "secret"}
+    ).json()["jwt"]
+    assert abs(jwt_expiry(token) - time.time() - 3600) <= 2
+    assert client.post("/_open/auth", json={}).status_code == 400
@@ -0,0 +1,38 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from otter_web.bench.loadtest import LoadTest, build_report, parse_mix
+
+def test_parse_mix():
+    assert parse_mix("auth=1,cursor=4, next") == {"auth": 1, "cursor": 4, "next": 1}
+    with pytest.raises(ValueError):
+        parse_mix("drop=1")
+
+@pytest.mark.anyio
+async def test_load_test_runs_against_the_proxy(api):
+    app = FastAPI()
+    app.include_router(api.API_ROUTER)
+    transport = httpx.ASGITransport(app=app)
+    clients = [
+        httpx.AsyncClient(transport=transport, base_url="http://otter")
+        for _ in range(2)
+    ]
+    test = LoadTest(
+        clients,
+        parse_mix("auth=1,cursor=2,next=2,insert=1"),
+        rps=200,
+        duration=0.1,
+        result_size=50,
+        batch_size=10
+    )
+    await test.login_all()
+    elapsed = await test.run()
+    for client in clients:
+        await client.aclose()
+
+    assert len(test.tokens) == 2
+    report = build_report(test, elapsed, memory={}, settings={"rps": 200})
+    assert report["requests"] == 20
+    assert report["ok"] == 20, report["statuses"]
+    assert report["latency_ms"]["all"]["count"] == 20
@@ -0,0 +1,90 @@
+import pytest
+
+from otter_web.metrics import Histogram, Registry, ratio
+
+def test_counter_labels():
+    registry = Registry()
+    requests = registry.counter("requests_total", "The number of requests")
+    requests.inc(method="GET", status=200)
+    requests.inc(2, status=200, method="GET")
+    requests.inc(method="POST", status=500)
+    assert requests.value(method="GET", status=200) == 3
+    assert requests.value(method="PUT", status=200) == 0
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == [
+        "# HELP requests_total The number of requests",
+        "# TYPE requests_total counter"
+    ]
+    assert 'requests_total{method="GET",status="200"} 3' in lines
+    assert 'requests_total{method="POST",status="500"} 1' in lines
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("c", "c").inc(path='a"b\\c\nd')
+    assert 'c{path="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "How long requests take", buckets=(1, 0.1))
+    assert histogram.buckets == (0.1, 1)
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value, route="/a")
+
+    lines = histogram.render()
+    assert "# TYPE latency histogram" in lines
+    assert 'latency_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_sum{route="/a"} 2.65' in lines
+    assert 'latency_count{route="/a"} 4' in lines
+
+def test_histogram_timer():
+    histogram = Histogram("t", "t")
+    with histogram.time(kind="x"):
+        pass
+    assert 't_count{kind="x"} 1' in histogram.render()
+
+def test_callback_metrics_are_read_when_rendered():
+    registry = Registry()
+    sizes = {"a": 1}
+    registry.gauge_function("size", "The size", lambda: len(sizes))
+    registry.counter_function(
+        "hits", "The hits", lambda: {(("cache", "cursor"),): 4}
+    )
+    sizes["b"] = 2
+
+    text = registry.render()
+    assert "# TYPE size gauge\nsize 2\n" in text
+    assert "# TYPE hits counter\n" in text
+    assert 'hits{cache="cursor"} 4' in text
+
+def test_names_are_unique():
+    registry = Registry()
+    registry.counter("a", "a")
+    with pytest.raises(ValueError):
+        registry.histogram("a", "a")
+
+def test_ratio():
+    assert ratio(1, 4) == 0.25
+    assert ratio(1, 0) == 0
+
+def test_metrics_endpoint_needs_the_token(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from otter_web.client import monitoring
+
+    app = FastAPI()
+    app.add_api_route("/metrics", monitoring.metrics)
+    client = TestClient(app)
+
+    monkeypatch.setattr(monitoring, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(monitoring, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    wrong = client.get("/metrics", headers={"authorization": "Bearer nope"})
+    assert wrong.status_code == 401
+    response = client.get("/metrics", headers={"authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "# TYPE" in response.text
@@ -0,0 +1,52 @@
+import pytest
+
+from otter_web.names import NameIndex, trigrams
+
+NAMES = {
+    "a": ["2018hyz", "AT2018hyz", "ASASSN-18zj"],
+    "b": ["2019dsg", "AT2019dsg", "ZTF19aapreis"],
+    "c": ["2018zr", "AT2018zr", "PS18kh"],
+    "d": ["ASASSN-14li", "2014li"]
+}
+
+@pytest.fixture
+def index():
+    # enough other names that the trigrams of these are rare, as in the catalog
+    others = (f"GRB {chr(65 + i//20)}{chr(65 + i%20)}" for i in range(200))
+    names = NAMES | {f"x{i}": [name] for i, name in enumerate(others)}
+    return NameIndex(names, names.values())
+
+def test_trigrams():
+    assert trigrams("ABCD") == {"ABC", "BCD"}
+    assert trigrams("AB") == set()
+
+def test_ids_ignore_case(index):
+    assert index.ids("2018") == ["a", "c"]
+    assert index.ids("asassn") == ["a", "d"]
+    assert index.ids("zr") == ["c"]
+    assert index.ids("nothing") == []
+    assert len(index) == 211
+
+def test_suggest_starts_then_contains(index):
+    assert index.suggest("2018") == [
+        "2018zr", "2018hyz", "AT2018zr", "AT2018hyz"
+    ]
+    assert index.suggest("at", limit=2) == ["AT2018hyz", "AT2018zr"]
+    assert index.suggest("  ") == []
+    assert index.suggest("2018", limit=0) == []
+
+def test_suggest_falls_back_to_close_names(index):
+    assert index.suggest("2018 hyz")[0] == "2018hyz"
+    assert "AT2019dsg" in index.suggest("AT 2019dsg")
+
+def test_fuzzy(index):
+    best = index.fuzzy("ASASN-18zj")
+    assert best[0][1] == "ASASSN-18zj"
+    assert 0 < best[0][0] < 1
+    assert index.fuzzy("xx") == []
+
+def test_added_names_are_found(index):
+    index.add("e", ["2024abc", "AT2024abc"])
+    assert index.ids("2024") == ["e"]
+    assert index.suggest("20")[0] == "2014li"
+    assert index.suggest("2024") == ["2024abc", "AT2024abc"]
@@ -0,0 +1,560 @@
+"""
+The API proxy routes, run against the ArangoDB stand in
+"""
+import json
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from otter_web import upstream
+from otter_web.admission import RateLimiter
+from otter_web.bench.fake_arango import create_app
+
+CURSOR = "/api/_db/otter/_api/cursor"
+
+def test_metadata_is_proxied(client):
+    response = client.get("/api/_db/otter/_api/collection")
+    assert response.status_code == 200
+    assert "transients" in {c["name"] for c in response.json()["result"]}
+
+def test_cursor_is_proxied(client):
+    response = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients LIMIT 5 RETURN t._key"}
+    )
+    assert response.status_code == 201
+    assert len(response.json()["result"]) == 5
+
+def test_upstream_errors_are_reported(client):
+    response = client.get("/api/_db/nope/_api/collection")
+    assert response.status_code == 500
+    assert response.json()["error"] is True
+
+def _streamed(monkeypatch, api):
+    # with every cursor feature off the cursor route streams the response
+    for flag in ("API_COALESCE", "API_CURSOR_CACHE", "API_CURSOR_PREFETCH"):
+        monkeypatch.setattr(api, flag, False)
+    monkeypatch.setattr(api, "API_STREAM_RESPONSES", True)
+
+@pytest.fixture
+def upstream_headers(fake, api, monkeypatch):
+    """
+    The headers of every request that reaches the ArangoDB stand in
+    """
+    seen = []
+    app = create_app(fake)
+
+    async def recording(scope, receive, send):
+        if scope["type"] == "http":
+            seen.append({k.decode(): v.decode() for k, v in scope["headers"]})
+        await app(scope, receive, send)
+
+    monkeypatch.setattr(upstream, "_client", None)
+    upstream.start_client(transport=httpx.ASGITransport(app=recording))
+    return seen
+
+def test_streamed_body_is_plain_unless_the_client_accepts_encoding(
+        client, api, upstream_headers, monkeypatch
+):
+    _streamed(monkeypatch, api)
+    response = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients RETURN t"},
+        headers={"accept-encoding": "identity"}
+    )
+    assert response.status_code == 201
+    assert "content-encoding" not in response.headers
+    assert upstream_headers[-1]["accept-encoding"] == "identity"
+    assert len(response.json()["result"]) == 300
+
+def test_streamed_body_is_compressed_for_the_client(
+        client, api, upstream_headers, monkeypatch
+):
+    _streamed(monkeypatch, api)
+    monkeypatch.setattr(api, "API_COMPRESS", True)
+    response = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients RETURN t"},
+        headers={"accept-encoding": "gzip"}
+    )
+    assert response.status_code == 201
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["result"]) == 300
+
+def test_read_only_cursor_results_are_cached(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    query = {"query": "FOR t IN transients LIMIT 3 RETURN t._key"}
+    first = client.post(CURSOR, json=query)
+    second = client.post(CURSOR, json=query)
+    assert first.headers["x-otter-cache"] == "miss"
+    assert second.headers["x-otter-cache"] == "hit"
+    assert first.json() == second.json()
+
+    # the same query written differently is the same entry
+    other = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients\n LIMIT 3 RETURN t._key"}
+    )
+    assert other.headers["x-otter-cache"] == "hit"
+
+def test_uncacheable_cursors_are_not_cached(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    query = {"query": "FOR t IN transients SORT RAND() LIMIT 1 RETURN t._key"}
+    client.post(CURSOR, json=query)
+    assert len(api.CURSOR_CACHE) == 0
+
+def test_writes_drop_the_results_they_change(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    query = {"query": "FOR t IN transients LIMIT 3 RETURN t._key"}
+    client.post(CURSOR, json=query)
+    client.post(CURSOR, json={"query": "FOR v IN vetting LIMIT 3 RETURN v"})
+    assert len(api.CURSOR_CACHE) == 2
+
+    client.post(CURSOR, json={"query": "UPDATE 'a' WITH {x: 1} IN transients"})
+    assert len(api.CURSOR_CACHE) == 1
+    assert client.post(CURSOR, json=query).headers["x-otter-cache"] == "miss"
+
+    # a collection that can not be worked out drops everything
+    client.post(CURSOR, json={"query": "REMOVE 'a' IN @@c", "bindVars": {}})
+    assert len(api.CURSOR_CACHE) == 0
+
+def test_truncate_drops_the_cached_results(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    client.post(CURSOR, json={"query": "FOR t IN transients LIMIT 3 RETURN t._key"})
+    client.put(
+        "/api/_db/otter/_api/collection/transients/truncate",
+        json={},
+        headers={"authorization": "bearer x"}
+    )
+    assert len(api.CURSOR_CACHE) == 0
+
+@pytest.mark.anyio
+async def test_identical_cursors_share_one_call(api, fake, monkeypatch):
+    monkeypatch.setattr(api, "API_COALESCE", True)
+    fake.latency = 0.05
+    app = FastAPI()
+    app.include_router(api.API_ROUTER)
+    query = {"query": "FOR t IN transients LIMIT 3 RETURN t._key"}
+    async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://otter"
+    ) as client:
+        responses = await asyncio.gather(
+            *(client.post(CURSOR, json=query) for _ in range(5))
+        )
+    assert {response.status_code for response in responses} == {201}
+    assert fake.requests == 1
+    assert api.IN_FLIGHT.coalesced == 4
+
+def test_cursors_with_more_to_come_are_not_shared(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_COALESCE", True)
+    query = {"query": "FOR t IN transients RETURN t._key", "batchSize": 10}
+    first = client.post(CURSOR, json=query).json()
+    second = client.post(CURSOR, json=query).json()
+    assert first["hasMore"] and second["hasMore"]
+    assert first["id"] != second["id"]
+
+def test_big_cursor_results_are_streamed(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_COALESCE", True)
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    monkeypatch.setattr(api, "API_CURSOR_BUFFER_MAX_BYTES", 1024)
+    query = {"query": "FOR t IN transients RETURN t"}
+    response = client.post(CURSOR, json=query)
+    assert response.status_code == 201
+    assert len(response.json()["result"]) == 300
+    # too big to hold on to, so it is not cached either
+    assert "x-otter-cache" not in response.headers
+    assert len(api.CURSOR_CACHE) == 0
+
+def test_clients_over_their_rate_limit_are_turned_away(client, api, monkeypatch):
+    monkeypatch.setattr(api, "RATE_LIMITER", RateLimiter(rate=1, burst=2))
+    statuses = [
+        client.get("/api/_db/otter/_api/collection").status_code for _ in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+    response = client.get("/api/_db/otter/_api/collection")
+    assert response.json()["code"] == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+def test_made_up_credentials_do_not_get_their_own_limit(client, api, monkeypatch):
+    monkeypatch.setattr(api, "RATE_LIMITER", RateLimiter(rate=1, burst=2))
+    statuses = [
+        client.get(
+            "/api/_db/otter/_api/collection",
+            headers={"authorization": f"bearer made-up-{i}"}
+        ).status_code
+        for i in range(3)
+    ]
+    assert statuses == [200, 200, 429]
+
+def test_forwarded_addresses_only_come_from_trusted_proxies(api, monkeypatch):
+    from fastapi.testclient import TestClient
+    from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+    from otter_web.config import TRUSTED_PROXIES
+
+    app = FastAPI()
+    app.include_router(api.API_ROUTER)
+    monkeypatch.setattr(api, "RATE_LIMITER", RateLimiter(rate=1, burst=2))
+
+    def statuses(trusted, addresses):
+        proxied = ProxyHeadersMiddleware(app, trusted_hosts=trusted)
+        with TestClient(proxied) as client:
+            return [
+                client.get(
+                    "/api/_db/otter/_api/collection",
+                    headers={"x-forwarded-for": address}
+                ).status_code
+                for address in addresses
+            ]
+
+    # a client talking to the server directly can not pick its address
+    assert statuses(TRUSTED_PROXIES, ["192.0.2.1", "192.0.2.2", "192.0.2.3"]) == [
+        200, 200, 429
+    ]
+    # behind a trusted proxy the address is the one the proxy added
+    trusted = f"{TRUSTED_PROXIES},testclient"
+    assert statuses(trusted, [f"192.0.2.{i}, 198.51.100.1" for i in range(3)]) == [
+        200, 200, 429
+    ]
+    assert statuses(trusted, ["198.51.100.2"]) == [200]
+
+def test_logins_from_the_token_cache_get_their_own_limit(client, api, monkeypatch):
+    token = client.post(
+        "/api/_open/auth", json={"username": "user", "password": "secret"}
+    ).json()["jwt"]
+    monkeypatch.setattr(api, "RATE_LIMITER", RateLimiter(rate=1, burst=2))
+    for _ in range(2):
+        client.get("/api/_db/otter/_api/collection")
+    response = client.get(
+        "/api/_db/otter/_api/collection",
+        headers={"authorization": f"bearer {token}"}
+    )
+    assert response.status_code == 200
+
+def test_upstream_calls_are_counted(client):
+    from otter_web.metrics import UPSTREAM_BYTES_IN, UPSTREAM_REQUESTS
+
+    route = "/api/_db/{db}/_api/collection"
+    labels = dict(route=route, method="GET", status=200)
+    requests = UPSTREAM_REQUESTS.value(**labels)
+    nbytes = UPSTREAM_BYTES_IN.value(route=route)
+    response = client.get("/api/_db/otter/_api/collection")
+    assert UPSTREAM_REQUESTS.value(**labels) == requests + 1
+    assert response.status_code == 200
+    assert UPSTREAM_BYTES_IN.value(route=route) > nbytes
+
+def test_buffered_bodies_are_compressed_if_big_enough(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_COMPRESS", True)
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    big = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients LIMIT 100 RETURN t"},
+        headers={"accept-encoding": "gzip"}
+    )
+    assert big.headers["content-encoding"] == "gzip"
+    assert big.headers["vary"] == "Accept-Encoding"
+    assert len(big.json()["result"]) == 100
+
+    monkeypatch.setattr(api, "API_COMPRESS_MIN_SIZE", len(big.content) + 1)
+    small = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients LIMIT 100 RETURN t"},
+        headers={"accept-encoding": "gzip"}
+    )
+    assert small.headers["x-otter-cache"] == "hit"
+    assert "content-encoding" not in small.headers
+
+def test_unchanged_metadata_is_not_sent_again(client, fake):
+    first = client.get("/api/_db/otter/_api/collection")
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    calls = fake.requests
+
+    response = client.get(
+        "/api/_db/otter/_api/collection",
+        headers={"if-none-match": f'"nope", {etag.removeprefix("W/")}'}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert fake.requests == calls # answered from the metadata cache
+
+    response = client.get(
+        "/api/_db/otter/_api/collection", headers={"if-none-match": '"nope"'}
+    )
+    assert response.status_code == 200
+    assert response.json() == first.json()
+
+BULK = "/api/_db/otter/_api/document/transients/bulk"
+
+def test_bulk_import_reports_each_document(client, fake):
+    docs = [{"_key": f"new{i}"} for i in range(5)] + [{"_key": "new0"}]
+    calls = fake.requests
+    response = client.post(f"{BULK}?batchSize=2", json=docs)
+    assert response.status_code == 200
+    summary = response.json()
+    assert (summary["error"], summary["created"], summary["errors"]) == (True, 5, 1)
+    assert [item["index"] for item in summary["details"]] == list(range(6))
+    assert summary["details"][0]["_key"] == "new0"
+    assert summary["details"][5]["errorNum"] == 1210
+    assert fake.requests == calls + 3
+    assert "new4" in fake.collections["transients"]
+
+def test_bulk_import_of_ndjson(client, fake):
+    body = b'{"_key": "a"}\n\n{"_key": \n{"_key": "b"}'
+    response = client.post(
+        BULK, content=body, headers={"content-type": "application/x-ndjson"}
+    )
+    summary = response.json()
+    assert (summary["created"], summary["errors"]) == (2, 1)
+    assert summary["details"][1]["error"] is True
+    assert summary["details"][1]["errorMessage"].startswith("Invalid JSON document")
+    assert {"a", "b"} <= set(fake.collections["transients"])
+
+@pytest.mark.parametrize(
+    "url, body", [(f"{BULK}?batchSize=0", []), (BULK, {"_key": "a"})]
+)
+def test_bad_bulk_imports_are_rejected(client, url, body):
+    response = client.post(url, json=body)
+    assert response.status_code == 400
+    assert response.json()["error"] is True
+
+def test_bulk_import_into_a_missing_collection(client):
+    response = client.post(
+        "/api/_db/otter/_api/document/nope/bulk", json=[{"_key": "a"}, {"_key": "b"}]
+    )
+    summary = response.json()
+    assert (summary["created"], summary["errors"]) == (0, 2)
+    assert {item["errorNum"] for item in summary["details"]} == {1203}
+
+def test_bulk_import_needs_a_result_for_each_document(client, monkeypatch):
+    # an upstream that answers with fewer results than it was sent documents
+    short = FastAPI()
+
+    @short.post("/_db/{db}/_api/document/{collection}")
+    async def insert(db:str, collection:str):
+        return [{"_key": "a", "_id": "transients/a"}]
+
+    monkeypatch.setattr(upstream, "_client", None)
+    upstream.start_client(transport=httpx.ASGITransport(app=short))
+
+    response = client.post(BULK, json=[{"_key": "a"}, {"_key": "b"}])
+    summary = response.json()
+    assert (summary["created"], summary["errors"]) == (0, 2)
+    assert [item["index"] for item in summary["details"]] == [0, 1]
+    assert "a result for each" in summary["details"][1]["errorMessage"]
+
+def test_bulk_import_drops_the_cached_results(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_CURSOR_CACHE", True)
+    query = {"query": "FOR t IN transients LIMIT 3 RETURN t._key"}
+    client.post(CURSOR, json=query)
+    client.post(BULK, json=[{"_key": "new"}])
+    assert client.post(CURSOR, json=query).headers["x-otter-cache"] == "miss"
+
+def _read_ahead_cursor(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_CURSOR_PREFETCH", True)
+    response = client.post(
+        CURSOR, json={"query": "FOR t IN transients RETURN t", "batchSize": 100}
+    )
+    assert response.status_code == 201
+    return response.json()
+
+def test_next_batches_are_read_ahead(client, api, monkeypatch):
+    first = _read_ahead_cursor(client, api, monkeypatch)
+    assert first["id"].endswith("-w1")
+
+    keys = [doc["_key"] for doc in first["result"]]
+    cursor_id = first["id"]
+    while True:
+        batch = client.put(f"{CURSOR}/{cursor_id}").json()
+        keys += [doc["_key"] for doc in batch["result"]]
+        if not batch["hasMore"]:
+            break
+        cursor_id = batch["id"]
+    assert len(set(keys)) == 300
+    assert api.READ_AHEAD.hits == 2
+
+def test_read_ahead_relays_upstream_errors(client, api, fake, monkeypatch):
+    first = _read_ahead_cursor(client, api, monkeypatch)
+    api.READ_AHEAD.close(api.READ_AHEAD.parse(first["id"])[1])
+    monkeypatch.setattr(fake, "next_batch", lambda cursor_id: None)
+    response = client.put(f"{CURSOR}/{first['id']}")
+    assert response.status_code == 404
+    assert response.json()["errorNum"] == 1600
+
+def test_read_ahead_cursors_of_other_workers_are_refused(client, api, monkeypatch):
+    first = _read_ahead_cursor(client, api, monkeypatch)
+    cursor_id = api.READ_AHEAD.parse(first["id"])[1]
+    response = client.put(f"{CURSOR}/{cursor_id}-w2")
+    assert response.status_code == 421
+    assert response.json()["code"] == 421
+
+def test_logins_are_answered_from_the_token_cache(client, fake):
+    credentials = {"username": "user", "password": "secret"}
+    first = client.post("/api/_open/auth", json=credentials)
+    calls = fake.requests
+    second = client.post("/api/_open/auth", json=credentials)
+    assert first.headers["x-otter-cache"] == "miss"
+    assert second.headers["x-otter-cache"] == "hit"
+    assert second.json()["jwt"] == first.json()["jwt"]
+    assert fake.requests == calls
+
+def test_tokens_near_expiry_are_swapped(client, api, upstream_headers):
+    from otter_web.bench.fake_arango import make_jwt
+
+    credentials = {"username": "user", "password": "secret"}
+    key = api.TOKENS.key(credentials)
+    old = api.TOKENS.put(
+        key,
+        json.dumps(credentials).encode(),
+        json.dumps({"jwt": make_jwt("user", lifetime=100)}).encode()
+    )
+    response = client.get(
+        "/api/_db/otter/_api/collection", headers={"authorization": f"bearer {old}"}
+    )
+    assert response.status_code == 200
+    assert api.TOKENS.refreshes == 1
+    sent = upstream_headers[-1]["authorization"].removeprefix("bearer ")
+    assert sent == api.TOKENS.get(key).token != old
+
+class _Unreachable(httpx.AsyncBaseTransport):
+    """
+    Raises error (by default failing to connect) the first failures times, then
+    passes calls on to transport
+    """
+
+    def __init__(self, transport, failures, error=httpx.ConnectError):
+        self.transport = transport
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error("ArangoDB failed", request=request)
+        return await self.transport.handle_async_request(request)
+
+def _unreachable(fake, api, monkeypatch, failures, error=httpx.ConnectError):
+    transport = _Unreachable(
+        httpx.ASGITransport(app=create_app(fake)), failures, error=error
+    )
+    monkeypatch.setattr(upstream, "_client", None)
+    upstream.start_client(transport=transport)
+    monkeypatch.setattr(api, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(api, "API_RETRIES", 2)
+    return transport
+
+def test_connection_failures_are_retried(client, api, fake, monkeypatch):
+    transport = _unreachable(fake, api, monkeypatch, failures=2)
+    response = client.get("/api/_db/otter/_api/collection")
+    assert response.status_code == 200
+    assert transport.calls == 3
+    assert api.UPSTREAM_HEALTH.state == upstream.CircuitBreaker.CLOSED
+
+def test_slow_answers_are_not_retried(client, api, fake, monkeypatch):
+    transport = _unreachable(
+        fake, api, monkeypatch, failures=1, error=httpx.ReadTimeout
+    )
+    response = client.get("/api/_db/otter/_api/collection")
+    assert response.status_code == 500
+    assert transport.calls == 1
+    assert api.UPSTREAM_HEALTH.failures == 0
+
+def test_open_circuit_fails_fast(client, api, fake, monkeypatch):
+    transport = _unreachable(fake, api, monkeypatch, failures=100)
+    monkeypatch.setattr(api, "UPSTREAM_HEALTH", upstream.CircuitBreaker(3, 10))
+    assert client.get("/api/_db/otter/_api/collection").status_code == 500
+
+    response = client.get("/api/_db/otter/_api/collection")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "10"
+    assert transport.calls == 3
+
+def _guarded(api, monkeypatch, max_cost):
+    monkeypatch.setattr(api, "API_AQL_GUARD", True)
+    monkeypatch.setattr(api, "API_AQL_MAX_COST", max_cost)
+    monkeypatch.setattr(api, "API_AQL_MAX_ITEMS", 0)
+
+def test_expensive_queries_are_rejected(client, api, fake, monkeypatch):
+    _guarded(api, monkeypatch, max_cost=100)
+    query = {"query": "FOR t IN transients RETURN t"}
+    response = client.post(CURSOR, json=query)
+    assert response.status_code == 400
+    assert response.json()["errorNum"] == 32
+
+    # the verdict is remembered
+    calls = fake.requests
+    assert client.post(CURSOR, json=query).status_code == 400
+    assert fake.requests == calls
+
+    query = {"query": "FOR t IN transients LIMIT 10 RETURN t"}
+    assert client.post(CURSOR, json=query).status_code == 201
+
+class _Recording(httpx.ASGITransport):
+    def __init__(self, app):
+        super().__init__(app=app)
+        self.bodies = []
+
+    async def handle_async_request(self, request):
+        self.bodies.append(json.loads(await request.aread() or b"null"))
+        return await super().handle_async_request(request)
+
+def test_guarded_queries_get_limits(client, api, fake, monkeypatch):
+    _guarded(api, monkeypatch, max_cost=0)
+    monkeypatch.setattr(api, "API_AQL_MAX_RUNTIME", 60)
+    monkeypatch.setattr(api, "API_AQL_MEMORY_LIMIT", 1000)
+    transport = _Recording(create_app(fake))
+    monkeypatch.setattr(upstream, "_client", None)
+    upstream.start_client(transport=transport)
+
+    response = client.post(
+        CURSOR,
+        json={
+            "query": "FOR t IN transients LIMIT 1 RETURN t",
+            "options": {"maxRuntime": 5}
+        }
+    )
+    assert response.status_code == 201
+    sent = transport.bodies[-1]
+    assert (sent["options"]["maxRuntime"], sent["memoryLimit"]) == (5, 1000)
+
+    response = client.post(
+        CURSOR,
+        json={"query": "FOR t IN transients RETURN t", "options": {"maxRuntime": "x"}}
+    )
+    assert response.status_code == 400
+    assert "maxRuntime" in response.json()["errorMessage"]
+
+EXPORT = "/api/_db/otter/export"
+
+def test_exports_are_streamed_as_ndjson(client, fake):
+    calls = fake.requests
+    response = client.get(f"{EXPORT}?batchSize=100")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    docs = [json.loads(line) for line in response.text.splitlines()]
+    assert len({doc["_key"] for doc in docs}) == 300
+    assert fake.requests == calls + 3
+    assert fake.cursors == {}
+
+def test_exports_are_compressed_for_the_client(client, api, monkeypatch):
+    monkeypatch.setattr(api, "API_COMPRESS", True)
+    response = client.get(EXPORT, headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.text.splitlines()) == 300
+
+@pytest.mark.parametrize("query", ["batchSize=0", "minz=high", "drop=1"])
+def test_bad_exports_are_rejected(client, query):
+    response = client.get(f"{EXPORT}?{query}")
+    assert response.status_code == 400
+    assert response.json()["errorMessage"].startswith("Invalid export")
+
+def test_exports_that_fail_part_way_end_with_an_error(client, fake, monkeypatch):
+    monkeypatch.setattr(fake, "next_batch", lambda cursor_id: None)
+    response = client.get(f"{EXPORT}?batchSize=100")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 101
+    assert lines[-1]["error"] is True
@@ -0,0 +1,83 @@
+import time
+import asyncio
+
+import pytest
+
+from otter_web.readahead import CursorReadAhead
+
+class FakeResponse:
+    def __init__(self, content:bytes):
+        self.content = content
+
+def test_client_ids_route_back_to_the_worker():
+    read_ahead = CursorReadAhead("w1", max_bytes=100, max_cursors=1)
+    assert read_ahead.client_id("123") == "123-w1"
+    assert read_ahead.parse("123-w1") == ("w1", "123")
+    assert read_ahead.parse("123") == (None, "123")
+
+def test_open_cursors_are_limited():
+    read_ahead = CursorReadAhead("w1", max_bytes=100, max_cursors=1)
+    assert read_ahead.open("1", "alice")
+    assert not read_ahead.open("2", "alice")
+    assert read_ahead.get("1").identity == "alice"
+    assert read_ahead.get("2") is None
+
+@pytest.mark.anyio
+async def test_batches_are_fetched_ahead():
+    read_ahead = CursorReadAhead("w1", max_bytes=100, max_cursors=10)
+    read_ahead.open("1", "alice")
+    assert read_ahead.take("2") is None
+
+    async def fetch():
+        return FakeResponse(b"x"*10)
+
+    assert read_ahead.fetch_ahead("1", fetch)
+    assert not read_ahead.fetch_ahead("1", fetch) # one batch at a time
+    await asyncio.sleep(0)
+    assert read_ahead.nbytes == 10
+
+    batch = read_ahead.take("1")
+    assert (await batch).content == b"x"*10
+    assert len(read_ahead) == 0
+    assert (read_ahead.hits, read_ahead.misses) == (1, 1)
+
+@pytest.mark.anyio
+async def test_full_buffer_stops_reading_ahead():
+    read_ahead = CursorReadAhead("w1", max_bytes=10, max_cursors=10)
+    read_ahead.open("1", "alice")
+    read_ahead.open("2", "alice")
+
+    async def fetch():
+        return FakeResponse(b"x"*10)
+
+    read_ahead.fetch_ahead("1", fetch)
+    await asyncio.sleep(0)
+    assert not read_ahead.fetch_ahead("2", fetch)
+    assert read_ahead.take("2") is None
+
+@pytest.mark.anyio
+async def test_expired_cursors_are_forgotten(monkeypatch):
+    read_ahead = CursorReadAhead("w1", max_bytes=100, max_cursors=10)
+    read_ahead.open("1", "alice", ttl=10)
+    started = asyncio.Event()
+
+    async def fetch():
+        started.set()
+        await asyncio.sleep(10)
+
+    read_ahead.fetch_ahead("1", fetch)
+    await started.wait()
+    batch = read_ahead.get("1").batch
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    # a batch still on its way keeps the cursor
+    assert read_ahead.get("1") is not None
+
+    read_ahead.close("1")
+    await asyncio.sleep(0)
+    assert batch.cancelled()
+
+    read_ahead.open("2", "alice", ttl=10)
+    monkeypatch.setattr(time, "monotonic", lambda: now + 22)
+    assert read_ahead.get("2") is None
+    assert read_ahead.expired == 1
@@ -0,0 +1,202 @@
+"""
+The search page helpers, run against the ArangoDB stand in over HTTP
+"""
+import asyncio
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+class _Label:
+    def __init__(self):
+        self.texts = []
+
+    def set_text(self, text):
+        self.texts.append(text)
+
+class _Table:
+    def __init__(self):
+        self.rows = None
+
+    def refresh(self, rows):
+        self.rows = rows
+
+@pytest.fixture
+def notes(search_util, monkeypatch):
+    notes = []
+    monkeypatch.setattr(
+        search_util.ui,
+        "notify",
+        lambda message, **kwargs: notes.append((str(message), kwargs.get("type")))
+    )
+    return notes
+
+@pytest.fixture
+def batched(search_util, fake, monkeypatch):
+    # 300 transients fetched 50 at a time, with latency seconds for each call
+    search_util.CATALOG.refresh()
+    monkeypatch.setattr(
+        search_util,
+        "fetch_transients",
+        partial(search_util.fetch_transients, batch_size=50)
+    )
+
+    def latency(seconds):
+        fake.latency = seconds
+    return latency
+
+def _search(search_util, results, status=None, table=None, **filters):
+    return search_util.do_search(
+        SimpleNamespace(search_kwargs=filters),
+        results,
+        table or _Table(),
+        status
+    )
+
+@pytest.mark.anyio
+async def test_search_reports_its_progress(search_util, batched, notes):
+    batched(0.1)
+    results = search_util.SearchResults(results=None)
+    status, table = _Label(), _Table()
+    await _search(search_util, results, status, table)
+
+    assert len(table.rows) == len(results.results) == 300
+    assert results.filters == {}
+    assert any(
+        text.startswith("Searching...") and text.endswith("of 300 transients")
+        for text in status.texts
+    )
+    assert status.texts[-1].startswith("Found 300 transients in")
+    assert ("Search Completed!", None) in notes
+
+@pytest.mark.anyio
+async def test_searches_past_the_deadline_show_what_they_found(
+        search_util, batched, notes, monkeypatch
+):
+    batched(0.2)
+    monkeypatch.setattr(search_util, "SEARCH_TIMEOUT", 0.5)
+    results = search_util.SearchResults(results=None)
+    status = _Label()
+    await _search(search_util, results, status)
+
+    assert 0 < len(results.results) < 300
+    assert status.texts[-1].startswith("Search timed out after")
+    assert status.texts[-1].endswith(
+        f"showing the first {len(results.results)} of 300 results"
+    )
+    assert notes[-1][1] == "warning"
+
+@pytest.mark.anyio
+async def test_a_new_search_cancels_the_last_one(search_util, batched, fake, notes):
+    batched(0.1)
+    results = search_util.SearchResults(results=None)
+    calls = fake.requests
+    first = asyncio.ensure_future(_search(search_util, results))
+    await asyncio.sleep(0.15)
+    await _search(search_util, results)
+
+    assert first.cancelled()
+    assert len(results.results) == 300
+    # the first search stopped after the batch it was fetching, instead of
+    # fetching all six
+    await asyncio.sleep(0.2)
+    assert fake.requests - calls < 12
+
+@pytest.mark.anyio
+async def test_searches_need_the_whole_position(search_util, notes):
+    results = search_util.SearchResults(results=None)
+    await _search(search_util, results, ra="10:00:00")
+    assert notes[-1][0].startswith("If RA or Dec is provided")
+    assert results.results is None
+
+@pytest.fixture
+def sent(arango_server):
+    # the bodies of the cursors created, as ArangoDB got them
+    import json
+
+    sent = []
+    served = arango_server.app
+
+    async def recording(scope, receive, send):
+        if scope["method"] == "POST" and scope["path"].endswith("/_api/cursor"):
+            body = b""
+            while True:
+                message = await receive()
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            sent.append(json.loads(body))
+
+            async def replay():
+                return {"type": "http.request", "body": body, "more_body": False}
+            await served(scope, replay, send)
+        else:
+            await served(scope, receive, send)
+
+    arango_server.app = recording
+    return sent
+
+def _pager(search_util, query="FOR t IN transients RETURN t", batch_size=20):
+    return search_util.AQLPager(query, batch_size=batch_size)
+
+def test_pager_reads_a_batch_at_a_time(search_util, fake):
+    pager = _pager(search_util)
+    assert len(pager.start()) == 20
+    calls = fake.requests
+    assert len(pager.more()) == 40
+    assert len(pager.more()) == 60
+    assert fake.requests == calls + 2
+    assert pager.has_more and not pager.done
+
+def test_pager_stops_at_the_end(search_util, fake):
+    pager = _pager(search_util, "FOR t IN transients LIMIT 50 RETURN t")
+    pager.start()
+    pager.more()
+    assert len(pager.more()) == 50
+    assert not pager.has_more and not pager.truncated
+    calls = fake.requests
+    assert len(pager.more()) == 50
+    assert fake.requests == calls
+    assert not fake.cursors
+
+def test_pager_stops_at_the_interactive_limit(search_util, fake, monkeypatch):
+    monkeypatch.setattr(search_util, "API_AQL_INTERACTIVE_LIMIT", 30)
+    pager = _pager(search_util)
+    pager.start()
+    assert len(pager.more()) == 30
+    assert pager.truncated and not pager.has_more
+    assert not fake.cursors # deleted, so ArangoDB stops running the query
+
+def test_guarded_queries_get_a_limit(search_util, sent, monkeypatch):
+    monkeypatch.setattr(search_util, "API_AQL_GUARD", True)
+    monkeypatch.setattr(search_util, "API_AQL_MAX_COST", 0)
+    monkeypatch.setattr(search_util, "API_AQL_MAX_ITEMS", 0)
+    monkeypatch.setattr(search_util, "API_AQL_INTERACTIVE_LIMIT", 30)
+    pager = _pager(search_util)
+    pager.start()
+    assert len(pager.more()) == 30
+
+    assert "LIMIT 30" in sent[-1]["query"]
+    assert sent[-1]["options"]["stream"] is True
+    assert sent[-1]["options"]["maxRuntime"] > 0
+    assert sent[-1]["memoryLimit"] > 0
+
+def test_expensive_queries_are_rejected(search_util, fake, sent, monkeypatch):
+    monkeypatch.setattr(search_util, "API_AQL_GUARD", True)
+    monkeypatch.setattr(search_util, "API_AQL_MAX_COST", 10)
+    pager = _pager(search_util)
+    with pytest.raises(search_util.QueryRejected, match="estimated to cost"):
+        pager.start()
+    assert sent == []
+    assert pager.rows == []
+
+def test_pager_is_done_once_its_cursor_is_gone(search_util, fake):
+    from pyArango.theExceptions import CursorError
+
+    pager = _pager(search_util)
+    pager.start()
+    fake.cursors.clear() # e.g. it expired while the rows were being looked at
+    with pytest.raises(CursorError, match="cursor not found"):
+        pager.more()
+    assert pager.done and not pager.has_more
+    assert len(pager.rows) == 20
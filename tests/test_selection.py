@@ -0,0 +1,66 @@
+import pytest
+from astropy.coordinates import SkyCoord
+
+from otter_web.aql import is_read_only
+from otter_web.selection import parse_filters, transient_query
+
+def test_parse_filters():
+    filters = parse_filters([
+        ("names", "2018hyz"),
+        ("names", "AT2018hyz"),
+        ("minz", "0.1"),
+        ("hasphot", "true"),
+        ("hasspec", "0")
+    ])
+    assert filters == {
+        "names": ["2018hyz", "AT2018hyz"],
+        "minz": 0.1,
+        "hasphot": True,
+        "hasspec": False
+    }
+    # only the list filters collect repeats
+    assert parse_filters([("minz", "0.1"), ("minz", "0.2")]) == {"minz": 0.2}
+
+@pytest.mark.parametrize("params", [
+    [("drop", "transients")],
+    [("minz", "high")],
+    [("hasphot", "maybe")]
+])
+def test_bad_filters_are_rejected(params):
+    with pytest.raises(ValueError):
+        parse_filters(params)
+
+def test_no_filters_selects_everything():
+    query, bind_vars = transient_query()
+    assert bind_vars == {}
+    assert " ".join(query.split()) == "FOR transient IN transients RETURN transient"
+
+def test_values_are_bound_not_inlined():
+    names = '" RETURN 1 //'
+    query, bind_vars = transient_query(
+        names=names,
+        classification="TDE",
+        minz=0.1,
+        refs="2020ApJ",
+        returns="transient._key"
+    )
+    assert names not in query and "TDE" not in query
+    assert bind_vars["name"] == f"%{names}%"
+    assert bind_vars["classification"] == "%TDE%"
+    assert bind_vars["refs"] == ["2020ApJ"]
+    assert bind_vars["minz"] == 0.1
+    assert query.rstrip().endswith("RETURN transient._key")
+    assert is_read_only(query)
+
+def test_cone_searches_take_either_form_of_position():
+    coords = SkyCoord(150, -30, unit="deg")
+    _, from_coords = transient_query(coords=coords, radius=36)
+    _, from_strings = transient_query(ra="10h00m00s", dec="-30", ra_unit="hourangle")
+    assert from_coords == {"ra": 150, "dec": -30, "sep": 0.01}
+    assert from_strings["ra"] == pytest.approx(150)
+
+def test_wave_det_must_be_known():
+    with pytest.raises(ValueError):
+        transient_query(has_det=True, wave_det="gamma")
+    _, bind_vars = transient_query(has_det=True, wave_det="radio")
+    assert bind_vars == {"wave_det": "radio"}
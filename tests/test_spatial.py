@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from otter_web import spatial
+from otter_web.spatial import SkyIndex, ra_half_width, unit_vectors
+
+def _brute_force(ids, ra, dec, centre_ra, centre_dec, radius):
+    centre = unit_vectors(np.array([centre_ra]), np.array([centre_dec]))[:, 0]
+    inside = centre @ unit_vectors(ra, dec) >= np.cos(np.radians(radius/3600))
+    return sorted(ids[inside].tolist())
+
+@pytest.fixture
+def sky():
+    rng = np.random.default_rng(0)
+    n = 5000
+    ra = rng.uniform(0, 360, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    # crowd some around the poles and where the right ascension wraps
+    ra[:200] = rng.uniform(-0.5, 0.5, 200) % 360
+    dec[200:400] = rng.uniform(89, 90, 200)
+    ids = np.array([f"t{i}" for i in range(n)])
+    return ids, ra, dec
+
+@pytest.mark.parametrize("centre_ra, centre_dec, radius", [
+    (0, 0, 3600),
+    (359.9, 10, 1800),
+    (120, 89.9, 3600),
+    (200, -30, 36000),
+    (45, 45, 1)
+])
+def test_cones_match_brute_force(sky, centre_ra, centre_dec, radius):
+    ids, ra, dec = sky
+    index = SkyIndex(ids, ra, dec)
+    found = index.query(centre_ra, centre_dec, radius)
+    expected = _brute_force(ids, ra, dec, centre_ra, centre_dec, radius)
+    assert sorted(found.tolist()) == expected
+
+def test_exact_positions_are_found(sky):
+    ids, ra, dec = sky
+    index = SkyIndex(ids, ra, dec)
+    for i in range(0, 5000, 250):
+        assert ids[i] in index.query(ra[i], dec[i], 0.5).tolist()
+
+def test_missing_positions_are_never_found():
+    index = SkyIndex(["a", "b"], [10, np.nan], [10, 10])
+    assert index.query(10, 10, 3600*180).tolist() == ["a"]
+
+def test_added_positions_move_and_merge(monkeypatch):
+    index = SkyIndex(["a", "b"], [10, 20], [10, 20])
+    index.add(["a", "c"], [30, 40], [30, 40])
+    assert index.query(10, 10, 1).tolist() == []
+    assert index.query(30, 30, 1).tolist() == ["a"]
+    assert index.query(40, 40, 1).tolist() == ["c"]
+    assert index.query(20, 20, 1).tolist() == ["b"]
+
+    monkeypatch.setattr(spatial, "MAX_PENDING", 2)
+    index.add(["d"], [50], [50])
+    assert index._pending == {}
+    assert sorted(index.query(30, 30, 3600*40).tolist()) == ["a", "b", "c", "d"]
+    assert index.query(10, 10, 1).tolist() == []
+
+def test_crossmatch():
+    index = SkyIndex(["a", "b"], [10, 20], [10, 20])
+    matches = index.crossmatch([10, 20, 30], [10, 20, 30], 5)
+    assert [m.tolist() for m in matches] == [["a"], ["b"], []]
+
+def test_ra_half_width():
+    assert ra_half_width(0, 1) == pytest.approx(1)
+    assert ra_half_width(60, 1) == pytest.approx(2, rel=1e-3)
+    assert ra_half_width(89.5, 1) == 180
@@ -0,0 +1,159 @@
+import datetime
+
+import numpy as np
+import pytest
+from astropy.coordinates import Angle, SkyCoord
+
+from otter_web.tables import (
+    NO_DATE,
+    UNKNOWN_CLASS,
+    ResultIndex,
+    coordinate_strings,
+    discovery_dates,
+    discovery_jds,
+    sexagesimal,
+    transient_rows
+)
+
+def test_sexagesimal_matches_astropy():
+    values = np.array([0, 1.5, -0.25, 12.999999999, 23.9999999, -89.12345])
+    expected = [
+        Angle(v, unit="hourangle").to_string(sep=":", pad=True, precision=2)
+        for v in values
+    ]
+    assert sexagesimal(values) == expected
+    assert sexagesimal(np.array([1.5, -1.5]), always_sign=True) == [
+        "+01:30:00.00", "-01:30:00.00"
+    ]
+    assert sexagesimal(np.array([-0.0])) == ["-00:00:00.00"]
+
+def test_coordinate_strings():
+    coordinates = [
+        {"ra": 150, "dec": -30, "ra_units": "deg", "dec_units": "deg"},
+        {"ra": "10:00:00", "dec": "-30:00:00", "ra_units": "hour", "dec_units": "deg"},
+        {"ra": "bad", "dec": 1, "ra_units": "deg", "dec_units": "deg"},
+        None,
+        {"ra": 1}
+    ]
+    ra, dec = coordinate_strings(coordinates)
+    assert ra[:2] == ["10:00:00.00"]*2
+    assert dec[:2] == ["-30:00:00.00"]*2
+    assert ra[2:] == dec[2:] == ["", "", ""]
+
+def test_discovery_dates():
+    dates = [
+        {"value": 58000, "date_format": "mjd"},
+        {"value": "2020-01-01T00:00:00", "date_format": "isot"},
+        {"value": "nonsense", "date_format": "isot"},
+        {"value": 58001},
+        None
+    ]
+    parsed = discovery_dates(dates)
+    assert parsed[0] == datetime.datetime(2017, 9, 4)
+    assert parsed[1] == datetime.datetime(2020, 1, 1)
+    assert parsed[2:] == [NO_DATE, datetime.datetime(2017, 9, 5), NO_DATE]
+
+def _event(name, object_class=None, ra=150, date=58000):
+    event = {
+        "name": {"default_name": name},
+        "coordinate": [{"ra": ra, "dec": 10, "ra_units": "deg", "dec_units": "deg"}],
+        "date_reference": [
+            {"value": 1, "date_format": "mjd", "date_type": "publication"},
+            {"value": date, "date_format": "mjd", "date_type": "discovery"}
+        ]
+    }
+    if object_class is not None:
+        event["classification"] = {"value": [
+            {"object_class": "SN", "default": False},
+            {"object_class": object_class, "default": True}
+        ]}
+    return event
+
+def test_transient_rows():
+    rows = transient_rows([_event("a", "TDE"), _event("b"), {}], ids=[5, 6, 7])
+    assert rows[0] == {
+        "id": "5",
+        "name": "a",
+        "class": "TDE",
+        "ra": "10:00:00.00",
+        "dec": "+10:00:00.00",
+        "date": datetime.datetime(2017, 9, 4)
+    }
+    assert rows[1]["class"] == UNKNOWN_CLASS
+    assert rows[2] == {
+        "id": "7",
+        "name": "Missing Default Name",
+        "class": UNKNOWN_CLASS,
+        "ra": "",
+        "dec": "",
+        "date": NO_DATE
+    }
+
+def test_transient_rows_match_otter():
+    otter = pytest.importorskip("otter")
+    from otter_web.bench.fake_arango import synthetic_transients
+
+    events = list(synthetic_transients(20))
+    rows = transient_rows(events)
+    for event, row in zip(events, rows):
+        transient = otter.Transient(event)
+        coordinate = event["coordinate"][0]
+        ra, dec = SkyCoord(
+            coordinate["ra"],
+            coordinate["dec"],
+            unit=(coordinate["ra_units"], coordinate["dec_units"])
+        ).to_string("hmsdms", sep=":", precision=2).split(" ")
+        assert (row["ra"], row["dec"]) == (ra, dec)
+        assert row["name"] == event["name"]["default_name"]
+        try:
+            assert row["class"] == transient.get_classification()[0]
+        except KeyError:
+            assert row["class"] == UNKNOWN_CLASS
+        try:
+            assert row["date"] == transient.get_discovery_date().datetime
+        except (KeyError, TypeError):
+            assert row["date"] == NO_DATE
+
+def test_discovery_jds_sort_like_the_dates():
+    dates = [
+        {"value": 58000, "date_format": "mjd"},
+        {"value": "2020-01-01T00:00:00", "date_format": "isot"},
+        {"value": "nonsense", "date_format": "isot"},
+        None
+    ]
+    jds = discovery_jds(dates)
+    assert jds[0] == pytest.approx(58000 + 2400000.5)
+    assert jds[1] == pytest.approx(2458849.5)
+    assert jds[2] == jds[3] == -np.inf
+
+def test_result_index_pages():
+    events = [_event(f"t{i}", date=58000 + i) for i in range(25)]
+    index = ResultIndex(events)
+    assert len(index) == 25
+
+    page = index.page(2, 10)
+    assert [row["id"] for row in page] == [str(i) for i in range(10, 20)]
+    assert [row["name"] for row in page] == [f"t{i}" for i in range(10, 20)]
+    assert len(index.page(3, 10)) == 5
+    assert len(index.page(1, 0)) == 25
+    assert index.page(0, 10) == index.page(1, 10)
+
+def test_result_index_sorts():
+    events = [
+        _event("b", "TDE", date=58002),
+        _event("c", date=58000),
+        _event("a", "SN Ia", date=58001),
+        {"name": {"default_name": "d"}}
+    ]
+    index = ResultIndex(events)
+    assert [row["name"] for row in index.page(1, 10, sort_by="name")] == [
+        "a", "b", "c", "d"
+    ]
+    by_date = index.page(1, 10, sort_by="date", descending=True)
+    assert [row["name"] for row in by_date] == ["b", "a", "c", "d"]
+    assert [row["class"] for row in index.page(1, 2, sort_by="class")] == [
+        "SN Ia", "TDE"
+    ]
+    # unknown columns keep the order the results came in
+    assert index.order("ra").tolist() == [0, 1, 2, 3]
+    assert index.page(1, 1, sort_by="name", descending=True)[0]["id"] == "3"
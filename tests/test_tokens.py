@@ -0,0 +1,84 @@
+import json
+import time
+
+from otter_web.bench.fake_arango import make_jwt
+from otter_web.tokens import TokenCache, jwt_expiry
+
+CREDENTIALS = {"username": "user", "password": "secret"}
+
+def _login(cache, lifetime=3600):
+    key = cache.key(CREDENTIALS)
+    content = json.dumps({"jwt": make_jwt("user", lifetime=lifetime)}).encode()
+    token = cache.put(key, json.dumps(CREDENTIALS).encode(), content)
+    return key, token
+
+def test_jwt_expiry():
+    assert abs(jwt_expiry(make_jwt("user", lifetime=60)) - time.time() - 60) <= 1
+    assert jwt_expiry("not a token") is None
+    assert jwt_expiry("a.b.c") is None
+
+def test_only_password_logins_have_a_key():
+    cache = TokenCache(margin=300, max_age=3600)
+    assert cache.key(CREDENTIALS) == cache.key(dict(CREDENTIALS))
+    assert cache.key(CREDENTIALS) != cache.key({"username": "user", "password": "x"})
+    assert "secret" not in cache.key(CREDENTIALS)
+    assert cache.key({"username": "user"}) is None
+    assert cache.key(["user", "secret"]) is None
+
+def test_logins_are_reused_until_near_expiry():
+    cache = TokenCache(margin=300, max_age=3600)
+    key, token = _login(cache)
+    assert cache.get(key).token == token
+    assert cache.issued(token) == key
+    assert cache.issued(make_jwt("someone")) is None
+
+    key, token = _login(cache, lifetime=100)
+    assert cache.get(key) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_responses_without_a_token_are_not_kept():
+    cache = TokenCache(margin=300, max_age=3600)
+    key = cache.key(CREDENTIALS)
+    assert cache.put(key, b"", b'{"error": true}') is None
+    assert cache.put(key, b"", b'{"jwt": "not a token"}') is None
+    assert len(cache) == 0
+
+def test_tokens_near_expiry_are_stale():
+    cache = TokenCache(margin=300, max_age=3600)
+    _, fresh = _login(cache)
+    assert cache.stale(fresh) is None
+
+    key, token = _login(cache, lifetime=100)
+    assert cache.stale(token) == (key, json.dumps(CREDENTIALS).encode())
+    assert cache.stale(make_jwt("someone", lifetime=100)) is None
+
+def test_expired_tokens_are_not_refreshed():
+    cache = TokenCache(margin=300, max_age=3600)
+    _, token = _login(cache, lifetime=-1)
+    assert cache.stale(token) is None
+    assert cache.issued(token) is None
+
+def test_credentials_are_forgotten_after_max_age(monkeypatch):
+    cache = TokenCache(margin=300, max_age=60)
+    _, token = _login(cache, lifetime=100)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.stale(token) is None
+
+def test_refreshes_keep_the_login_time():
+    cache = TokenCache(margin=300, max_age=3600)
+    key, _ = _login(cache, lifetime=100)
+    created = cache._logins[key].created
+    content = json.dumps({"jwt": make_jwt("user")}).encode()
+    cache.put(key, b"", content, refresh=True)
+    assert cache._logins[key].created == created
+    assert cache.refreshes == 1
+
+def test_oldest_logins_are_dropped():
+    cache = TokenCache(margin=300, max_age=3600, max_entries=1)
+    first = cache.key(CREDENTIALS)
+    _login(cache)
+    other = cache.key({"username": "other", "password": "x"})
+    cache.put(other, b"", json.dumps({"jwt": make_jwt("other")}).encode())
+    assert len(cache) == 1
+    assert cache.get(first) is None and cache.get(other) is not None
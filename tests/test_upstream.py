@@ -0,0 +1,224 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from otter_web import upstream
+
+def _transport():
+    return httpx.MockTransport(lambda request: httpx.Response(200, json={"ok": True}))
+
+def test_start_client_reuses_the_open_pool(monkeypatch):
+    monkeypatch.setattr(upstream, "_client", None)
+    client = upstream.start_client(transport=_transport())
+    assert upstream.start_client() is client
+    assert upstream.get_client() is client
+
+@pytest.mark.anyio
+async def test_close_client(monkeypatch):
+    monkeypatch.setattr(upstream, "_client", None)
+    client = upstream.start_client(transport=_transport())
+    response = await client.get("http://arangodb/_api/version")
+    assert response.json() == {"ok": True}
+
+    await upstream.close_client()
+    assert client.is_closed
+    assert upstream._client is None
+    await upstream.close_client() # closing twice is fine
+
+@pytest.mark.anyio
+async def test_single_flight_runs_identical_calls_once():
+    flight = upstream.SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    results = await asyncio.gather(*(flight.do("key", fn) for _ in range(5)))
+    assert results == ["result"]*5
+    assert len(calls) == 1
+    assert (flight.leaders, flight.coalesced) == (1, 4)
+    assert len(flight) == 0
+
+@pytest.mark.anyio
+async def test_single_flight_results_that_can_not_be_shared():
+    flight = upstream.SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        n = len(calls)
+        await asyncio.sleep(0.01)
+        return n
+
+    results = await asyncio.gather(
+        *(flight.do("key", fn, share=lambda result: False) for _ in range(3))
+    )
+    assert sorted(results) == [1, 2, 3]
+
+@pytest.mark.anyio
+async def test_single_flight_errors_reach_every_waiter():
+    flight = upstream.SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        *(flight.do("key", fn) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+@pytest.mark.anyio
+async def test_single_flight_survives_the_leader_going_away():
+    flight = upstream.SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    leader = asyncio.ensure_future(flight.do("key", fn))
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(flight.do("key", fn))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await waiter == "result"
+
+@pytest.mark.anyio
+async def test_single_flight_discards_unshared_results_nobody_took():
+    flight = upstream.SingleFlight()
+    discarded = []
+
+    async def fn():
+        await asyncio.sleep(0.01)
+        return "response"
+
+    async def discard(result):
+        discarded.append(result)
+
+    call = asyncio.ensure_future(
+        flight.do("key", fn, share=lambda result: False, discard=discard)
+    )
+    await asyncio.sleep(0)
+    call.cancel()
+    await asyncio.sleep(0.05)
+    assert discarded == ["response"]
+
+def test_circuit_opens_after_failures_in_a_row(monkeypatch):
+    breaker = upstream.CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    assert breaker.allow() is False
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == breaker.CLOSED
+    breaker.record_failure()
+    assert (breaker.state, breaker.trips) == (breaker.OPEN, 1)
+
+    with pytest.raises(upstream.CircuitOpen) as e:
+        breaker.allow()
+    assert e.value.retry_after == 10
+    assert breaker.rejected == 1
+
+    # after reset_timeout one probe is let through at a time
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert breaker.allow() is True
+    with pytest.raises(upstream.CircuitOpen):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == breaker.CLOSED
+
+def test_failed_probes_open_the_circuit_again(monkeypatch):
+    breaker = upstream.CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    assert breaker.trips == 1
+
+def test_released_probes_let_another_through(monkeypatch):
+    breaker = upstream.CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    breaker.release(breaker.allow())
+    assert breaker.allow() is True
+
+def test_a_threshold_of_zero_turns_the_breaker_off():
+    breaker = upstream.CircuitBreaker(failure_threshold=0, reset_timeout=10)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.allow() is False
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(upstream, "API_RETRY_BACKOFF", 0.1)
+    monkeypatch.setattr(upstream, "API_RETRY_BACKOFF_MAX", 1)
+    assert all(0 <= upstream.backoff(0) <= 0.1 for _ in range(100))
+    assert all(0 <= upstream.backoff(10) <= 1 for _ in range(100))
+
+@pytest.fixture
+def health(monkeypatch):
+    breaker = upstream.CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    monkeypatch.setattr(upstream, "UPSTREAM_HEALTH", breaker)
+    monkeypatch.setattr(upstream, "API_RETRIES", 2)
+    monkeypatch.setattr(upstream, "backoff", lambda attempt: 0)
+    return breaker
+
+def _failing(failures, error=requests.ConnectionError):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise error("down")
+        return "result"
+
+    return fn, calls
+
+def test_call_upstream_retries_connection_errors(health):
+    fn, calls = _failing(2)
+    assert upstream.call_upstream(fn) == "result"
+    assert len(calls) == 3
+    assert health.state == health.CLOSED
+
+def test_call_upstream_does_not_retry_other_calls(health):
+    fn, calls = _failing(1)
+    with pytest.raises(requests.ConnectionError):
+        upstream.call_upstream(fn, idempotent=False)
+    assert len(calls) == 1
+
+    fn, calls = _failing(1, error=KeyError)
+    with pytest.raises(KeyError):
+        upstream.call_upstream(fn)
+    assert len(calls) == 1
+    assert health.failures == 0 # the database answered
+
+def test_call_upstream_does_not_retry_timeouts(health):
+    fn, calls = _failing(1, error=requests.ReadTimeout)
+    with pytest.raises(requests.ReadTimeout):
+        upstream.call_upstream(fn)
+    assert len(calls) == 1
+    assert health.failures == 0 # a slow query, not a database that is down
+
+def test_only_connection_failures_count():
+    request = httpx.Request("GET", "http://arangodb")
+    assert upstream.is_connection_error(httpx.ConnectError("", request=request))
+    assert upstream.is_connection_error(httpx.ConnectTimeout("", request=request))
+    assert upstream.is_connection_error(requests.ConnectTimeout())
+    assert not upstream.is_connection_error(httpx.ReadTimeout("", request=request))
+    assert not upstream.is_connection_error(requests.ReadTimeout())
+
+def test_call_upstream_fails_fast_while_the_circuit_is_open(health):
+    fn, calls = _failing(10)
+    with pytest.raises(requests.ConnectionError):
+        upstream.call_upstream(fn)
+    assert health.state == health.OPEN
+    with pytest.raises(upstream.CircuitOpen):
+        upstream.call_upstream(fn)
+    assert len(calls) == 3
@@ -0,0 +1,66 @@
+import io
+import zipfile
+
+from otter_web.zipstream import ZipStream
+
+def _read(archive:bytes) -> dict:
+    with zipfile.ZipFile(io.BytesIO(archive)) as z:
+        assert z.testzip() is None
+        return {info.filename: z.read(info) for info in z.infolist()}
+
+def test_files_are_sent_as_they_are_added():
+    stream = ZipStream()
+    parts = [
+        stream.add("a.json", b'{"a": 1}'),
+        stream.add("b.csv", b"x,y\n1,2\n"*100)
+    ]
+    assert all(parts)
+    parts.append(stream.close())
+    assert _read(b"".join(parts)) == {
+        "a.json": b'{"a": 1}',
+        "b.csv": b"x,y\n1,2\n"*100
+    }
+
+def test_names_are_made_unique_and_flat():
+    stream = ZipStream()
+    archive = b"".join([
+        stream.add("2018hyz.json", b"1"),
+        stream.add("2018hyz.json", b"2"),
+        stream.add("2018hyz.json", b"3"),
+        stream.add("a/b.json", b"4"),
+        stream.add("README", b"5"),
+        stream.add("README", b"6"),
+        stream.add("", b"7"),
+        stream.close()
+    ])
+    assert _read(archive) == {
+        "2018hyz.json": b"1",
+        "2018hyz (2).json": b"2",
+        "2018hyz (3).json": b"3",
+        "a_b.json": b"4",
+        "README": b"5",
+        "README (2)": b"6",
+        "unnamed": b"7"
+    }
+
+def test_files_written_a_piece_at_a_time():
+    stream = ZipStream()
+    parts = [stream.write("table.csv", b"header\n")]
+    parts += [stream.write("table.csv", f"{i}\n".encode()) for i in range(1000)]
+    parts.append(stream.add("notes.txt", b"notes"))
+    parts.append(stream.write("table.csv", b"again"))
+    parts.append(stream.close())
+
+    files = _read(b"".join(parts))
+    rows = b"".join(f"{i}\n".encode() for i in range(1000))
+    assert files == {
+        "table.csv": b"header\n" + rows,
+        "notes.txt": b"notes",
+        "table (2).csv": b"again"
+    }
+
+def test_nothing_is_held_on_to():
+    stream = ZipStream(compression=zipfile.ZIP_STORED)
+    sent = sum(len(stream.write("big.bin", b"x"*100_000)) for _ in range(10))
+    assert sent >= 1_000_000
+    assert stream._sink.take() == b""